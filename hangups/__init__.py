@@ -5,7 +5,9 @@
 from .version import __version__
 from .client import Client
 from .user import UserList
-from .conversation import ConversationList, build_user_conversation_list
+from .conversation import (
+    ConversationList, EventRetentionPolicy, build_user_conversation_list
+)
 from .auth import (
     get_auth, get_auth_stdin, GoogleAuthError, CredentialsPrompt,
     RefreshTokenCache
@@ -4,19 +4,29 @@ import asyncio
 import base64
 import binascii
 import collections
+import contextlib
+import hashlib
 import json
 import logging
 import os
 import random
+import stat
+import tempfile
 import time
 
 import google.protobuf.message
 
-from hangups import (exceptions, http_utils, channel, event, hangouts_pb2,
-                     pblite, version)
+from hangups import (compat, exceptions, http_utils, channel, event,
+                     hangouts_pb2, outbox, pblite, version)
 
 logger = logging.getLogger(__name__)
 IMAGE_UPLOAD_URL = 'https://docs.google.com/upload/photos/resumable'
+# Size of the chunks image data is read and sent in:
+IMAGE_UPLOAD_CHUNK_SIZE = 256 * 1024
+# Maximum number of times to resume an interrupted image upload:
+MAX_IMAGE_UPLOAD_RESUMES = 3
+# Default maximum number of concurrent uploads for Client.upload_images:
+IMAGE_UPLOAD_CONCURRENCY = 4
 # Timeout to send for setactiveclient requests:
 ACTIVE_TIMEOUT_SECS = 120
 # Minimum timeout between subsequent setactiveclient requests:
@@ -42,9 +52,13 @@ class Client:
             of seconds to wait prior to each retry:
             retry_backoff_base^(# of retries attempted thus far)
             Defaults to 2.
+        outbox_path (str): (optional) Path of the file to persist messages
+            queued by :meth:`queue_chat_message` to, so they are sent after a
+            restart. By default, queued messages are only kept in memory.
     """
 
-    def __init__(self, cookies, max_retries=5, retry_backoff_base=2):
+    def __init__(self, cookies, max_retries=5, retry_backoff_base=2,
+                 outbox_path=None):
         self._max_retries = max_retries
         self._retry_backoff_base = retry_backoff_base
 
@@ -72,6 +86,44 @@ class Client:
             state_update: A ``StateUpdate`` message.
         """
 
+        self.on_batch_update = event.Event('Client.on_batch_update')
+        """
+        :class:`.Event` fired when a batch of updates arrives from the server,
+        after :attr:`on_state_update` is fired for each update.
+
+        Observing this event instead of :attr:`on_state_update` allows related
+        updates to be handled together.
+
+        Args:
+            state_updates: List of ``StateUpdate`` messages.
+        """
+
+        self.on_queued_message_sent = event.Event(
+            'Client.on_queued_message_sent'
+        )
+        """
+        :class:`.Event` fired when a message queued by
+        :meth:`queue_chat_message` is sent, including messages queued before
+        a restart.
+
+        Args:
+            request: The ``SendChatMessageRequest`` that was sent.
+            response: The ``SendChatMessageResponse`` for the message.
+        """
+
+        self.on_queued_message_dropped = event.Event(
+            'Client.on_queued_message_dropped'
+        )
+        """
+        :class:`.Event` fired when a message queued by
+        :meth:`queue_chat_message` is dropped after too many failed attempts,
+        including messages queued before a restart.
+
+        Args:
+            request: The ``SendChatMessageRequest`` that was dropped.
+            error: The :class:`.NetworkError` of the last attempt.
+        """
+
         # http_utils.Session instance (populated by .connect()):
         self._session = None
 
@@ -109,6 +161,21 @@ class Client:
         # ActiveClientState enum int value or None:
         self._active_client_state = None
 
+        # Messages queued by queue_chat_message, sent while connected:
+        self._outbox = outbox.Outbox(
+            self.send_chat_message, outbox_path,
+            retry_backoff_base=retry_backoff_base
+        )
+        self.on_connect.add_observer(self._outbox.resume)
+        self.on_reconnect.add_observer(self._outbox.resume)
+        self.on_disconnect.add_observer(self._outbox.pause)
+        self._outbox.on_message_sent.add_observer(
+            self.on_queued_message_sent.fire
+        )
+        self._outbox.on_message_dropped.add_observer(
+            self.on_queued_message_dropped.fire
+        )
+
     ##########################################################################
     # Public methods
     ##########################################################################
@@ -147,6 +214,8 @@ class Client:
                 'Client.connect returning because Channel.listen returned'
             )
         finally:
+            self._outbox.stop()
+            await self._outbox.flush()
             await self._session.close()
 
     async def disconnect(self):
@@ -180,6 +249,41 @@ class Client:
         """
         return random.randint(0, 2**32)
 
+    async def queue_chat_message(self, send_chat_message_request):
+        """Send a chat message, retrying until it is delivered.
+
+        Unlike :meth:`send_chat_message`, the message is queued while the
+        client is disconnected, and retried after network errors. Messages in
+        the same conversation are sent in the order they were queued.
+
+        The ``client_generated_id`` of the message is set if it is missing, and
+        is kept for every retry so the server can recognize duplicates.
+
+        The message stays queued if this coroutine is cancelled.
+
+        Args:
+            send_chat_message_request: ``SendChatMessageRequest`` to send.
+
+        Returns:
+            ``SendChatMessageResponse`` for the message.
+
+        Raises:
+            NetworkError: If the message could not be sent after
+                :data:`.outbox.MAX_SEND_ATTEMPTS` attempts.
+        """
+        header = send_chat_message_request.event_request_header
+        if not header.client_generated_id:
+            header.client_generated_id = self.get_client_generated_id()
+        return await self._outbox.put(send_chat_message_request)
+
+    def get_outbox_stats(self):
+        """Return statistics about the chat messages waiting to be sent.
+
+        Returns:
+            :class:`.OutboxStats` describing the queued messages.
+        """
+        return self._outbox.get_stats()
+
     async def set_active(self):
         """Set this client as active.
 
@@ -241,14 +345,25 @@ class Client:
                             .format(ACTIVE_TIMEOUT_SECS))
 
     async def upload_image(self, image_file, filename=None, *,
-                           return_uploaded_image=False):
+                           return_uploaded_image=False,
+                           progress_callback=None):
         """Upload an image that can be later attached to a chat message.
 
+        The image is streamed in chunks rather than read into memory. If the
+        transfer is interrupted by a connection error or a server error, it is
+        resumed from the number of bytes the server received.
+
         Args:
-            image_file: A file-like object containing an image.
+            image_file: The image, as a path, a binary file-like object, or an
+                async iterator of :class:`bytes` chunks. Files are read from
+                their current position.
             filename (str): (optional) Custom name for the uploaded file.
+                Required if ``image_file`` is an async iterator without a
+                ``name`` attribute.
             return_uploaded_image (bool): (optional) If True, return
                 :class:`.UploadedImage` instead of image ID. Defaults to False.
+            progress_callback: (optional) Function called with an
+                :class:`.UploadProgress` instance after each chunk is sent.
 
         Raises:
             hangups.NetworkError: If the upload request failed.
@@ -256,41 +371,71 @@ class Client:
         Returns:
             :class:`.UploadedImage` instance, or ID of the uploaded image.
         """
-        image_filename = filename or os.path.basename(image_file.name)
-        image_data = image_file.read()
-
-        # request an upload URL
-        res = await self._base_request(
-            IMAGE_UPLOAD_URL,
-            'application/x-www-form-urlencoded;charset=UTF-8', 'json',
-            json.dumps({
-                "protocolVersion": "0.8",
-                "createSessionRequest": {
-                    "fields": [{
-                        "external": {
-                            "name": "file",
-                            "filename": image_filename,
-                            "put": {},
-                            "size": len(image_data)
-                        }
-                    }]
-                }
-            })
-        )
-
-        try:
-            upload_url = self._get_upload_session_status(res)[
-                'externalFieldTransfers'
-            ][0]['putInfo']['url']
-        except KeyError:
-            raise exceptions.NetworkError(
-                'image upload failed: can not acquire an upload url'
+        with contextlib.ExitStack() as stack:
+            image_file, image_filename, size = await self._open_image(
+                stack, image_file, filename
+            )
+            start = image_file.tell()
+
+            # request an upload URL
+            res = await self._base_request(
+                IMAGE_UPLOAD_URL,
+                'application/x-www-form-urlencoded;charset=UTF-8', 'json',
+                json.dumps({
+                    "protocolVersion": "0.8",
+                    "createSessionRequest": {
+                        "fields": [{
+                            "external": {
+                                "name": "file",
+                                "filename": image_filename,
+                                "put": {},
+                                "size": size
+                            }
+                        }]
+                    }
+                })
             )
 
-        # upload the image data using the upload_url to get the upload info
-        res = await self._base_request(
-            upload_url, 'application/octet-stream', 'json', image_data
-        )
+            try:
+                upload_url = self._get_upload_session_status(res)[
+                    'externalFieldTransfers'
+                ][0]['putInfo']['url']
+            except KeyError:
+                raise exceptions.NetworkError(
+                    'image upload failed: can not acquire an upload url'
+                )
+
+            # upload the image data using the upload_url to get the upload
+            # info, resuming from the server's offset if interrupted
+            progress = _UploadProgressTracker(size, progress_callback)
+            offset = 0
+            for resume_num in range(MAX_IMAGE_UPLOAD_RESUMES + 1):
+                headers = {'content-type': 'application/octet-stream',
+                           'content-length': str(size - offset)}
+                if resume_num > 0:
+                    await asyncio.sleep(self._retry_backoff_base ** resume_num)
+                    offset = await self._get_image_upload_offset(upload_url)
+                    headers.update({
+                        'content-length': str(size - offset),
+                        'X-Goog-Upload-Command': 'upload, finalize',
+                        'X-Goog-Upload-Offset': str(offset),
+                    })
+                progress.start(offset)
+                try:
+                    res = await self._upload_request(
+                        upload_url, headers, _read_image_chunks(
+                            image_file, start, offset, size, progress
+                        )
+                    )
+                except exceptions.NetworkError as e:
+                    if not _is_resumable_upload_error(e):
+                        raise
+                    logger.info('Image upload interrupted: {}'.format(e))
+                    error = e
+                else:
+                    break
+            else:
+                raise error
 
         try:
             raw_info = (
@@ -308,10 +453,134 @@ class Client:
         result = UploadedImage(image_id=image_id, url=url)
         return result if return_uploaded_image else result.image_id
 
+    async def upload_images(self, image_files, *,
+                            concurrency=IMAGE_UPLOAD_CONCURRENCY,
+                            return_exceptions=False):
+        """Upload several images concurrently.
+
+        Images with identical content are only uploaded once, and share the
+        same result.
+
+        Args:
+            image_files: List of images, each as accepted by
+                :meth:`upload_image`. Async iterators must have a ``name``
+                attribute.
+            concurrency (int): (optional) Maximum number of images to upload
+                at the same time. Defaults to ``IMAGE_UPLOAD_CONCURRENCY``.
+            return_exceptions (bool): (optional) If True, return exceptions
+                in place of the results of failed uploads, instead of raising
+                the first one and cancelling the other uploads. Defaults to
+                False.
+
+        Raises:
+            hangups.NetworkError: If an upload request failed.
+
+        Returns:
+            List of :class:`.UploadedImage` instances, in the same order as
+            ``image_files``.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        uploads = {}  # {SHA-256 digest: asyncio.Task of UploadedImage}
+
+        async def upload(image_file):
+            with contextlib.ExitStack() as stack:
+                async with semaphore:
+                    image_file, filename, _ = await self._open_image(
+                        stack, image_file, None
+                    )
+                    digest = await compat.get_running_loop().run_in_executor(
+                        None, _get_image_digest, image_file
+                    )
+                    task = uploads.get(digest)
+                    if task is None:
+                        task = asyncio.ensure_future(self.upload_image(
+                            image_file, filename, return_uploaded_image=True
+                        ))
+                        uploads[digest] = task
+                        return await task
+            # Wait for a duplicate image without using the semaphore.
+            return await asyncio.shield(task)
+
+        tasks = [asyncio.ensure_future(upload(image_file))
+                 for image_file in image_files]
+        try:
+            return await asyncio.gather(*tasks,
+                                        return_exceptions=return_exceptions)
+        finally:
+            for task in tasks:
+                task.cancel()
+
     ##########################################################################
     # Private methods
     ##########################################################################
 
+    @staticmethod
+    async def _open_image(stack, image_file, filename):
+        """Return a binary file of an image to upload, its name and size.
+
+        Files opened or created are closed when stack is closed. Images of
+        unknown size are copied to a temporary file. Files are opened, written
+        and copied in the default executor to avoid blocking the event loop.
+        """
+        loop = compat.get_running_loop()
+        if isinstance(image_file, (str, bytes, os.PathLike)):
+            image_filename = filename or os.path.basename(
+                os.fsdecode(image_file)
+            )
+            image_file = stack.enter_context(
+                await loop.run_in_executor(None, open, image_file, 'rb')
+            )
+        else:
+            image_filename = filename or os.path.basename(
+                getattr(image_file, 'name', '')
+            )
+            if not image_filename:
+                raise ValueError('filename is required for {!r}'
+                                 .format(image_file))
+        if hasattr(image_file, '__aiter__'):
+            chunks = image_file
+            image_file = stack.enter_context(
+                await loop.run_in_executor(None, tempfile.TemporaryFile)
+            )
+            async for chunk in chunks:
+                await loop.run_in_executor(None, image_file.write, chunk)
+            image_file.seek(0)
+        size = _get_remaining_size(image_file)
+        if size is None:
+            temp_file = stack.enter_context(
+                await loop.run_in_executor(None, tempfile.TemporaryFile)
+            )
+            await loop.run_in_executor(None, _copy_image_file, image_file,
+                                       temp_file)
+            image_file = temp_file
+            size = _get_remaining_size(image_file)
+        return image_file, image_filename, size
+
+    async def _get_image_upload_offset(self, upload_url):
+        """Return the number of bytes of an image upload the server received.
+
+        Raises:
+            hangups.NetworkError: If the request failed.
+        """
+        res = await self._upload_request(
+            upload_url, {'X-Goog-Upload-Command': 'query'}
+        )
+        try:
+            return int(res.headers['X-Goog-Upload-Size-Received'])
+        except (KeyError, ValueError):
+            raise exceptions.NetworkError(
+                'image upload failed: can not query the upload offset'
+            )
+
+    async def _upload_request(self, url, headers, data=None):
+        """Send an authenticated upload request, without retrying it."""
+        params = {
+            'alt': 'json',
+            'key': API_KEY,
+        }
+        return await self._session.upload(url, params=params,
+                                          headers=headers, data=data)
+
     @staticmethod
     def _get_upload_session_status(res):
         """Parse the image upload response to obtain status.
@@ -369,7 +638,13 @@ class Client:
                         logger.debug('Received StateUpdate:\n%s', state_update)
                         header = state_update.state_update_header
                         self._active_client_state = header.active_client_state
+                    for state_update in batch_update.state_update:
                         await self.on_state_update.fire(state_update)
+                    # Fire the batch last, so observers of each update (such
+                    # as UserList) have handled the whole batch first.
+                    await self.on_batch_update.fire(
+                        list(batch_update.state_update)
+                    )
                 else:
                     logger.info('Ignoring message: %r', pblite_message[0])
 
@@ -691,3 +966,120 @@ Args:
     image_id (str): Image ID of uploaded image.
     url (str): URL of uploaded image.
 """
+
+UploadProgress = collections.namedtuple(
+    'UploadProgress', ['bytes_sent', 'total_bytes', 'bytes_per_sec']
+)
+"""Progress of an image upload.
+
+Args:
+    bytes_sent (int): Number of bytes sent, including bytes sent before the
+        upload was resumed.
+    total_bytes (int): Size of the image.
+    bytes_per_sec (float): Average throughput since the upload was started or
+        last resumed.
+"""
+
+
+class _UploadProgressTracker:
+    """Reports the progress of an image upload to a callback."""
+
+    def __init__(self, total_bytes, callback):
+        self._total_bytes = total_bytes
+        self._callback = callback  # function or None
+        self._start_offset = 0
+        self._start_time = time.monotonic()
+
+    def start(self, offset):
+        """Start measuring throughput when a transfer starts at offset."""
+        self._start_offset = offset
+        self._start_time = time.monotonic()
+
+    def update(self, bytes_sent):
+        """Report that bytes_sent bytes of the image have been sent."""
+        if self._callback is None:
+            return
+        elapsed = time.monotonic() - self._start_time
+        bytes_per_sec = ((bytes_sent - self._start_offset) / elapsed
+                         if elapsed > 0 else 0.0)
+        self._callback(UploadProgress(bytes_sent, self._total_bytes,
+                                      bytes_per_sec))
+
+
+def _get_remaining_size(image_file):
+    """Return the number of bytes from a file's position to its end.
+
+    Returns None if the size can not be determined without reading the file.
+    """
+    try:
+        stat_result = os.fstat(image_file.fileno())
+    except (AttributeError, OSError):
+        pass
+    else:
+        if stat.S_ISREG(stat_result.st_mode):
+            return stat_result.st_size - image_file.tell()
+    if getattr(image_file, 'seekable', lambda: False)():
+        position = image_file.tell()
+        size = image_file.seek(0, os.SEEK_END) - position
+        image_file.seek(position)
+        return size
+    return None
+
+
+def _copy_image_file(image_file, temp_file):
+    """Copy a file from its position to the start of a temporary file."""
+    for chunk in iter(lambda: image_file.read(IMAGE_UPLOAD_CHUNK_SIZE), b''):
+        temp_file.write(chunk)
+    temp_file.seek(0)
+
+
+def _get_image_digest(image_file):
+    """Return the SHA-256 digest of a file from its position to its end."""
+    position = image_file.tell()
+    image_hash = hashlib.sha256()
+    for chunk in iter(lambda: image_file.read(IMAGE_UPLOAD_CHUNK_SIZE), b''):
+        image_hash.update(chunk)
+    image_file.seek(position)
+    return image_hash.digest()
+
+
+async def _read_image_chunks(image_file, start, offset, size, progress):
+    """Yield the bytes of an image from offset in chunks.
+
+    Args:
+        image_file: Binary file containing the image.
+        start (int): Position of the image in the file.
+        offset (int): Number of bytes of the image to skip.
+        size (int): Size of the image.
+        progress (_UploadProgressTracker): Tracker to update after each chunk.
+    """
+    loop = compat.get_running_loop()
+    bytes_sent = offset
+    while bytes_sent < size:
+        chunk = await loop.run_in_executor(
+            None, _read_image_chunk, image_file, start + bytes_sent,
+            min(IMAGE_UPLOAD_CHUNK_SIZE, size - bytes_sent)
+        )
+        if not chunk:
+            raise exceptions.NetworkError(
+                'image upload failed: file ended unexpectedly'
+            )
+        yield chunk
+        bytes_sent += len(chunk)
+        progress.update(bytes_sent)
+
+
+def _read_image_chunk(image_file, position, size):
+    """Return up to size bytes of a file from position."""
+    image_file.seek(position)
+    return image_file.read(size)
+
+
+def _is_resumable_upload_error(error):
+    """Return whether an interrupted image upload may be resumed.
+
+    Uploads are resumed after connection errors and server errors, but not
+    after client errors, which would fail again.
+    """
+    return (not isinstance(error, exceptions.UnexpectedStatusError) or
+            error.status >= 500)
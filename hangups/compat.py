@@ -0,0 +1,24 @@
+"""Compatibility with older Python versions."""
+
+import asyncio
+
+
+def get_running_loop():
+    """Return the running event loop.
+
+    Equivalent to :func:`asyncio.get_running_loop`, which was added in Python
+    3.7.
+
+    Returns:
+        The running :class:`asyncio.AbstractEventLoop`.
+
+    Raises:
+        RuntimeError: If no event loop is running.
+    """
+    try:
+        return asyncio.get_running_loop()
+    except AttributeError:
+        loop = asyncio.get_event_loop()
+        if not loop.is_running():
+            raise RuntimeError('no running event loop')
+        return loop
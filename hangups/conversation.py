@@ -1,19 +1,51 @@
 """Conversation objects."""
 
 import asyncio
+import bisect
+import collections
 import datetime
+import heapq
+import itertools
 import logging
+import time
 
-from hangups import (parsers, event, user, conversation_event, exceptions,
-                     hangouts_pb2)
+from hangups import (parsers, event, user, conversation_event, event_store,
+                     exceptions, hangouts_pb2)
 
 logger = logging.getLogger(__name__)
 
 CONVERSATIONS_PER_REQUEST = 100
 MAX_CONVERSATION_PAGES = 100
-
-
-async def build_user_conversation_list(client):
+# Minimum time between checking all conversations for events exceeding the
+# maximum age of an EventRetentionPolicy:
+RETENTION_AGE_SWEEP_SECS = 60
+# Time to wait before fetching a conversation again after fetching it failed,
+# doubled for each consecutive failure up to the maximum:
+FETCH_RETRY_BACKOFF_SECS = 1
+MAX_FETCH_RETRY_BACKOFF_SECS = 300
+# Maximum size of each page of events requested when catching up after
+# (re)connecting. A page within SYNC_PAGE_FULL_RATIO of this size is assumed
+# to have been truncated, and another page is requested:
+SYNC_MAX_RESPONSE_SIZE_BYTES = 1048576  # 1 MB
+SYNC_PAGE_FULL_RATIO = 0.9
+MAX_SYNC_PAGES = 20
+# Limits on the requests made to fill gaps in conversations after syncing:
+SYNC_BACKFILL_CONCURRENCY = 4
+SYNC_BACKFILL_EVENTS_PER_REQUEST = 50
+MAX_SYNC_BACKFILL_PAGES = 10
+# Default maximum number of messages to send at the same time when
+# broadcasting a message:
+BROADCAST_CONCURRENCY = 10
+# Time after which setting the same typing status again sends another request,
+# so the status does not expire while the user keeps typing:
+TYPING_REFRESH_SECS = 10
+# Default time after setting the typing status without setting it again before
+# typing is automatically paused, and then stopped:
+TYPING_PAUSE_SECS = 5
+TYPING_STOP_SECS = 30
+
+
+async def build_user_conversation_list(client, retention_policy=None):
     """Build :class:`.UserList` and :class:`.ConversationList`.
 
     This method requests data necessary to build the list of conversations and
@@ -22,6 +54,8 @@ async def build_user_conversation_list(client):
 
     Args:
         client (Client): Connected client.
+        retention_policy (EventRetentionPolicy): (optional) Limits on the
+            events kept in memory. Defaults to keeping all events.
 
     Returns:
         (:class:`.UserList`, :class:`.ConversationList`):
@@ -33,7 +67,7 @@ async def build_user_conversation_list(client):
     required_user_ids = set()
     for conv_state in conv_states:
         required_user_ids |= {
-            user.UserID(chat_id=part.id.chat_id, gaia_id=part.id.gaia_id)
+            user.intern_user_id(part.id.chat_id, part.id.gaia_id)
             for part in conv_state.conversation.participant_data
         }
     required_entities = []
@@ -74,7 +108,8 @@ async def build_user_conversation_list(client):
     user_list = user.UserList(client, self_entity, required_entities,
                               conv_part_list)
     conversation_list = ConversationList(client, conv_states,
-                                         user_list, sync_timestamp)
+                                         user_list, sync_timestamp,
+                                         retention_policy=retention_policy)
     return (user_list, conversation_list)
 
 
@@ -127,6 +162,210 @@ async def _sync_all_conversations(client):
     return conv_states, sync_timestamp
 
 
+class EventRetentionPolicy:
+    """Limits on the events a :class:`.ConversationList` keeps in memory.
+
+    Events exceeding these limits are evicted oldest-first as new events
+    arrive. When the total number of events is limited, events are evicted
+    from the least recently used conversations first. The newest event of each
+    conversation is never evicted.
+
+    Evicted events are requested again using the conversation's event
+    continuation token when :meth:`.Conversation.get_events` is called with the
+    ID of the oldest remaining event.
+
+    Args:
+        max_events_per_conversation (int): (optional) Maximum number of events
+            to keep for each conversation. Defaults to no limit.
+        max_total_events (int): (optional) Maximum number of events to keep
+            for all conversations. Defaults to no limit.
+        max_age (datetime.timedelta): (optional) Maximum age of events to keep.
+            Defaults to no limit.
+        compact_events (bool): (optional) Whether to keep events serialized
+            and decode them when their content is accessed (see
+            :meth:`.ConversationEvent.compact`). Defaults to ``False``.
+    """
+
+    def __init__(self, max_events_per_conversation=None,
+                 max_total_events=None, max_age=None, compact_events=False):
+        self.max_events_per_conversation = max_events_per_conversation
+        self.max_total_events = max_total_events
+        self.max_age = max_age
+        self.compact_events = compact_events
+
+
+class _EventRetention:
+    """Enforces an EventRetentionPolicy for a set of conversations.
+
+    Conversations are kept in least recently used order, and report the number
+    of events they add or evict so the total does not need to be recounted.
+    """
+
+    def __init__(self, policy):
+        self._policy = policy  # EventRetentionPolicy
+        self._conversations = collections.OrderedDict()  # {conv_id: Conv}
+        self._num_events = 0
+        self._last_age_sweep = time.monotonic()
+
+    @property
+    def compact_events(self):
+        """Whether events should be compacted when they are stored."""
+        return self._policy.compact_events
+
+    def touch(self, conv):
+        """Mark a conversation as the most recently used."""
+        self._conversations[conv.id_] = conv
+        self._conversations.move_to_end(conv.id_)
+
+    def remove(self, conv):
+        """Stop tracking a conversation and its events."""
+        if self._conversations.pop(conv.id_, None) is not None:
+            self._num_events -= len(conv.events)
+
+    def count(self, num_events):
+        """Record that events were added (or evicted, if negative)."""
+        self._num_events += num_events
+
+    def enforce(self, conv, trim_conv=True):
+        """Evict events after events were added to a conversation.
+
+        If trim_conv is False, conv is exempt from eviction. This is used for
+        events that were explicitly requested, so they are not immediately
+        evicted again.
+        """
+        policy = self._policy
+        cutoff = None
+        if policy.max_age is not None:
+            cutoff = parsers.to_timestamp(
+                datetime.datetime.now(datetime.timezone.utc) - policy.max_age
+            )
+        if trim_conv:
+            if policy.max_events_per_conversation is not None:
+                conv.evict_events(
+                    len(conv.events) - policy.max_events_per_conversation
+                )
+            if cutoff is not None:
+                conv.evict_events_before_us(cutoff)
+        now = time.monotonic()
+        if (cutoff is not None and
+                now - self._last_age_sweep > RETENTION_AGE_SWEEP_SECS):
+            self._last_age_sweep = now
+            for other_conv in self._conversations.values():
+                if other_conv is not conv:
+                    other_conv.evict_events_before_us(cutoff)
+        if policy.max_total_events is not None:
+            for other_conv in list(self._conversations.values()):
+                excess = self._num_events - policy.max_total_events
+                if excess <= 0:
+                    break
+                if other_conv is not conv or trim_conv:
+                    other_conv.evict_events(excess)
+
+
+def _merge_delta(message, delta):
+    """Apply the fields present in a delta message to a message.
+
+    Message fields are merged recursively, while scalar fields and non-empty
+    repeated fields replace the existing value. Fields are only assigned if
+    their value changed.
+    """
+    for field, value in delta.ListFields():
+        if field.label == field.LABEL_REPEATED:
+            existing = getattr(message, field.name)
+            if existing != value:
+                del existing[:]
+                existing.extend(value)
+        elif field.type == field.TYPE_MESSAGE:
+            _merge_delta(getattr(message, field.name), value)
+        elif (not message.HasField(field.name) or
+              getattr(message, field.name) != value):
+            setattr(message, field.name, value)
+
+
+class _TypingStatus:
+    """Debounces the typing status set for a conversation.
+
+    Requests are only sent for changes to the status, or to refresh a status
+    which is older than ``TYPING_REFRESH_SECS``. Requests are sent one at a
+    time in order. After the status is set, a timer may automatically pause
+    and then stop typing.
+
+    The clock used for the timer and refreshes may be replaced for testing.
+    """
+
+    def __init__(self, send, monotonic=time.monotonic, sleep=asyncio.sleep):
+        self._send = send  # Coroutine function taking a TypingType
+        self._monotonic = monotonic  # Function returning the time in seconds
+        self._sleep = sleep  # Coroutine function sleeping for seconds
+        # TypingType last sent or being sent, or None if unknown:
+        self._status = hangouts_pb2.TYPING_TYPE_STOPPED
+        self._status_time = 0.0  # self._monotonic() of setting _status
+        self._send_lock = asyncio.Lock()
+        self._timer = None  # asyncio.Task for automatic transitions or None
+
+    async def set(self, typing, pause_after, stop_after):
+        """Set the typing status and restart the automatic transitions."""
+        self._cancel_timer()
+        if typing == hangouts_pb2.TYPING_TYPE_STARTED:
+            delays = [(pause_after, hangouts_pb2.TYPING_TYPE_PAUSED),
+                      (stop_after, hangouts_pb2.TYPING_TYPE_STOPPED)]
+        elif typing == hangouts_pb2.TYPING_TYPE_PAUSED:
+            delays = [(stop_after, hangouts_pb2.TYPING_TYPE_STOPPED)]
+        else:
+            delays = []
+        delays = [(delay, status) for delay, status in delays
+                  if delay is not None]
+        if delays:
+            self._timer = asyncio.ensure_future(self._run_timer(delays))
+        await self._update(typing)
+
+    def reset(self):
+        """Assume typing has stopped without sending a request."""
+        self._cancel_timer()
+        self._status = hangouts_pb2.TYPING_TYPE_STOPPED
+        self._status_time = self._monotonic()
+
+    def cancel(self):
+        """Stop the automatic transitions without sending a request."""
+        self._cancel_timer()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def _run_timer(self, delays):
+        """Set each status after its delay since the timer started."""
+        elapsed = 0
+        for delay, status in delays:
+            await self._sleep(max(delay - elapsed, 0))
+            elapsed = max(delay, elapsed)
+            try:
+                await self._update(status)
+            except exceptions.NetworkError:
+                pass  # Already logged.
+        self._timer = None
+
+    async def _update(self, typing):
+        """Send the typing status unless it would have no effect."""
+        now = self._monotonic()
+        if typing == self._status and (
+                typing != hangouts_pb2.TYPING_TYPE_STARTED or
+                now - self._status_time < TYPING_REFRESH_SECS
+        ):
+            return
+        self._status = typing
+        self._status_time = now
+        async with self._send_lock:
+            try:
+                await self._send(typing)
+            except (exceptions.NetworkError, asyncio.CancelledError):
+                # The status may not have been set, so send it next time.
+                if self._status == typing:
+                    self._status = None
+                raise
+
+
 class Conversation:
     """A single chat conversation.
 
@@ -134,21 +373,41 @@ class Conversation:
     """
 
     def __init__(self, client, user_list, conversation, events=[],
-                 event_cont_token=None):
+                 event_cont_token=None, retention=None, update_position=None):
         # pylint: disable=dangerous-default-value
         self._client = client  # Client
         self._user_list = user_list  # UserList
         self._conversation = conversation  # hangouts_pb2.Conversation
-        self._events = []  # [hangouts_pb2.Event]
-        self._events_dict = {}  # {event_id: ConversationEvent}
+        self._events = event_store.EventStore()  # EventStore
         self._send_message_lock = asyncio.Lock()
-        self._watermarks = {}  # {UserID: datetime.datetime}
+        # Set when the last message with an uploaded image has been sent:
+        self._image_message_sent = None  # asyncio.Event or None
+        self._typing_status = _TypingStatus(self._send_typing)
+        self._watermarks = {}  # {UserID: int}
+        # Participants, or None if they need to be looked up again:
+        self._users = None  # [User]
+        self._users_version = None  # UserList.version when _users was set
+        self._default_names = {}  # {truncate: str}
         self._event_cont_token = event_cont_token
-        for event_ in events:
-            # Workaround to ignore observed events returned from
-            # syncrecentconversations.
-            if event_.event_type != hangouts_pb2.EVENT_TYPE_OBSERVED_EVENT:
-                self.add_event(event_)
+        self._retention = retention  # _EventRetention or None
+        # Coroutine function to update the position of this conversation in
+        # the ConversationList after it was modified, or None:
+        self._update_position = update_position
+        # Position of the oldest unread event:
+        self._unread_boundary = 0
+        # Number of unread chat messages from other users:
+        self._num_unread_messages = 0
+        # The newest loaded event at or before the watermark of each other
+        # participant, and the reverse mapping:
+        self._watermark_events = {}  # {UserID: event_id}
+        self._seen_by = {}  # {event_id: {UserID}}
+        self._self_user_id = None  # UserID of the current user, once known
+        # Workaround to ignore observed events returned from
+        # syncrecentconversations.
+        self.add_events([
+            event_ for event_ in events
+            if event_.event_type != hangouts_pb2.EVENT_TYPE_OBSERVED_EVENT
+        ])
 
         self.on_event = event.Event('Conversation.on_event')
         """
@@ -192,9 +451,63 @@ class Conversation:
     @property
     def users(self):
         """List of conversation participants (:class:`~hangups.user.User`)."""
-        return [self._user_list.get_user(user.UserID(chat_id=part.id.chat_id,
-                                                     gaia_id=part.id.gaia_id))
-                for part in self._conversation.participant_data]
+        return list(self._get_users())
+
+    def _get_users(self):
+        """Return the cached list of participants, updating it if needed."""
+        version = self._user_list.version
+        if self._users is not None and self._users_version != version:
+            # Only update the participants if one of them changed.
+            if any(self._user_list.get_user_version(user_.id_) >
+                   self._users_version for user_ in self._users):
+                self._users = None
+            else:
+                self._users_version = version
+        if self._users is None:
+            self._users = [
+                self._user_list.get_user(
+                    user.intern_user_id(part.id.chat_id, part.id.gaia_id)
+                ) for part in self._conversation.participant_data
+            ]
+            self._users_version = version
+            self._default_names.clear()
+        return self._users
+
+    def get_default_name(self, truncate=False):
+        """Get a name for this conversation based on its participants.
+
+        For one-to-one conversations, the name is the full name of the other
+        user. For group conversations, the name is a comma-separated list of
+        first names. If the group conversation is empty, the name is "Empty
+        Conversation".
+
+        The name is cached until the participants or their names change.
+
+        Args:
+            truncate (bool): (optional) Whether to only show up to two names
+                in a group conversation. Defaults to ``False``.
+
+        Returns:
+            :class:`str` name of the conversation.
+        """
+        users = self._get_users()
+        name = self._default_names.get(truncate, None)
+        if name is None:
+            participants = sorted(
+                (user_ for user_ in users if not user_.is_self),
+                key=lambda user_: user_.id_
+            )
+            names = [user_.first_name for user_ in participants]
+            if not participants:
+                name = 'Empty Conversation'
+            elif len(participants) == 1:
+                name = participants[0].full_name
+            elif truncate and len(participants) > 2:
+                name = ', '.join(names[:2] + ['+{}'.format(len(names) - 2)])
+            else:
+                name = ', '.join(names)
+            self._default_names[truncate] = name
+        return name
 
     @property
     def name(self):
@@ -208,27 +521,48 @@ class Conversation:
     @property
     def last_modified(self):
         """When conversation was last modified (:class:`datetime.datetime`)."""
+        return parsers.from_timestamp(self.last_modified_us)
+
+    @property
+    def last_modified_us(self):
+        """When conversation was last modified in microseconds since epoch.
+
+        This is cheaper than :attr:`last_modified` for sorting conversations.
+
+        (:class:`int`).
+        """
         timestamp = self._conversation.self_conversation_state.sort_timestamp
         # timestamp can be None for some reason when there is an ongoing video
         # hangout
         if timestamp is None:
             timestamp = 0
-        return parsers.from_timestamp(timestamp)
+        return timestamp
 
     @property
     def latest_read_timestamp(self):
         """Timestamp of latest read event (:class:`datetime.datetime`)."""
-        timestamp = (self._conversation.self_conversation_state.
-                     self_read_state.latest_read_timestamp)
-        return parsers.from_timestamp(timestamp)
+        return parsers.from_timestamp(self.latest_read_timestamp_us)
+
+    @property
+    def latest_read_timestamp_us(self):
+        """Timestamp of latest read event in microseconds since epoch.
+
+        (:class:`int`).
+        """
+        return (self._conversation.self_conversation_state.
+                self_read_state.latest_read_timestamp)
 
     @property
     def events(self):
         """Loaded events sorted oldest to newest.
 
-        (list of :class:`.ConversationEvent`).
+        This is a read-only view which reflects events added to the
+        conversation later. Slicing it returns a new list.
+
+        (:class:`~hangups.event_store.EventView` of
+        :class:`.ConversationEvent`).
         """
-        return list(self._events)
+        return self._events.view()
 
     @property
     def watermarks(self):
@@ -236,6 +570,15 @@ class Conversation:
 
         (dict of :class:`.UserID`, :class:`datetime.datetime`).
         """
+        return {user_id: parsers.from_timestamp(timestamp)
+                for user_id, timestamp in self._watermarks.items()}
+
+    @property
+    def watermarks_us(self):
+        """Participant watermarks in microseconds since epoch.
+
+        (dict of :class:`.UserID`, :class:`int`).
+        """
         return self._watermarks.copy()
 
     @property
@@ -249,8 +592,26 @@ class Conversation:
 
         (list of :class:`.ConversationEvent`).
         """
-        return [conv_event for conv_event in self._events
-                if conv_event.timestamp > self.latest_read_timestamp]
+        return self._events[self._unread_boundary:]
+
+    @property
+    def unread_count(self):
+        """Number of loaded events which are unread (:class:`int`).
+
+        This is the length of :attr:`unread_events`, but is maintained as
+        events are added and the read timestamp changes.
+        """
+        return len(self._events) - self._unread_boundary
+
+    @property
+    def unread_message_count(self):
+        """Number of loaded unread chat messages from other users.
+
+        This is maintained as events are added and the read timestamp changes.
+
+        (:class:`int`).
+        """
+        return self._num_unread_messages
 
     @property
     def is_archived(self):
@@ -278,29 +639,115 @@ class Conversation:
         status = self._conversation.group_link_sharing_status
         return status == hangouts_pb2.GROUP_LINK_SHARING_STATUS_ON
 
+    def _is_self_user(self, user_id):
+        """Return whether a user is the current user."""
+        if self._self_user_id is None and self.get_user(user_id).is_self:
+            self._self_user_id = user_id
+        return user_id == self._self_user_id
+
+    def _is_unread_message(self, conv_event):
+        """Return whether an unread event counts as an unread message."""
+        return (isinstance(conv_event, conversation_event.ChatMessageEvent)
+                and not self._is_self_user(conv_event.user_id))
+
+    def _on_events_added(self, conv_events):
+        """Update unread counts and watermarks after events were added."""
+        if self._retention is not None and self._retention.compact_events:
+            for conv_event in conv_events:
+                conv_event.compact()
+        read_timestamp = self.latest_read_timestamp_us
+        for conv_event in conv_events:
+            if conv_event.timestamp_us > read_timestamp:
+                if self._is_unread_message(conv_event):
+                    self._num_unread_messages += 1
+            else:
+                self._unread_boundary += 1
+        if conv_events:
+            # Only participants who read past an added event can move to it.
+            oldest_timestamp = min(conv_event.timestamp_us
+                                   for conv_event in conv_events)
+            for user_id, timestamp in self._watermarks.items():
+                if timestamp >= oldest_timestamp:
+                    self._index_watermark(user_id)
+
+    def _on_events_evicted(self, conv_events):
+        """Update unread counts and watermarks after events were evicted."""
+        num_read = min(len(conv_events), self._unread_boundary)
+        self._unread_boundary -= num_read
+        for conv_event in conv_events[num_read:]:
+            if self._is_unread_message(conv_event):
+                self._num_unread_messages -= 1
+        # Watermarks on evicted events are now before the oldest loaded event.
+        for conv_event in conv_events:
+            for user_id in self._seen_by.pop(conv_event.id_, ()):
+                del self._watermark_events[user_id]
+
+    def _set_watermark(self, user_id, timestamp):
+        """Set the watermark of a participant."""
+        self._watermarks[user_id] = timestamp
+        self._index_watermark(user_id)
+
+    def _index_watermark(self, user_id):
+        """Move a participant to the newest loaded event they have read."""
+        if self._is_self_user(user_id):
+            return
+        index = self._events.bisect_timestamp(self._watermarks[user_id],
+                                              after=True) - 1
+        event_id = self._events[index].id_ if index >= 0 else None
+        old_event_id = self._watermark_events.get(user_id, None)
+        if event_id == old_event_id:
+            return
+        if old_event_id is not None:
+            users = self._seen_by[old_event_id]
+            users.remove(user_id)
+            if not users:
+                del self._seen_by[old_event_id]
+            del self._watermark_events[user_id]
+        if event_id is not None:
+            self._watermark_events[user_id] = event_id
+            self._seen_by.setdefault(event_id, set()).add(user_id)
+
+    def _on_read_timestamp_changed(self):
+        """Update the unread counts after latest_read_timestamp changed.
+
+        Only the events between the old and new read timestamps are checked.
+        """
+        old_boundary = self._unread_boundary
+        self._unread_boundary = self._events.bisect_timestamp(
+            self.latest_read_timestamp_us, after=True
+        )
+        if self._unread_boundary > old_boundary:
+            changed_events = self._events[old_boundary:self._unread_boundary]
+            sign = -1
+        else:
+            changed_events = self._events[self._unread_boundary:old_boundary]
+            sign = 1
+        for conv_event in changed_events:
+            if self._is_unread_message(conv_event):
+                self._num_unread_messages += sign
+
     def _on_watermark_notification(self, notif):
         """Handle a watermark notification."""
+        read_timestamp = parsers.to_timestamp(notif.read_timestamp)
         # Update the conversation:
-        if self.get_user(notif.user_id).is_self:
+        if self._is_self_user(notif.user_id):
             logger.info('latest_read_timestamp for {} updated to {}'
                         .format(self.id_, notif.read_timestamp))
             self_conversation_state = (
                 self._conversation.self_conversation_state
             )
             self_conversation_state.self_read_state.latest_read_timestamp = (
-                parsers.to_timestamp(notif.read_timestamp)
+                read_timestamp
             )
+            self._on_read_timestamp_changed()
         # Update the participants' watermarks:
-        previous_timestamp = self._watermarks.get(
-            notif.user_id,
-            datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
-        )
-        if notif.read_timestamp > previous_timestamp:
+        previous_timestamp = self._watermarks.get(notif.user_id, 0)
+        if read_timestamp > previous_timestamp:
             logger.info(('latest_read_timestamp for conv {} participant {}' +
                          ' updated to {}').format(self.id_,
                                                   notif.user_id.chat_id,
                                                   notif.read_timestamp))
-            self._watermarks[notif.user_id] = notif.read_timestamp
+            self._set_watermark(notif.user_id, read_timestamp)
 
     def update_conversation(self, conversation):
         """Update the internal state of the conversation.
@@ -312,34 +759,41 @@ class Conversation:
             conversation: ``Conversation`` message.
         """
         # StateUpdate.conversation is actually a delta; fields that aren't
-        # specified are assumed to be unchanged. Until this class is
-        # refactored, hide this by saving and restoring previous values where
-        # necessary.
-
-        new_state = conversation.self_conversation_state
-        old_state = self._conversation.self_conversation_state
-        self._conversation = conversation
-
-        # delivery_medium_option
-        if not new_state.delivery_medium_option:
-            new_state.delivery_medium_option.extend(
-                old_state.delivery_medium_option
-            )
+        # specified are assumed to be unchanged.
+        state = self._conversation.self_conversation_state
+        old_timestamp = state.self_read_state.latest_read_timestamp
+        # Only look at the read states if some have changed, since large
+        # conversations have many participants.
+        read_state_changed = (
+            len(conversation.read_state) > 0 and
+            conversation.read_state != self._conversation.read_state
+        )
+        if (len(conversation.participant_data) > 0 and
+                conversation.participant_data !=
+                self._conversation.participant_data):
+            self._users = None
+        _merge_delta(self._conversation, conversation)
 
         # latest_read_timestamp
-        old_timestamp = old_state.self_read_state.latest_read_timestamp
-        new_timestamp = new_state.self_read_state.latest_read_timestamp
+        new_timestamp = state.self_read_state.latest_read_timestamp
         if new_timestamp == 0:
-            new_state.self_read_state.latest_read_timestamp = old_timestamp
+            state.self_read_state.latest_read_timestamp = old_timestamp
+        elif new_timestamp != old_timestamp:
+            self._on_read_timestamp_changed()
 
         # user_read_state(s)
-        for new_entry in conversation.read_state:
-            tstamp = parsers.from_timestamp(new_entry.latest_read_timestamp)
-            if tstamp == 0:
-                continue
-            uid = parsers.from_participantid(new_entry.participant_id)
-            if uid not in self._watermarks or self._watermarks[uid] < tstamp:
-                self._watermarks[uid] = tstamp
+        if read_state_changed:
+            for new_entry in conversation.read_state:
+                tstamp = new_entry.latest_read_timestamp
+                if tstamp == 0:
+                    continue
+                participant_id = new_entry.participant_id
+                user_id = user.UserID(chat_id=participant_id.chat_id,
+                                      gaia_id=participant_id.gaia_id)
+                if self._watermarks.get(user_id, 0) < tstamp:
+                    self._set_watermark(
+                        parsers.from_participantid(participant_id), tstamp
+                    )
 
     @staticmethod
     def _wrap_event(event_):
@@ -372,16 +826,103 @@ class Conversation:
             :class:`.ConversationEvent` representing the event.
         """
         conv_event = self._wrap_event(event_)
-        if conv_event.id_ not in self._events_dict:
-            self._events.append(conv_event)
-            self._events_dict[conv_event.id_] = conv_event
-        else:
+        if not self._events.add(conv_event):
             # If this happens, there's probably a bug.
             logger.info('Conversation %s ignoring duplicate event %s',
                         self.id_, conv_event.id_)
             return None
+        self._on_events_added([conv_event])
+        if self._retention is not None:
+            self._retention.count(1)
+            self._retention.touch(self)
+            self._retention.enforce(self)
         return conv_event
 
+    def add_events(self, events):
+        """Add a batch of events to the conversation.
+
+        This method is used by :class:`.ConversationList` to maintain this
+        instance.
+
+        The events are merged into the loaded events in a single pass, in
+        timestamp order.
+
+        Args:
+            events: List of ``Event`` messages.
+
+        Returns:
+            List of :class:`.ConversationEvent` representing the events that
+            were added, ordered oldest to newest. Duplicate events are
+            omitted.
+        """
+        conv_events = self._events.merge(
+            self._wrap_event(event_) for event_ in events
+        )
+        if len(conv_events) < len(events):
+            # If this happens, there's probably a bug.
+            logger.info('Conversation %s ignoring %s duplicate events',
+                        self.id_, len(events) - len(conv_events))
+        self._on_events_added(conv_events)
+        if self._retention is not None and conv_events:
+            self._retention.count(len(conv_events))
+            self._retention.touch(self)
+            self._retention.enforce(self)
+        return conv_events
+
+    def evict_events(self, count):
+        """Evict some of the oldest events from the conversation.
+
+        This method is used by :class:`.ConversationList` to maintain this
+        instance.
+
+        The newest event is never evicted. Evicted events may be requested
+        again using :meth:`get_events`.
+
+        Args:
+            count (int): Maximum number of events to evict.
+
+        Returns:
+            Number of events evicted.
+        """
+        count = min(count, len(self._events) - 1)
+        if count <= 0:
+            return 0
+        self._on_events_evicted(self._events.evict_oldest(count))
+        oldest_event = self._events[0]
+        self._event_cont_token = hangouts_pb2.EventContinuationToken(
+            event_id=oldest_event.id_,
+            event_timestamp=oldest_event.timestamp_us,
+        )
+        logger.debug('Conversation %s evicted %s events', self.id_, count)
+        if self._retention is not None:
+            self._retention.count(-count)
+        return count
+
+    def evict_events_before(self, timestamp):
+        """Evict events older than a timestamp from the conversation.
+
+        This method is used by :class:`.ConversationList` to maintain this
+        instance.
+
+        The newest event is never evicted. Evicted events may be requested
+        again using :meth:`get_events`.
+
+        Args:
+            timestamp (datetime.datetime): Timestamp to evict events before.
+
+        Returns:
+            Number of events evicted.
+        """
+        return self.evict_events_before_us(parsers.to_timestamp(timestamp))
+
+    def evict_events_before_us(self, timestamp):
+        """Evict events older than a microsecond timestamp.
+
+        Like :meth:`evict_events_before`, but takes a timestamp in
+        microseconds since epoch.
+        """
+        return self.evict_events(self._events.bisect_timestamp(timestamp))
+
     def get_user(self, user_id):
         """Get user by its ID.
 
@@ -437,6 +978,10 @@ class Conversation:
         the correct order when this method is called multiple times
         asynchronously.
 
+        The image from ``image_file`` is uploaded before the lock is acquired,
+        so other messages are not delayed by the upload. Messages with images
+        are still sent in the order this method was called for them.
+
         Args:
             segments: List of :class:`.ChatMessageSegment` objects to include
                 in the message.
@@ -456,23 +1001,42 @@ class Conversation:
         Returns:
             :class:`.ConversationEvent` representing the new message.
         """
+        if not image_file:
+            return await self._send_chat_message(segments, image_id,
+                                                 image_user_id)
+        prev_image_message_sent = self._image_message_sent
+        image_message_sent = asyncio.Event()
+        self._image_message_sent = image_message_sent
+        try:
+            try:
+                uploaded_image = await self._client.upload_image(
+                    image_file, return_uploaded_image=True
+                )
+            except exceptions.NetworkError as e:
+                logger.warning('Failed to upload image: {}'.format(e))
+                raise
+            if prev_image_message_sent is not None:
+                await prev_image_message_sent.wait()
+            return await self._send_chat_message(
+                segments, uploaded_image.image_id, image_user_id
+            )
+        finally:
+            image_message_sent.set()
+            if self._image_message_sent is image_message_sent:
+                self._image_message_sent = None
+
+    async def _send_chat_message(self, segments, image_id, image_user_id):
+        """Send a message, after any message which is already being sent."""
         async with self._send_message_lock:
-            if image_file:
-                try:
-                    uploaded_image = await self._client.upload_image(
-                        image_file, return_uploaded_image=True
-                    )
-                except exceptions.NetworkError as e:
-                    logger.warning('Failed to upload image: {}'.format(e))
-                    raise
-                image_id = uploaded_image.image_id
             try:
                 request = hangouts_pb2.SendChatMessageRequest(
                     request_header=self._client.get_request_header(),
                     event_request_header=self._get_event_request_header(),
-                    message_content=hangouts_pb2.MessageContent(
-                        segment=[seg.serialize() for seg in segments],
-                    ),
+                )
+                request.message_content.MergeFromString(
+                    conversation_event.ChatMessageSegment.serialize_segments(
+                        segments
+                    )
                 )
                 if image_id is not None:
                     request.existing_media.photo.photo_id = image_id
@@ -480,6 +1044,8 @@ class Conversation:
                     request.existing_media.photo.user_id = image_user_id
                     request.existing_media.photo.is_custom_user_id = True
                 response = await self._client.send_chat_message(request)
+                # Sending a message stops typing.
+                self._typing_status.reset()
                 return self._wrap_event(response.created_event)
             except exceptions.NetworkError as e:
                 logger.warning('Failed to send message: {}'.format(e))
@@ -703,18 +1269,42 @@ class Conversation:
             logger.warning('Failed to set link sharing mode: {}'.format(e))
             raise
 
-    async def set_typing(self, typing=hangouts_pb2.TYPING_TYPE_STARTED):
+    async def set_typing(self, typing=hangouts_pb2.TYPING_TYPE_STARTED, *,
+                         pause_after=TYPING_PAUSE_SECS,
+                         stop_after=TYPING_STOP_SECS):
         """Set your typing status in this conversation.
 
+        This may be called on every keystroke: a request is only sent when
+        the status changes, or every ``TYPING_REFRESH_SECS`` while typing
+        continues. If typing is not set again, it is automatically paused and
+        then stopped.
+
         Args:
             typing: (optional) ``TYPING_TYPE_STARTED``, ``TYPING_TYPE_PAUSED``,
                 or ``TYPING_TYPE_STOPPED`` to start, pause, or stop typing,
                 respectively. Defaults to ``TYPING_TYPE_STARTED``.
+            pause_after (float): (optional) Seconds after starting typing to
+                pause typing, or ``None`` to not pause automatically. Defaults
+                to ``TYPING_PAUSE_SECS``.
+            stop_after (float): (optional) Seconds after starting or pausing
+                typing to stop typing, or ``None`` to not stop automatically.
+                Defaults to ``TYPING_STOP_SECS``.
 
         Raises:
             .NetworkError: If typing status cannot be set.
         """
-        # TODO: Add rate-limiting to avoid unnecessary requests.
+        await self._typing_status.set(typing, pause_after, stop_after)
+
+    def cancel_typing_timer(self):
+        """Stop automatically pausing and stopping typing.
+
+        This method is used by :class:`.ConversationList` when the client
+        disconnects or this conversation is removed.
+        """
+        self._typing_status.cancel()
+
+    async def _send_typing(self, typing):
+        """Send a request to set the typing status."""
         try:
             await self._client.set_typing(
                 hangouts_pb2.SetTypingRequest(
@@ -740,18 +1330,24 @@ class Conversation:
             .NetworkError: If the timestamp cannot be updated.
         """
         if read_timestamp is None:
-            read_timestamp = (self.events[-1].timestamp if self.events else
-                              datetime.datetime.now(datetime.timezone.utc))
-        if read_timestamp > self.latest_read_timestamp:
+            read_timestamp_us = (
+                self._events[-1].timestamp_us if self._events else
+                parsers.to_timestamp(
+                    datetime.datetime.now(datetime.timezone.utc)
+                )
+            )
+        else:
+            read_timestamp_us = parsers.to_timestamp(read_timestamp)
+        if read_timestamp_us > self.latest_read_timestamp_us:
             logger.info(
                 'Setting {} latest_read_timestamp from {} to {}'
-                .format(self.id_, self.latest_read_timestamp, read_timestamp)
+                .format(self.id_, self.latest_read_timestamp,
+                        parsers.from_timestamp(read_timestamp_us))
             )
             # Prevent duplicate requests by updating the conversation now.
             state = self._conversation.self_conversation_state
-            state.self_read_state.latest_read_timestamp = (
-                parsers.to_timestamp(read_timestamp)
-            )
+            state.self_read_state.latest_read_timestamp = read_timestamp_us
+            self._on_read_timestamp_changed()
             try:
                 await self._client.update_watermark(
                     hangouts_pb2.UpdateWatermarkRequest(
@@ -759,9 +1355,7 @@ class Conversation:
                         conversation_id=hangouts_pb2.ConversationId(
                             id=self.id_
                         ),
-                        last_read_timestamp=parsers.to_timestamp(
-                            read_timestamp
-                        ),
+                        last_read_timestamp=read_timestamp_us,
                     )
                 )
             except exceptions.NetworkError as e:
@@ -771,7 +1365,8 @@ class Conversation:
     async def get_events(self, event_id=None, max_events=50):
         """Get events from this conversation.
 
-        Makes a request to load historical events if necessary.
+        Makes a request to load historical events if necessary, including
+        events that were evicted by the :class:`EventRetentionPolicy`.
 
         Args:
             event_id (str): (optional) If provided, return events preceding
@@ -787,6 +1382,8 @@ class Conversation:
             KeyError: If ``event_id`` does not correspond to a known event.
             .NetworkError: If the events could not be requested.
         """
+        if self._retention is not None:
+            self._retention.touch(self)
         if event_id is None:
             # If no event_id is provided, return the newest events in this
             # conversation.
@@ -795,13 +1392,13 @@ class Conversation:
             # If event_id is provided, return the events we have that are
             # older, or request older events if event_id corresponds to the
             # oldest event we have.
-            conv_event = self.get_event(event_id)
-            if self._events[0].id_ != event_id:
+            index = self._events.index(event_id)
+            if index > 0:
                 # Return at most max_events events preceding the event at this
                 # index.
-                index = self._events.index(conv_event)
                 conv_events = self._events[max(index - max_events, 0):index]
             else:
+                conv_event = self._events[0]
                 logger.info('Loading events for conversation {} before {}'
                             .format(self.id_, conv_event.timestamp))
                 res = await self._client.get_conversation(
@@ -833,19 +1430,22 @@ class Conversation:
                                in res.conversation_state.event]
                 logger.info('Loaded {} events for conversation {}'
                             .format(len(conv_events), self.id_))
-                # Iterate though the events newest to oldest.
-                for conv_event in reversed(conv_events):
-                    # Add event as the new oldest event, unless we already have
-                    # it.
-                    if conv_event.id_ not in self._events_dict:
-                        self._events.insert(0, conv_event)
-                        self._events_dict[conv_event.id_] = conv_event
-                    else:
+                for conv_event in conv_events:
+                    if conv_event.id_ in self._events:
                         # If this happens, there's probably a bug.
                         logger.info(
                             'Conversation %s ignoring duplicate event %s',
                             self.id_, conv_event.id_
                         )
+                added_events = self._events.merge(conv_events)
+                self._on_events_added(added_events)
+                if self._retention is not None:
+                    # Evict events from other conversations to make room for
+                    # the events that were explicitly requested.
+                    self._retention.count(len(added_events))
+                    self._retention.enforce(self, trim_conv=False)
+                if self._update_position is not None:
+                    await self._update_position(self)
         return conv_events
 
     def next_event(self, event_id, prev=False):
@@ -861,15 +1461,68 @@ class Conversation:
 
         Returns:
             :class:`.ConversationEvent` or ``None`` if there is no following
-            event.
+            event. When ``prev`` is ``True``, ``None`` may also mean previous
+            events need to be requested using :meth:`get_events`.
+        """
+        if self._retention is not None:
+            self._retention.touch(self)
+        return self._events.neighbour(event_id, prev=prev)
+
+    def get_events_between(self, start=None, end=None):
+        """Get loaded events from a range of timestamps.
+
+        Unlike :meth:`get_events`, this never makes a request.
+
+        Args:
+            start (datetime.datetime): (optional) Return events at or after
+                this timestamp. Defaults to the oldest loaded event.
+            end (datetime.datetime): (optional) Return events before this
+                timestamp. Defaults to the newest loaded event.
+
+        Returns:
+            List of :class:`.ConversationEvent` instances, ordered
+            oldest-first.
+        """
+        return self._events.between(
+            None if start is None else parsers.to_timestamp(start),
+            None if end is None else parsers.to_timestamp(end),
+        )
+
+    def get_seen_by(self, start_event_id=None, end_event_id=None):
+        """Get the participants who have read up to each event in a range.
+
+        Each participant other than the current user has read up to the newest
+        loaded event at or before their watermark. Participants whose
+        watermark is before the oldest loaded event are omitted.
+
+        Args:
+            start_event_id (str): (optional) ID of the oldest event in the
+                range. Defaults to the oldest loaded event.
+            end_event_id (str): (optional) ID of the newest event in the range,
+                inclusive. Defaults to the newest loaded event.
+
+        Raises:
+            KeyError: If an event with the given ID is not loaded.
+
+        Returns:
+            dict of event IDs to sets of :class:`~hangups.user.User`,
+            including only events that participants have read up to.
         """
-        i = self.events.index(self._events_dict[event_id])
-        if prev and i > 0:
-            return self.events[i - 1]
-        elif not prev and i + 1 < len(self.events):
-            return self.events[i + 1]
+        if start_event_id is not None and start_event_id == end_event_id:
+            # Fast path for a single event.
+            self._events.index(start_event_id)
+            event_ids = ([start_event_id] if start_event_id in self._seen_by
+                         else [])
         else:
-            return None
+            start = (0 if start_event_id is None else
+                     self._events.index(start_event_id))
+            end = (len(self._events) - 1 if end_event_id is None else
+                   self._events.index(end_event_id))
+            event_ids = [event_id for event_id in self._seen_by
+                         if start <= self._events.index(event_id) <= end]
+        return {event_id: {self.get_user(user_id)
+                           for user_id in self._seen_by[event_id]}
+                for event_id in event_ids}
 
     def get_event(self, event_id):
         """Get an event in this conversation by its ID.
@@ -883,7 +1536,136 @@ class Conversation:
         Returns:
             :class:`.ConversationEvent` with the given ID.
         """
-        return self._events_dict[event_id]
+        return self._events.get(event_id)
+
+
+ConversationPositionChange = collections.namedtuple(
+    'ConversationPositionChange',
+    ['conv_id', 'is_archived', 'old_position', 'new_position']
+)
+"""A change in the position of a conversation ordered by recency.
+
+Conversations are ordered most recently modified first, separately for
+archived and non-archived conversations. A conversation that is archived or
+unarchived is removed from one order and added to the other.
+
+Args:
+    conv_id (str): ID of the conversation.
+    is_archived (bool): Whether the position is among archived conversations.
+    old_position (int): Previous position, or ``None`` if the conversation was
+        added.
+    new_position (int): New position, or ``None`` if the conversation was
+        removed.
+"""
+
+
+SyncStats = collections.namedtuple(
+    'SyncStats',
+    ['duration', 'num_pages', 'num_conversations', 'num_events',
+     'num_backfilled_events', 'num_failed_backfills']
+)
+"""Statistics about catching up on missed events after (re)connecting.
+
+Args:
+    duration (datetime.timedelta): Time taken to catch up.
+    num_pages (int): Number of pages of events received.
+    num_conversations (int): Number of conversations with missed events.
+    num_events (int): Number of missed events recovered, including backfilled
+        events.
+    num_backfilled_events (int): Number of events recovered by filling gaps in
+        conversations.
+    num_failed_backfills (int): Number of conversations which could not be
+        backfilled, and may still be missing events.
+"""
+
+
+BroadcastResult = collections.namedtuple(
+    'BroadcastResult', ['conv_id', 'event', 'latency', 'error']
+)
+"""The result of broadcasting a message to a conversation.
+
+Args:
+    conv_id (str): ID of the conversation.
+    event (ConversationEvent): The new message, or ``None`` if sending failed.
+    latency (datetime.timedelta): Time taken to send the message, including
+        fetching the conversation and waiting for other messages to the same
+        conversation, but not waiting for the rate limit.
+    error (NetworkError): The error if sending failed, or ``None``.
+"""
+
+
+class _ConversationIndex:
+    """Conversations ordered by sort timestamp.
+
+    Archived and non-archived conversations are kept in separate lists of
+    (sort timestamp, conversation ID) keys in ascending order, so the most
+    recent conversations are at the end of each list.
+    """
+
+    def __init__(self):
+        self._keys = {False: [], True: []}  # {is_archived: [key]}
+        self._conv_keys = {}  # {conv_id: (is_archived, key)}
+        self._convs = {}  # {conv_id: Conversation}
+
+    def _remove(self, conv_id):
+        """Remove conversation and return its change, or None."""
+        is_archived, key = self._conv_keys.pop(conv_id)
+        keys = self._keys[is_archived]
+        index = bisect.bisect_left(keys, key)
+        del keys[index]
+        del self._convs[conv_id]
+        return ConversationPositionChange(conv_id, is_archived,
+                                          len(keys) - index, None)
+
+    def update(self, conv):
+        """Add or move a conversation.
+
+        Returns:
+            List of ConversationPositionChange.
+        """
+        is_archived = conv.is_archived
+        key = (conv.last_modified_us, conv.id_)
+        old = self._conv_keys.get(conv.id_)
+        if old == (is_archived, key):
+            self._convs[conv.id_] = conv
+            return []
+        changes = []
+        old_position = None
+        if old is not None:
+            removed = self._remove(conv.id_)
+            if removed.is_archived == is_archived:
+                old_position = removed.old_position
+            else:
+                changes.append(removed)
+        keys = self._keys[is_archived]
+        index = bisect.bisect_left(keys, key)
+        keys.insert(index, key)
+        self._conv_keys[conv.id_] = (is_archived, key)
+        self._convs[conv.id_] = conv
+        new_position = len(keys) - 1 - index
+        if old_position != new_position:
+            changes.append(ConversationPositionChange(
+                conv.id_, is_archived, old_position, new_position
+            ))
+        return changes
+
+    def remove(self, conv_id):
+        """Remove a conversation.
+
+        Returns:
+            List of ConversationPositionChange.
+        """
+        if conv_id not in self._conv_keys:
+            return []
+        return [self._remove(conv_id)]
+
+    def iter_recent(self, include_archived):
+        """Iterate over conversations, most recent first."""
+        iterables = [reversed(self._keys[False])]
+        if include_archived:
+            iterables.append(reversed(self._keys[True]))
+        for _, conv_id in heapq.merge(*iterables, reverse=True):
+            yield self._convs[conv_id]
 
 
 class ConversationList:
@@ -899,23 +1681,36 @@ class ConversationList:
         user_list: :class:`.UserList` object.
         sync_timestamp (datetime.datetime): The time when ``conv_states`` was
             synced.
+        retention_policy (EventRetentionPolicy): (optional) Limits on the
+            events kept in memory. Defaults to keeping all events.
     """
 
-    def __init__(self, client, conv_states, user_list, sync_timestamp):
+    def __init__(self, client, conv_states, user_list, sync_timestamp,
+                 retention_policy=None):
         self._client = client  # Client
         self._conv_dict = {}  # {conv_id: Conversation}
-        self._sync_timestamp = sync_timestamp  # datetime
+        # Microsecond timestamp of the latest event received:
+        self._sync_timestamp = parsers.to_timestamp(sync_timestamp)
         self._user_list = user_list  # UserList
+        self._retention = (None if retention_policy is None else
+                           _EventRetention(retention_policy))
+        self._index = _ConversationIndex()
+        self._conv_fetches = {}  # {conv_id: asyncio.Future}
+        # {conv_id: (consecutive failures, monotonic time to retry after)}
+        self._conv_fetch_failures = {}
 
         # Initialize the list of conversations from Client's list of
         # hangouts_pb2.ConversationState.
         for conv_state in conv_states:
-            self._add_conversation(conv_state.conversation, conv_state.event,
-                                   conv_state.event_continuation_token)
+            conv = self._add_conversation(conv_state.conversation,
+                                          conv_state.event,
+                                          conv_state.event_continuation_token)
+            self._index.update(conv)
 
-        self._client.on_state_update.add_observer(self._on_state_update)
+        self._client.on_batch_update.add_observer(self._on_batch_update)
         self._client.on_connect.add_observer(self._sync)
         self._client.on_reconnect.add_observer(self._sync)
+        self._client.on_disconnect.add_observer(self._on_disconnect)
 
         self.on_event = event.Event('ConversationList.on_event')
         """
@@ -947,6 +1742,27 @@ class ConversationList:
                 :class:`~hangups.parsers.WatermarkNotification` that occurred.
         """
 
+        self.on_sync = event.Event('ConversationList.on_sync')
+        """
+        :class:`.Event` fired after catching up on events missed while
+        disconnected, once the missed events have been fired.
+
+        Args:
+            sync_stats: :class:`SyncStats` describing the catch up.
+        """
+
+        self.on_position_change = event.Event(
+            'ConversationList.on_position_change'
+        )
+        """
+        :class:`.Event` fired when a conversation is added, removed, or moves
+        in the order returned by :meth:`iter_recent`.
+
+        Args:
+            position_change: :class:`ConversationPositionChange` that
+                occurred.
+        """
+
     def get_all(self, include_archived=False):
         """Get all the conversations.
 
@@ -960,6 +1776,24 @@ class ConversationList:
         return [conv for conv in self._conv_dict.values()
                 if not conv.is_archived or include_archived]
 
+    def iter_recent(self, limit=None, include_archived=False):
+        """Iterate over conversations, most recently modified first.
+
+        The order is maintained as conversations are modified, so this does
+        not sort the conversations.
+
+        Args:
+            limit (int): (optional) Maximum number of conversations to return.
+                Defaults to all conversations.
+            include_archived (bool): (optional) Whether to include archived
+                conversations. Defaults to ``False``.
+
+        Returns:
+            Iterator of :class:`.Conversation` objects.
+        """
+        return itertools.islice(self._index.iter_recent(include_archived),
+                                limit)
+
     def get(self, conv_id):
         """Get a conversation by its ID.
 
@@ -974,6 +1808,64 @@ class ConversationList:
         """
         return self._conv_dict[conv_id]
 
+    async def broadcast(self, segments, conv_ids,
+                        concurrency=BROADCAST_CONCURRENCY, rate=None):
+        """Send the same message to many conversations.
+
+        Messages are sent concurrently. Each message is sent after any
+        message already being sent to the same conversation, using
+        :meth:`.Conversation.send_message`. The message is parsed and
+        serialized once, since serialized segments are cached. Conversations
+        which are not in the list are fetched first.
+
+        Args:
+            segments: List of :class:`.ChatMessageSegment` objects to include
+                in the message.
+            conv_ids: Iterable of IDs of conversations to send the message to.
+                Repeated IDs are ignored.
+            concurrency (int): (optional) Maximum number of messages to send
+                at the same time. Defaults to ``BROADCAST_CONCURRENCY``.
+            rate (float): (optional) Maximum number of messages to start
+                sending per second. Defaults to no limit.
+
+        Returns:
+            List of :class:`.BroadcastResult` for each conversation, in the
+            order of ``conv_ids``.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        interval = 0 if rate is None else 1 / rate
+        next_send_time = time.monotonic()
+
+        async def send(conv_id):
+            nonlocal next_send_time
+            async with semaphore:
+                # Space out the sends to stay within the rate.
+                now = time.monotonic()
+                send_time = max(now, next_send_time)
+                next_send_time = send_time + interval
+                if send_time > now:
+                    await asyncio.sleep(send_time - now)
+                start_time = time.monotonic()
+                try:
+                    conv = await self._get_or_fetch_conversation(conv_id)
+                    conv_event = await conv.send_message(segments)
+                except exceptions.NetworkError as e:
+                    conv_event, error = None, e
+                else:
+                    error = None
+                latency = datetime.timedelta(
+                    seconds=time.monotonic() - start_time
+                )
+                return BroadcastResult(conv_id, conv_event, latency, error)
+
+        conv_ids = list(collections.OrderedDict.fromkeys(conv_ids))
+        results = await asyncio.gather(*[send(conv_id)
+                                         for conv_id in conv_ids])
+        num_failed = sum(result.error is not None for result in results)
+        logger.info('Broadcast message to %s conversations (%s failed)',
+                    len(results) - num_failed, num_failed)
+        return results
+
     async def leave_conversation(self, conv_id):
         """Leave a conversation.
 
@@ -982,7 +1874,11 @@ class ConversationList:
         """
         logger.info('Leaving conversation: {}'.format(conv_id))
         await self._conv_dict[conv_id].leave()
-        del self._conv_dict[conv_id]
+        conv = self._conv_dict.pop(conv_id)
+        conv.cancel_typing_timer()
+        if self._retention is not None:
+            self._retention.remove(conv)
+        await self._fire_position_changes(self._index.remove(conv_id))
 
     def _add_conversation(self, conversation, events=[],
                           event_cont_token=None):
@@ -990,64 +1886,321 @@ class ConversationList:
         # pylint: disable=dangerous-default-value
         conv_id = conversation.conversation_id.id
         logger.debug('Adding new conversation: {}'.format(conv_id))
+        old_conv = self._conv_dict.get(conv_id)
+        if old_conv is not None:
+            old_conv.cancel_typing_timer()
+            if self._retention is not None:
+                self._retention.remove(old_conv)
         conv = Conversation(self._client, self._user_list, conversation,
-                            events, event_cont_token)
+                            events, event_cont_token, self._retention,
+                            self._update_position)
         self._conv_dict[conv_id] = conv
+        self._conv_fetch_failures.pop(conv_id, None)
         return conv
 
+    def _on_disconnect(self):
+        """Stop changing typing statuses while disconnected."""
+        for conv in self._conv_dict.values():
+            conv.cancel_typing_timer()
+
+    async def _update_position(self, conv):
+        """Update the position of a conversation after it was modified."""
+        await self._fire_position_changes(self._index.update(conv))
+
+    async def _fire_position_changes(self, position_changes):
+        """Fire on_position_change for each change."""
+        for position_change in position_changes:
+            await self.on_position_change.fire(position_change)
+
     async def _on_state_update(self, state_update):
         """Receive a StateUpdate and fan out to Conversations.
 
         Args:
             state_update: hangouts_pb2.StateUpdate instance
         """
-        # The state update will include some type of notification:
-        notification_type = state_update.WhichOneof('state_update')
+        await self._on_batch_update([state_update])
 
-        # If conversation fields have been updated, the state update will have
-        # a conversation containing changed fields. Handle updating the
-        # conversation from this delta:
-        if state_update.HasField('conversation'):
-            try:
-                await self._handle_conversation_delta(
-                    state_update.conversation
+    async def _on_event(self, event_):
+        """Receive a hangouts_pb2.Event and fan out to Conversations.
+
+        Args:
+            event_: hangouts_pb2.Event instance
+        """
+        await self._on_state_update(hangouts_pb2.StateUpdate(
+            event_notification=hangouts_pb2.EventNotification(event=event_)
+        ))
+
+    async def _on_batch_update(self, state_updates):
+        """Receive a batch of StateUpdates and fan out to Conversations.
+
+        Updates to each conversation are handled in order of arrival, but
+        coalesced: consecutive events are added together and fired in
+        timestamp order, a conversation's position is updated once for
+        consecutive deltas, and a typing or watermark notification from a user
+        replaces any earlier one in the batch.
+
+        Updates to known conversations are handled first, without waiting for
+        missing conversations to be fetched.
+
+        Args:
+            state_updates: List of hangouts_pb2.StateUpdate instances
+        """
+        # [(conv_id, kind, value)] in order of arrival, where superseded
+        # notifications are replaced by None:
+        updates = []
+        # {(kind, conv_id, UserID): index in updates}
+        notification_indices = {}
+        for state_update in state_updates:
+            # If conversation fields have been updated, the state update will
+            # have a conversation containing changed fields.
+            if state_update.HasField('conversation'):
+                updates.append((state_update.conversation.conversation_id.id,
+                                'delta', state_update.conversation))
+
+            # The state update will include some type of notification:
+            notification_type = state_update.WhichOneof('state_update')
+            if notification_type == 'typing_notification':
+                res = parsers.parse_typing_status_message(
+                    state_update.typing_notification
                 )
-            except exceptions.NetworkError:
-                logger.warning(
-                    'Discarding %s for %s: Failed to fetch conversation',
-                    notification_type.replace('_', ' '),
-                    state_update.conversation.conversation_id.id
+                update = (res.conv_id, 'typing', res)
+            elif notification_type == 'watermark_notification':
+                res = parsers.parse_watermark_notification(
+                    state_update.watermark_notification
                 )
-                return
+                update = (res.conv_id, 'watermark', res)
+            elif notification_type == 'event_notification':
+                event_ = state_update.event_notification.event
+                updates.append((event_.conversation_id.id, 'event', event_))
+                continue
+            else:
+                continue
+            key = (update[1], res.conv_id, res.user_id)
+            index = notification_indices.get(key, None)
+            if index is not None:
+                # Watermarks only move forward.
+                if (update[1] == 'watermark' and
+                        updates[index][2].read_timestamp >
+                        res.read_timestamp):
+                    continue
+                updates[index] = None
+            notification_indices[key] = len(updates)
+            updates.append(update)
+        updates = [update for update in updates if update is not None]
+
+        missing_conv_ids = ({conv_id for conv_id, _, _ in updates} -
+                            self._conv_dict.keys())
+        await self._apply_updates(
+            [update for update in updates
+             if update[0] not in missing_conv_ids],
+            self._conv_dict, is_fetched=False
+        )
+        if not missing_conv_ids:
+            return
+        missing_updates = [update for update in updates
+                           if update[0] in missing_conv_ids]
+        # Typing notifications are time-sensitive, so fire them before
+        # fetching.
+        for _, kind, res in missing_updates:
+            if kind == 'typing':
+                await self.on_typing.fire(res)
+        convs = await self._get_or_fetch_conversations(missing_conv_ids)
+        await self._apply_updates(missing_updates, convs, is_fetched=True)
+
+    async def _apply_updates(self, updates, convs, is_fetched):
+        """Apply coalesced updates to conversations in order of arrival.
 
-        if notification_type == 'typing_notification':
-            await self._handle_set_typing_notification(
-                state_update.typing_notification
-            )
-        elif notification_type == 'watermark_notification':
-            await self._handle_watermark_notification(
-                state_update.watermark_notification
-            )
-        elif notification_type == 'event_notification':
-            await self._on_event(
-                state_update.event_notification.event
+        Args:
+            updates: List of (conv_id, kind, value) tuples.
+            convs: Dict of conversation identifiers to :class:`.Conversation`,
+                omitting conversations which could not be fetched.
+            is_fetched: Whether the conversations were just fetched, so their
+                deltas are already applied and their typing notifications
+                were already fired by the conversation list.
+        """
+        # {conv_id: Conversation} with deltas applied since their position
+        # was updated:
+        moved_convs = {}
+        for is_event_run, run in itertools.groupby(
+                updates, key=lambda update: update[1] == 'event'
+        ):
+            if is_event_run:
+                await self._add_event_run(run, convs, moved_convs)
+                continue
+            for conv_id, kind, value in run:
+                if kind == 'delta':
+                    self._apply_delta(conv_id, value, convs, is_fetched,
+                                      moved_convs)
+                else:
+                    await self._fire_notification(conv_id, kind, value, convs,
+                                                  is_fetched, moved_convs)
+        for conv in moved_convs.values():
+            await self._update_position(conv)
+
+    @staticmethod
+    def _apply_delta(conv_id, delta, convs, is_fetched, moved_convs):
+        """Apply a conversation delta, deferring the position update.
+
+        Args:
+            conv_id: Conversation identifier.
+            delta: hangouts_pb2.Conversation containing changed fields.
+            convs: Dict of conversation identifiers to :class:`.Conversation`.
+            is_fetched: Whether the conversation was just fetched.
+            moved_convs: Dict of conversation identifiers to
+                :class:`.Conversation` needing their position updated.
+        """
+        conv = convs.get(conv_id, None)
+        if conv is None:
+            logger.warning('Discarding conversation delta for %s: Failed to '
+                           'fetch conversation', conv_id)
+        elif not is_fetched:
+            # Deltas for missing conversations are ignored, since the
+            # complete conversation was fetched instead.
+            conv.update_conversation(delta)
+            moved_convs[conv_id] = conv
+
+    async def _fire_notification(self, conv_id, kind, value, convs,
+                                 is_fetched, moved_convs):
+        """Fire a typing or watermark notification.
+
+        Args:
+            conv_id: Conversation identifier.
+            kind: ``'typing'`` or ``'watermark'``.
+            value: :class:`.TypingStatusMessage` or
+                :class:`.WatermarkNotification`.
+            convs: Dict of conversation identifiers to :class:`.Conversation`.
+            is_fetched: Whether the conversation was just fetched, so its
+                typing notifications were already fired by the conversation
+                list.
+            moved_convs: Dict of conversation identifiers to
+                :class:`.Conversation` needing their position updated.
+        """
+        if kind == 'watermark':
+            await self.on_watermark_notification.fire(value)
+        elif not is_fetched:
+            await self.on_typing.fire(value)
+        conv = convs.get(conv_id, None)
+        if conv is None:
+            logger.warning('Failed to fetch conversation for %s '
+                           'notification: %s', kind, conv_id)
+            return
+        if moved_convs.pop(conv_id, None) is not None:
+            await self._update_position(conv)
+        if kind == 'watermark':
+            await conv.on_watermark_notification.fire(value)
+        else:
+            await conv.on_typing.fire(value)
+
+    async def _add_event_run(self, run, convs, moved_convs):
+        """Add consecutive event notifications and fire them in order.
+
+        Args:
+            run: Iterable of (conv_id, 'event', hangouts_pb2.Event) tuples.
+            convs: Dict of conversation identifiers to :class:`.Conversation`.
+            moved_convs: Dict of conversation identifiers to
+                :class:`.Conversation` needing their position updated.
+        """
+        events = collections.defaultdict(list)  # {conv_id: [Event]}
+        for conv_id, _, event_ in run:
+            events[conv_id].append(event_)
+        conv_events = []
+        for conv_id, conv_id_events in events.items():
+            conv = convs.get(conv_id, None)
+            if conv is None:
+                logger.warning('Failed to fetch conversation for event '
+                               'notification: %s', conv_id)
+                continue
+            if moved_convs.pop(conv_id, None) is not None:
+                await self._update_position(conv)
+            self._sync_timestamp = max(
+                [self._sync_timestamp] +
+                [event_.timestamp for event_ in conv_id_events]
             )
+            # Events may be omitted if they are duplicates.
+            conv_events.extend(conv.add_events(conv_id_events))
+        conv_events.sort(key=lambda conv_event: (conv_event.timestamp_us,
+                                                 conv_event.id_))
+        for conv_event in conv_events:
+            await self.on_event.fire(conv_event)
+            await convs[conv_event.conversation_id].on_event.fire(conv_event)
+
+    async def _get_or_fetch_conversations(self, conv_ids):
+        """Get cached conversations and fetch missing conversations.
+
+        Missing conversations are fetched concurrently.
+
+        Args:
+            conv_ids: Iterable of conversation identifiers.
+
+        Returns:
+            Dict of conversation identifiers to :class:`.Conversation`,
+            omitting conversations which could not be fetched.
+        """
+        conv_ids = list(conv_ids)
+        results = await asyncio.gather(*[
+            self._get_or_fetch_conversation(conv_id) for conv_id in conv_ids
+        ], return_exceptions=True)
+        convs = {}
+        for conv_id, result in zip(conv_ids, results):
+            if isinstance(result, exceptions.NetworkError):
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            convs[conv_id] = result
+        return convs
 
     async def _get_or_fetch_conversation(self, conv_id):
         """Get a cached conversation or fetch a missing conversation.
 
+        Concurrent calls for the same missing conversation share a single
+        request. After a request fails, further calls fail immediately until
+        a backoff period has passed.
+
         Args:
             conv_id: string, conversation identifier
 
         Raises:
-            NetworkError: If the request to fetch the conversation fails.
+            NetworkError: If the request to fetch the conversation fails, or
+                failed recently.
 
         Returns:
             :class:`.Conversation` with matching ID.
         """
         conv = self._conv_dict.get(conv_id, None)
-        if conv is None:
-            logger.info('Fetching unknown conversation %s', conv_id)
+        if conv is not None:
+            return conv
+        fetch = self._conv_fetches.get(conv_id, None)
+        if fetch is None:
+            failures, retry_time = self._conv_fetch_failures.get(
+                conv_id, (0, 0)
+            )
+            if time.monotonic() < retry_time:
+                raise exceptions.NetworkError(
+                    'Not fetching conversation {} after {} failed attempts'
+                    .format(conv_id, failures)
+                )
+            fetch = asyncio.ensure_future(self._fetch_conversation(conv_id))
+            self._conv_fetches[conv_id] = fetch
+            fetch.add_done_callback(
+                lambda _: self._conv_fetches.pop(conv_id, None)
+            )
+        # Shield the shared request from cancellation of a single caller.
+        return await asyncio.shield(fetch)
+
+    async def _fetch_conversation(self, conv_id):
+        """Fetch a missing conversation and add it to the list.
+
+        Args:
+            conv_id: string, conversation identifier
+
+        Raises:
+            NetworkError: If the request to fetch the conversation fails.
+
+        Returns:
+            :class:`.Conversation` with matching ID.
+        """
+        logger.info('Fetching unknown conversation %s', conv_id)
+        try:
             res = await self._client.get_conversation(
                 hangouts_pb2.GetConversationRequest(
                     request_header=self._client.get_request_header(),
@@ -1058,125 +2211,231 @@ class ConversationList:
                     ), include_event=False
                 )
             )
+        except exceptions.NetworkError:
+            failures = self._conv_fetch_failures.get(conv_id, (0, 0))[0] + 1
+            backoff = min(FETCH_RETRY_BACKOFF_SECS * 2 ** (failures - 1),
+                          MAX_FETCH_RETRY_BACKOFF_SECS)
+            self._conv_fetch_failures[conv_id] = (
+                failures, time.monotonic() + backoff
+            )
+            logger.info('Fetching conversation %s failed %s times, not '
+                        'retrying for %s seconds', conv_id, failures, backoff)
+            raise
+        self._conv_fetch_failures.pop(conv_id, None)
+        # The conversation may have been added while the request was pending,
+        # so avoid replacing it and losing its events and observers.
+        conv = self._conv_dict.get(conv_id, None)
+        if conv is None:
             conv_state = res.conversation_state
             event_cont_token = None
             if conv_state.HasField('event_continuation_token'):
                 event_cont_token = conv_state.event_continuation_token
-            return self._add_conversation(conv_state.conversation,
+            conv = self._add_conversation(conv_state.conversation,
                                           event_cont_token=event_cont_token)
-        else:
-            return conv
+            await self._update_position(conv)
+        return conv
 
-    async def _on_event(self, event_):
-        """Receive a hangouts_pb2.Event and fan out to Conversations.
+    async def _sync(self):
+        """Sync conversation state and events that could have been missed.
 
-        Args:
-            event_: hangouts_pb2.Event instance
+        Pages of missed events are requested until the newest events have
+        been received, then any gaps in conversations are filled by requesting
+        their events. Recovered events are fired in timestamp order.
         """
-        conv_id = event_.conversation_id.id
-        try:
-            conv = await self._get_or_fetch_conversation(conv_id)
-        except exceptions.NetworkError:
-            logger.warning(
-                'Failed to fetch conversation for event notification: %s',
-                conv_id
+        start_time = time.monotonic()
+        # Filter every conversation's events using the timestamp from before
+        # the sync.
+        sync_timestamp = self._sync_timestamp
+        logger.info('Syncing events since {}'.format(
+            parsers.from_timestamp(sync_timestamp)
+        ))
+        recovered = []  # [(Conversation, ConversationEvent)]
+        gaps = {}  # {conv_id: (Conversation, EventContinuationToken, int)}
+        page_timestamp = sync_timestamp
+        num_pages = 0
+        while num_pages < MAX_SYNC_PAGES:
+            try:
+                res = await self._client.sync_all_new_events(
+                    hangouts_pb2.SyncAllNewEventsRequest(
+                        request_header=self._client.get_request_header(),
+                        last_sync_timestamp=page_timestamp,
+                        max_response_size_bytes=SYNC_MAX_RESPONSE_SIZE_BYTES,
+                    )
+                )
+            except exceptions.NetworkError as e:
+                logger.warning('Failed to sync events, some events may be '
+                               'lost: {}'.format(e))
+                break
+            num_pages += 1
+            for conv_state in res.conversation_state:
+                await self._sync_conversation_state(
+                    conv_state, sync_timestamp, recovered, gaps
+                )
+            is_full = (res.ByteSize() >=
+                       SYNC_MAX_RESPONSE_SIZE_BYTES * SYNC_PAGE_FULL_RATIO)
+            if not is_full:
+                break
+            # Each conversation in a truncated page was returned up to its
+            # newest event, and older events it is missing are filled in as a
+            # gap. Conversations left out of the page may be missing events
+            # after any of those, so the next page starts from the oldest of
+            # them. Events received again are ignored.
+            resume_timestamp = min(
+                (max(event_.timestamp for event_ in conv_state.event)
+                 for conv_state in res.conversation_state
+                 if conv_state.event),
+                default=page_timestamp
             )
-        else:
-            self._sync_timestamp = parsers.from_timestamp(event_.timestamp)
-            conv_event = conv.add_event(event_)
-            # conv_event may be None if the event was a duplicate.
-            if conv_event is not None:
-                await self.on_event.fire(conv_event)
-                await conv.on_event.fire(conv_event)
+            if resume_timestamp <= page_timestamp:
+                logger.warning('Sync response was truncated without new '
+                               'events, some events may be lost')
+                break
+            if num_pages == MAX_SYNC_PAGES:
+                logger.warning('Sync response was still truncated after {} '
+                               'pages, some events may be lost'
+                               .format(num_pages))
+                break
+            logger.info('Sync response was truncated, requesting events '
+                        'since {}'.format(
+                            parsers.from_timestamp(resume_timestamp)
+                        ))
+            page_timestamp = resume_timestamp
+
+        semaphore = asyncio.Semaphore(SYNC_BACKFILL_CONCURRENCY)
+        backfills = await asyncio.gather(*[
+            self._backfill_gap(semaphore, *gap) for gap in gaps.values()
+        ])
+        num_failed_backfills = 0
+        num_backfilled_events = 0
+        for conv, conv_events, is_failed in backfills:
+            num_failed_backfills += is_failed
+            num_backfilled_events += len(conv_events)
+            recovered.extend((conv, conv_event) for conv_event in conv_events)
+
+        recovered.sort(key=lambda item: (item[1].timestamp_us, item[1].id_))
+        if recovered:
+            self._sync_timestamp = max(self._sync_timestamp,
+                                       recovered[-1][1].timestamp_us)
+        for conv, conv_event in recovered:
+            await self.on_event.fire(conv_event)
+            await conv.on_event.fire(conv_event)
+
+        sync_stats = SyncStats(
+            duration=datetime.timedelta(seconds=time.monotonic() - start_time),
+            num_pages=num_pages,
+            num_conversations=len({conv.id_ for conv, _ in recovered}),
+            num_events=len(recovered),
+            num_backfilled_events=num_backfilled_events,
+            num_failed_backfills=num_failed_backfills,
+        )
+        logger.info('Synced {} events in {} conversations in {}'.format(
+            sync_stats.num_events, sync_stats.num_conversations,
+            sync_stats.duration
+        ))
+        await self.on_sync.fire(sync_stats)
 
-    async def _handle_conversation_delta(self, conversation):
-        """Receive Conversation delta and create or update the conversation.
+    async def _sync_conversation_state(self, conv_state, sync_timestamp,
+                                       recovered, gaps):
+        """Update a conversation from a page of missed events.
 
         Args:
-            conversation: hangouts_pb2.Conversation instance
-
-        Raises:
-            NetworkError: A request to fetch the complete conversation failed.
+            conv_state: hangouts_pb2.ConversationState instance
+            sync_timestamp: Timestamp of the last event received before the
+                sync.
+            recovered: List of (Conversation, ConversationEvent) to extend
+                with the missed events.
+            gaps: Dict of conversation IDs to (Conversation,
+                EventContinuationToken, timestamp) to update with gaps to fill.
         """
-        conv_id = conversation.conversation_id.id
+        conv_id = conv_state.conversation_id.id
         conv = self._conv_dict.get(conv_id, None)
         if conv is None:
-            # Ignore the delta and fetch the complete conversation.
-            await self._get_or_fetch_conversation(conv_id)
-        else:
-            # Update conversation using the delta.
-            conv.update_conversation(conversation)
-
-    async def _handle_set_typing_notification(self, set_typing_notification):
-        """Receive SetTypingNotification and update the conversation.
-
-        Args:
-            set_typing_notification: hangouts_pb2.SetTypingNotification
-                instance
-        """
-        conv_id = set_typing_notification.conversation_id.id
-        res = parsers.parse_typing_status_message(set_typing_notification)
-        await self.on_typing.fire(res)
-        try:
-            conv = await self._get_or_fetch_conversation(conv_id)
-        except exceptions.NetworkError:
-            logger.warning(
-                'Failed to fetch conversation for typing notification: %s',
-                conv_id
+            conv = self._add_conversation(
+                conv_state.conversation,
+                conv_state.event,
+                conv_state.event_continuation_token
             )
-        else:
-            await conv.on_typing.fire(res)
-
-    async def _handle_watermark_notification(self, watermark_notification):
-        """Receive WatermarkNotification and update the conversation.
+            await self._update_position(conv)
+            return
+        # Events at or before the newest known event were not missed.
+        known_timestamp = max(
+            sync_timestamp, conv.events[-1].timestamp_us if conv.events else 0
+        )
+        conv.update_conversation(conv_state.conversation)
+        await self._update_position(conv)
+        # Merge the missed events into the conversation in one pass.
+        conv_events = conv.add_events([
+            event_ for event_ in conv_state.event
+            if event_.timestamp > sync_timestamp
+        ])
+        recovered.extend((conv, conv_event) for conv_event in conv_events)
+        # A continuation token pointing after the last known event means only
+        # the newest of the missed events were returned.
+        if (conv_id not in gaps and
+                conv_state.HasField('event_continuation_token') and
+                conv_state.event_continuation_token.event_timestamp >
+                known_timestamp):
+            gaps[conv_id] = (conv, conv_state.event_continuation_token,
+                             known_timestamp)
+
+    async def _backfill_gap(self, semaphore, conv, event_cont_token,
+                            known_timestamp):
+        """Request missed events older than those returned by a sync.
 
         Args:
-            watermark_notification: hangouts_pb2.WatermarkNotification instance
-        """
-        conv_id = watermark_notification.conversation_id.id
-        res = parsers.parse_watermark_notification(watermark_notification)
-        await self.on_watermark_notification.fire(res)
-        try:
-            conv = await self._get_or_fetch_conversation(conv_id)
-        except exceptions.NetworkError:
-            logger.warning(
-                'Failed to fetch conversation for watermark notification: %s',
-                conv_id
-            )
-        else:
-            await conv.on_watermark_notification.fire(res)
+            semaphore: asyncio.Semaphore limiting concurrent backfills.
+            conv: :class:`.Conversation` with a gap.
+            event_cont_token: hangouts_pb2.EventContinuationToken for events
+                before the gap's newest event.
+            known_timestamp: Timestamp of the newest event known before the
+                gap.
 
-    async def _sync(self):
-        """Sync conversation state and events that could have been missed."""
-        logger.info('Syncing events since {}'.format(self._sync_timestamp))
-        try:
-            res = await self._client.sync_all_new_events(
-                hangouts_pb2.SyncAllNewEventsRequest(
-                    request_header=self._client.get_request_header(),
-                    last_sync_timestamp=parsers.to_timestamp(
-                        self._sync_timestamp
-                    ),
-                    max_response_size_bytes=1048576,  # 1 MB
-                )
-            )
-        except exceptions.NetworkError as e:
-            logger.warning('Failed to sync events, some events may be lost: {}'
-                           .format(e))
-        else:
-            for conv_state in res.conversation_state:
-                conv_id = conv_state.conversation_id.id
-                conv = self._conv_dict.get(conv_id, None)
-                if conv is not None:
-                    conv.update_conversation(conv_state.conversation)
-                    for event_ in conv_state.event:
-                        timestamp = parsers.from_timestamp(event_.timestamp)
-                        if timestamp > self._sync_timestamp:
-                            # This updates the sync_timestamp for us, as well
-                            # as triggering events.
-                            await self._on_event(event_)
-                else:
-                    self._add_conversation(
-                        conv_state.conversation,
-                        conv_state.event,
-                        conv_state.event_continuation_token
+        Returns:
+            Tuple of the conversation, a list of the
+            :class:`.ConversationEvent` that were added, and whether the gap
+            could not be completely filled.
+        """
+        conv_events = []
+        is_failed = True
+        async with semaphore:
+            logger.info('Filling gap in conversation {} after {}'.format(
+                conv.id_, parsers.from_timestamp(known_timestamp)
+            ))
+            for _ in range(MAX_SYNC_BACKFILL_PAGES):
+                try:
+                    res = await self._client.get_conversation(
+                        hangouts_pb2.GetConversationRequest(
+                            request_header=self._client.get_request_header(),
+                            conversation_spec=hangouts_pb2.ConversationSpec(
+                                conversation_id=hangouts_pb2.ConversationId(
+                                    id=conv.id_
+                                )
+                            ),
+                            include_event=True,
+                            max_events_per_conversation=(
+                                SYNC_BACKFILL_EVENTS_PER_REQUEST
+                            ),
+                            event_continuation_token=event_cont_token
+                        )
                     )
+                except exceptions.NetworkError as e:
+                    logger.warning('Failed to fill gap in conversation {}, '
+                                   'some events may be lost: {}'
+                                   .format(conv.id_, e))
+                    break
+                conv_state = res.conversation_state
+                conv_events.extend(conv.add_events([
+                    event_ for event_ in conv_state.event
+                    if event_.timestamp > known_timestamp
+                ]))
+                if (not conv_state.HasField('event_continuation_token') or
+                        any(event_.timestamp <= known_timestamp
+                            for event_ in conv_state.event) or
+                        not conv_state.event):
+                    is_failed = False
+                    break
+                event_cont_token = conv_state.event_continuation_token
+            else:
+                logger.warning('Gave up filling gap in conversation {}, some '
+                               'events may be lost'.format(conv.id_))
+        return conv, conv_events, is_failed
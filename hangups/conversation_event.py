@@ -4,12 +4,98 @@ These classes are wrappers for hangouts_pb2.Event instances. Parsing is done
 through property methods, which prefer logging warnings to raising exceptions.
 """
 
+import collections
 import logging
+import weakref
 
 from hangups import parsers, message_parser, user, hangouts_pb2
 
 logger = logging.getLogger(__name__)
 chat_message_parser = message_parser.ChatMessageParser()
+KNOWN_EMBED_ITEM_TYPES = frozenset([
+    hangouts_pb2.ITEM_TYPE_PLUS_PHOTO,
+    hangouts_pb2.ITEM_TYPE_PLACE_V2,
+    hangouts_pb2.ITEM_TYPE_PLACE,
+    hangouts_pb2.ITEM_TYPE_THING,
+])
+# Number of compacted events to keep decoded:
+DECODED_EVENT_CACHE_SIZE = 1000
+# Number of parsed and serialized messages to cache for sending:
+SEGMENT_CACHE_SIZE = 256
+
+
+SegmentCacheInfo = collections.namedtuple(
+    'SegmentCacheInfo',
+    ['parse_hits', 'parse_misses', 'serialize_hits', 'serialize_misses']
+)
+"""Hit and miss counts of the caches used by :class:`ChatMessageSegment`."""
+
+
+class _LRUCache:
+    """Least recently used cache which counts hits and misses."""
+
+    def __init__(self, size):
+        self._size = size
+        self._values = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, func, *args):
+        """Return the value of a key, calling func(*args) to create it."""
+        try:
+            value = self._values[key]
+        except KeyError:
+            self.misses += 1
+            value = func(*args)
+            self.put(key, value)
+        else:
+            self.hits += 1
+            self._values.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """Add the value of a key, evicting the least recently used key."""
+        self._values[key] = value
+        self._values.move_to_end(key)
+        if len(self._values) > self._size:
+            self._values.popitem(last=False)
+
+    def clear(self):
+        """Remove all values and reset the hit and miss counts."""
+        self._values.clear()
+        self.hits = self.misses = 0
+
+
+class _WeakKeyLRUCache(_LRUCache):
+    """Least recently used cache which does not keep its keys alive.
+
+    The value of a key is removed when the key is garbage collected.
+    """
+
+    def get(self, key, func, *args):
+        try:
+            value = self._values[weakref.ref(key)]
+        except KeyError:
+            self.misses += 1
+            value = func(*args)
+            self.put(key, value)
+        else:
+            self.hits += 1
+            self._values.move_to_end(weakref.ref(key))
+        return value
+
+    def put(self, key, value):
+        values = self._values
+        super().put(weakref.ref(key, lambda ref: values.pop(ref, None)),
+                    value)
+
+
+# {weakref(ConversationEvent): Event}
+_decoded_events = _WeakKeyLRUCache(DECODED_EVENT_CACHE_SIZE)
+# {text: ((text, segment_type, ..., link_target), ...)}
+_parsed_segments = _LRUCache(SEGMENT_CACHE_SIZE)
+# {((text, segment_type, ..., link_target), ...): serialized MessageContent}
+_serialized_segments = _LRUCache(SEGMENT_CACHE_SIZE)
 
 
 class ConversationEvent:
@@ -18,33 +104,74 @@ class ConversationEvent:
     This is a wrapper for the ``Event`` message, which may contain one of many
     subtypes, represented here as other subclasses.
 
+    The fields common to all events are copied from the message, so the
+    message may be kept serialized (see :meth:`compact`).
+
     Args:
         event: ``Event`` message.
     """
 
+    __slots__ = ('_message', '_serialized', '_id', '_timestamp',
+                 '_user_id', '_conversation_id', '__weakref__')
+
     def __init__(self, event):
-        self._event = event  # Event
+        self._message = event  # Event, or None if compacted
+        self._serialized = None  # bytes, if compacted
+        self._id = event.event_id
+        self._timestamp = event.timestamp
+        self._user_id = user.intern_user_id(event.sender_id.chat_id,
+                                            event.sender_id.gaia_id)
+        self._conversation_id = event.conversation_id.id
+
+    @property
+    def _event(self):
+        """The ``Event`` message, decoded again if the event is compacted."""
+        if self._message is not None:
+            return self._message
+        return _decoded_events.get(self, hangouts_pb2.Event.FromString,
+                                   self._serialized)
+
+    def compact(self):
+        """Keep the ``Event`` message serialized to save memory.
+
+        The message is decoded again when the content of the event is
+        accessed, and a limited number of the most recently used events are
+        kept decoded.
+
+        This method is used by :class:`.Conversation` to store events.
+        """
+        if self._message is not None:
+            self._serialized = self._message.SerializeToString()
+            _decoded_events.put(self, self._message)
+            self._message = None
 
     @property
     def timestamp(self):
         """When the event occurred (:class:`datetime.datetime`)."""
-        return parsers.from_timestamp(self._event.timestamp)
+        return parsers.from_timestamp(self._timestamp)
+
+    @property
+    def timestamp_us(self):
+        """When the event occurred in microseconds since epoch (:class:`int`).
+
+        This is cheaper than :attr:`timestamp` for comparing events.
+        """
+        return self._timestamp
 
     @property
     def user_id(self):
         """Who created the event (:class:`~hangups.user.UserID`)."""
-        return user.UserID(chat_id=self._event.sender_id.chat_id,
-                           gaia_id=self._event.sender_id.gaia_id)
+        return self._user_id
 
     @property
     def conversation_id(self):
         """ID of the conversation containing the event (:class:`str`)."""
-        return self._event.conversation_id.id
+        return self._conversation_id
 
     @property
     def id_(self):
         """ID of this event (:class:`str`)."""
-        return self._event.event_id
+        return self._id
 
 
 class ChatMessageSegment:
@@ -96,9 +223,23 @@ class ChatMessageSegment:
         Returns:
             List of :class:`ChatMessageSegment` objects.
         """
-        segment_list = chat_message_parser.parse(text)
-        return [ChatMessageSegment(segment.text, **segment.params)
-                for segment in segment_list]
+        keys = _parsed_segments.get(text, ChatMessageSegment._parse, text)
+        return [ChatMessageSegment(*key) for key in keys]
+
+    @staticmethod
+    def _parse(text):
+        """Return the keys of the segments parsed from a string."""
+        return tuple(ChatMessageSegment(segment.text, **segment.params).key
+                     for segment in chat_message_parser.parse(text))
+
+    @property
+    def key(self):
+        """The arguments to create an equal segment (:class:`tuple`).
+
+        Segments with equal keys have the same content and formatting.
+        """
+        return (self.text, self.type_, self.is_bold, self.is_italic,
+                self.is_strikethrough, self.is_underline, self.link_target)
 
     @staticmethod
     def deserialize(segment):
@@ -140,16 +281,86 @@ class ChatMessageSegment:
             segment.link_data.link_target = self.link_target
         return segment
 
+    @staticmethod
+    def serialize_segments(segments):
+        """Serialize a list of segments to a ``MessageContent`` message.
+
+        The most recently serialized lists of segments are cached, so sending
+        the same message again does not build the messages again.
+
+        Args:
+            segments: List of :class:`ChatMessageSegment` objects.
+
+        Returns:
+            Serialized ``MessageContent`` message (:class:`bytes`).
+        """
+        return _serialized_segments.get(
+            tuple(segment.key for segment in segments),
+            ChatMessageSegment._serialize_segments, segments
+        )
+
+    @staticmethod
+    def _serialize_segments(segments):
+        return hangouts_pb2.MessageContent(
+            segment=[segment.serialize() for segment in segments]
+        ).SerializeToString()
+
+    @staticmethod
+    def cache_info():
+        """Return the hit and miss counts of cached segments.
+
+        Parsing is cached by :meth:`from_str`, and serializing by
+        :meth:`serialize_segments`.
+
+        Returns:
+            :class:`SegmentCacheInfo` instance.
+        """
+        return SegmentCacheInfo(
+            _parsed_segments.hits, _parsed_segments.misses,
+            _serialized_segments.hits, _serialized_segments.misses
+        )
+
+    @staticmethod
+    def clear_cache():
+        """Remove cached segments and reset the hit and miss counts."""
+        _parsed_segments.clear()
+        _serialized_segments.clear()
+
 
 class ChatMessageEvent(ConversationEvent):
     """An event that adds a new message to a conversation.
 
     Corresponds to the ``ChatMessage`` message.
+
+    The message is parsed once, when it is first accessed, unless the event
+    is compacted. Segments are kept as immutable keys, and each access to
+    :attr:`segments` returns new segments.
     """
 
+    __slots__ = ('_text', '_segment_keys', '_attachments')
+
+    def __init__(self, event):
+        super().__init__(event)
+        self._text = None  # str
+        self._segment_keys = None  # ((text, segment_type, ...), ...)
+        self._attachments = None  # [str]
+
+    def compact(self):
+        super().compact()
+        self._text = self._segment_keys = self._attachments = None
+
     @property
     def text(self):
         """Text of the message without formatting (:class:`str`)."""
+        if self._text is not None:
+            return self._text
+        text = self._get_text()
+        if self._message is not None:
+            self._text = text
+        return text
+
+    def _get_text(self):
+        """Return the text of the message."""
         lines = ['']
         for segment in self.segments:
             if segment.type_ == hangouts_pb2.SEGMENT_TYPE_TEXT:
@@ -167,25 +378,33 @@ class ChatMessageEvent(ConversationEvent):
     @property
     def segments(self):
         """List of :class:`ChatMessageSegment` in message (:class:`list`)."""
+        if self._segment_keys is not None:
+            return [ChatMessageSegment(*key) for key in self._segment_keys]
         seg_list = self._event.chat_message.message_content.segment
-        return [ChatMessageSegment.deserialize(seg) for seg in seg_list]
+        segments = [ChatMessageSegment.deserialize(seg) for seg in seg_list]
+        if self._message is not None:
+            self._segment_keys = tuple(segment.key for segment in segments)
+        return segments
 
     @property
     def attachments(self):
         """List of attachments in the message (:class:`list`)."""
+        if self._attachments is not None:
+            return list(self._attachments)
+        attachments = self._get_attachments()
+        if self._message is not None:
+            self._attachments = attachments
+        return list(attachments)
+
+    def _get_attachments(self):
+        """Return the attachments in the message."""
         raw_attachments = self._event.chat_message.message_content.attachment
         if raw_attachments is None:
             raw_attachments = []
         attachments = []
         for attachment in raw_attachments:
             for embed_item_type in attachment.embed_item.type:
-                known_types = [
-                    hangouts_pb2.ITEM_TYPE_PLUS_PHOTO,
-                    hangouts_pb2.ITEM_TYPE_PLACE_V2,
-                    hangouts_pb2.ITEM_TYPE_PLACE,
-                    hangouts_pb2.ITEM_TYPE_THING,
-                ]
-                if embed_item_type not in known_types:
+                if embed_item_type not in KNOWN_EMBED_ITEM_TYPES:
                     logger.warning('Received chat message attachment with '
                                    'unknown embed type: %r', embed_item_type)
 
@@ -202,6 +421,8 @@ class OTREvent(ConversationEvent):
     Corresponds to the ``OTRModification`` message.
     """
 
+    __slots__ = ()
+
     @property
     def new_otr_status(self):
         """The conversation's new OTR status.
@@ -227,6 +448,8 @@ class RenameEvent(ConversationEvent):
     Corresponds to the ``ConversationRename`` message.
     """
 
+    __slots__ = ()
+
     @property
     def new_name(self):
         """The conversation's new name (:class:`str`).
@@ -250,6 +473,8 @@ class MembershipChangeEvent(ConversationEvent):
     Corresponds to the ``MembershipChange`` message.
     """
 
+    __slots__ = ()
+
     @property
     def type_(self):
         """The type of membership change.
@@ -262,7 +487,7 @@ class MembershipChangeEvent(ConversationEvent):
     @property
     def participant_ids(self):
         """:class:`~hangups.user.UserID` of users involved (:class:`list`)."""
-        return [user.UserID(chat_id=id_.chat_id, gaia_id=id_.gaia_id)
+        return [user.intern_user_id(id_.chat_id, id_.gaia_id)
                 for id_ in self._event.membership_change.participant_ids]
 
 
@@ -272,6 +497,8 @@ class HangoutEvent(ConversationEvent):
     Corresponds to the ``HangoutEvent`` message.
     """
 
+    __slots__ = ()
+
     @property
     def event_type(self):
         """The Hangout event type.
@@ -289,6 +516,8 @@ class GroupLinkSharingModificationEvent(ConversationEvent):
     Corresponds to the ``GroupLinkSharingModification`` message.
     """
 
+    __slots__ = ()
+
     @property
     def new_status(self):
         """The new group link sharing status.
@@ -0,0 +1,219 @@
+"""Ordered container for the events of a conversation."""
+
+import bisect
+import collections.abc
+import heapq
+
+
+class EventStore:
+    """Events of a conversation, ordered oldest to newest.
+
+    Events are kept sorted by timestamp, with the event ID as a tie-breaker,
+    regardless of the order they are added in. A parallel list of sort keys
+    allows the position of an event, or of a timestamp, to be found by
+    bisection. Timestamps are integer microseconds, as returned by
+    :attr:`.ConversationEvent.timestamp_us`.
+
+    Slicing returns a new list, but :meth:`view` provides a read-only
+    :class:`EventView` of the events which does not copy them.
+    """
+
+    def __init__(self):
+        self._events = []  # [ConversationEvent]
+        self._keys = []  # [(timestamp_us, event_id)], parallel to _events
+        self._keys_by_id = {}  # {event_id: (timestamp_us, event_id)}
+        self._view = EventView(self)
+
+    def __len__(self):
+        return len(self._events)
+
+    def __iter__(self):
+        return iter(self._events)
+
+    def __reversed__(self):
+        return reversed(self._events)
+
+    def __getitem__(self, index):
+        return self._events[index]
+
+    def __contains__(self, event_id):
+        return event_id in self._keys_by_id
+
+    @staticmethod
+    def _get_key(conv_event):
+        """Return the sort key of an event."""
+        return (conv_event.timestamp_us, conv_event.id_)
+
+    def view(self):
+        """Return a read-only view of the events (:class:`EventView`)."""
+        return self._view
+
+    def get(self, event_id):
+        """Return the event with the given ID.
+
+        Raises:
+            KeyError: If no such event is known.
+        """
+        return self._events[self.index(event_id)]
+
+    def index(self, event_id):
+        """Return the position of the event with the given ID.
+
+        Raises:
+            KeyError: If no such event is known.
+        """
+        return bisect.bisect_left(self._keys, self._keys_by_id[event_id])
+
+    def bisect_timestamp(self, timestamp, after=False):
+        """Return the position of the first event at or after a timestamp.
+
+        If ``after`` is ``True``, return the position of the first event after
+        the timestamp instead.
+        """
+        if after:
+            timestamp += 1
+        return bisect.bisect_left(self._keys, (timestamp,))
+
+    def between(self, start=None, end=None):
+        """Return events in a range of timestamps.
+
+        Args:
+            start: (optional) Return events at or after this timestamp.
+                Defaults to the oldest event.
+            end: (optional) Return events before this timestamp. Defaults to
+                the newest event.
+
+        Returns:
+            List of events, ordered oldest to newest.
+        """
+        start_index = 0 if start is None else self.bisect_timestamp(start)
+        end_index = (len(self._events) if end is None else
+                     self.bisect_timestamp(end))
+        return self._events[start_index:end_index]
+
+    def neighbour(self, event_id, prev=False):
+        """Return the event following another event.
+
+        Args:
+            event_id (str): ID of the event.
+            prev (bool): If ``True``, return the preceding event instead.
+
+        Raises:
+            KeyError: If no such event is known.
+
+        Returns:
+            The neighbouring event, or ``None`` if there is no such event.
+        """
+        index = self.index(event_id) + (-1 if prev else 1)
+        if 0 <= index < len(self._events):
+            return self._events[index]
+        return None
+
+    def add(self, conv_event):
+        """Add an event in timestamp order.
+
+        Returns:
+            ``False`` if an event with the same ID is already known, otherwise
+            ``True``.
+        """
+        if conv_event.id_ in self._keys_by_id:
+            return False
+        key = self._get_key(conv_event)
+        self._keys_by_id[conv_event.id_] = key
+        if not self._keys or key > self._keys[-1]:
+            # Fast path for the usual case of a new event being the newest.
+            self._keys.append(key)
+            self._events.append(conv_event)
+        else:
+            index = bisect.bisect_left(self._keys, key)
+            self._keys.insert(index, key)
+            self._events.insert(index, conv_event)
+        return True
+
+    def merge(self, conv_events):
+        """Add a batch of events in timestamp order.
+
+        The batch is sorted and merged with the events at or after its oldest
+        event in a single pass. Events with IDs that are already known are
+        skipped.
+
+        Returns:
+            List of the events that were added, ordered oldest to newest.
+        """
+        added = {}  # {event_id: (key, ConversationEvent)}
+        for conv_event in conv_events:
+            if (conv_event.id_ not in self._keys_by_id and
+                    conv_event.id_ not in added):
+                added[conv_event.id_] = (self._get_key(conv_event),
+                                         conv_event)
+        if not added:
+            return []
+        batch = sorted(added.values(), key=lambda item: item[0])
+        for key, conv_event in batch:
+            self._keys_by_id[conv_event.id_] = key
+        index = bisect.bisect_left(self._keys, batch[0][0])
+        merged = list(heapq.merge(
+            zip(self._keys[index:], self._events[index:]), batch,
+            key=lambda item: item[0]
+        ))
+        self._keys[index:] = [key for key, _ in merged]
+        self._events[index:] = [conv_event for _, conv_event in merged]
+        return [conv_event for _, conv_event in batch]
+
+    def evict_oldest(self, count):
+        """Remove up to ``count`` of the oldest events.
+
+        Returns:
+            List of the events that were removed.
+        """
+        evicted = self._events[:max(count, 0)]
+        for conv_event in evicted:
+            del self._keys_by_id[conv_event.id_]
+        del self._events[:len(evicted)]
+        del self._keys[:len(evicted)]
+        return evicted
+
+
+class EventView(collections.abc.Sequence):
+    """Read-only view of the events in an :class:`EventStore`.
+
+    The view reflects later changes to the store. Indexing, iteration and
+    membership tests do not copy the events, and slicing returns a new list.
+    """
+
+    def __init__(self, store):
+        self._store = store
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, index):
+        return self._store[index]
+
+    def __iter__(self):
+        return iter(self._store)
+
+    def __reversed__(self):
+        return reversed(self._store)
+
+    def __contains__(self, conv_event):
+        try:
+            return self._store.get(conv_event.id_) is conv_event
+        except (AttributeError, KeyError):
+            return False
+
+    def index(self, value, start=0, stop=None):
+        """Return the position of an event by bisection.
+
+        Raises:
+            ValueError: If the event is not in the view.
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if value in self:
+            index = self._store.index(value.id_)
+            if start <= index < stop:
+                return index
+        raise ValueError('{!r} is not in view'.format(value))
+
+    def __repr__(self):
+        return 'EventView({!r})'.format(list(self._store))
@@ -9,5 +9,18 @@ class NetworkError(HangupsError):
     """A network error occurred."""
 
 
+class UnexpectedStatusError(NetworkError):
+    """A request returned an unexpected HTTP status.
+
+    Args:
+        message (str): Description of the error.
+        status (int): HTTP status code of the response.
+    """
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
 class ConversationTypeError(HangupsError):
     """An action was performed on a conversation that doesn't support it."""
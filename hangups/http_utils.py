@@ -19,6 +19,8 @@ MAX_RETRIES = 3
 ORIGIN_URL = 'https://hangouts.google.com'
 
 FetchResponse = collections.namedtuple('FetchResponse', ['code', 'body'])
+UploadResponse = collections.namedtuple('UploadResponse',
+                                        ['code', 'headers', 'body'])
 
 
 class Session:
@@ -86,13 +88,57 @@ class Session:
         if res.status != 200:
             logger.info('Request returned unexpected status: %d %s',
                         res.status, res.reason)
-            raise exceptions.NetworkError(
+            raise exceptions.UnexpectedStatusError(
                 'Request return unexpected status: {}: {}'
-                .format(res.status, res.reason)
+                .format(res.status, res.reason), res.status
             )
 
         return FetchResponse(res.status, body)
 
+    async def upload(self, url, params=None, headers=None, data=None):
+        """Make an HTTP POST request with a streamed body.
+
+        Unlike :meth:`fetch`, the request is not retried, because the body may
+        only be readable once.
+
+        Args:
+            url (str): Request URL.
+            params (dict): (optional) Request query string parameters.
+            headers (dict): (optional) Request headers.
+            data: (optional) Request body data, or an async iterator of
+                :class:`bytes` chunks.
+
+        Returns:
+            UploadResponse: Response data, including the response headers.
+
+        Raises:
+            NetworkError: If the request fails.
+        """
+        logger.debug('Sending upload request to %s', url)
+        try:
+            async with self.fetch_raw('post', url, params=params,
+                                      headers=headers, data=data) as res:
+                async with async_timeout.timeout(REQUEST_TIMEOUT):
+                    body = await res.read()
+            logger.debug('Received response %d %s:\n%r',
+                         res.status, res.reason, body)
+        except asyncio.TimeoutError:
+            raise exceptions.NetworkError('Request timed out')
+        except (aiohttp.ClientError, ValueError) as err:
+            raise exceptions.NetworkError(
+                'Request connection error: {}'.format(err)
+            )
+
+        if res.status != 200:
+            logger.info('Request returned unexpected status: %d %s',
+                        res.status, res.reason)
+            raise exceptions.UnexpectedStatusError(
+                'Request return unexpected status: {}: {}'
+                .format(res.status, res.reason), res.status
+            )
+
+        return UploadResponse(res.status, res.headers, body)
+
     def fetch_raw(self, method, url, params=None, headers=None, data=None):
         """Make an HTTP request using aiohttp directly.
 
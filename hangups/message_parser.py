@@ -1,8 +1,10 @@
 """Parser for message formatting markup."""
 
+import bisect
+import collections
 import re
 
-from reparser import Parser, Token, MatchGroup
+from reparser import Parser, Token, MatchGroup, MatchType, Segment
 
 from hangups import hangouts_pb2
 
@@ -14,7 +16,8 @@ B_RIGHT = r'(?:(?=[' + BOUNDARY_CHARS + r'])|(?=$))'   # Lookahead
 
 # Regex patterns used by token definitions
 MARKDOWN_END = r'(?<![\s\\]){tag}' + B_RIGHT
-MARKDOWN_START = B_LEFT + r'(?<!\\){tag}(?!\s)(?!{tag})(?=.+%s)' % MARKDOWN_END
+MARKDOWN_START_TAG = B_LEFT + r'(?<!\\){tag}(?!\s)(?!{tag})'
+MARKDOWN_START = MARKDOWN_START_TAG + r'(?=.+%s)' % MARKDOWN_END
 markdown_link = r'(?<!\\)\[(?P<link>.+?)\]\((?P<url>.+?)\)'
 HTML_END = r'(?i)</{tag}>'
 HTML_START = r'(?i)<{tag}>(?=.+%s)' % HTML_END
@@ -33,6 +36,26 @@ newline = r'\n|\r\n'
 #   - me.you/(yeah) is matched as me.you/(yeah)
 #   - me.you/(nope)) is matched as me.you/(nope)
 #   this is useful when parsing a wrapped url: (inner.link/path_with_(parens))
+auto_link_path = r"""
+(?:
+    /
+    (?:
+        \(
+            [^\s/()]*
+            \(
+                [^\s/()]+
+            \)
+            [^\s/()]*
+        \)
+        |
+        \(
+            [^\s/()]+
+        \)
+        |
+        [^\s/(){};:!<>«»“”"'‘’`´]*
+    )*
+)*
+""".replace(' ', '').replace('\n', '')
 auto_link = r"""
 \b
 (
@@ -42,7 +65,7 @@ auto_link = r"""
             |
             (?<!@)[a-zA-Z0-9\-]{1,63}\.
             |
-            (?=\S+/)
+            (?=[a-zA-Z0-9\-]{1,63}\.)(?=\S+/)
         )
         (?:[a-zA-Z0-9\-]{1,63}\.)+
         [a-zA-Z\-]{2,63}
@@ -56,26 +79,9 @@ auto_link = r"""
     )
     (?::\d+)?
     \b(?!@)
-    (?:
-        /
-        (?:
-            \(
-                [^\s/()]*
-                \(
-                    [^\s/()]+
-                \)
-                [^\s/()]*
-            \)
-            |
-            \(
-                [^\s/()]+
-            \)
-            |
-            [^\s/(){};:!<>«»“”"'‘’`´]*
-        )*
-    )*
+    %s
 )
-""".replace(' ', '').replace('\n', '')
+""".replace(' ', '').replace('\n', '') % auto_link_path
 
 # Precompiled regex for matching protocol part of URL
 url_proto_regex = re.compile(r'(?i)^[a-z][\w-]+:/{1,3}')
@@ -145,15 +151,492 @@ class Tokens:
     ]
 
 
+# Flags of the compound regex built by reparser. The inline flag in the HTML
+# patterns makes every token case-insensitive.
+FLAGS = re.IGNORECASE | re.DOTALL
+
+
+def _delimiters(tag, start, end):
+    """Return the first character of a tag and regexes to match it.
+
+    The regexes match the opening tag, the closing tag, and the text before
+    the last closing tag. The opening tag regex does not check for a closing
+    tag, which is done using the position of the last closing tag instead.
+    """
+    return (tag[0], re.compile(start, FLAGS), re.compile(end, FLAGS),
+            re.compile(r'.*(?=%s)' % end, FLAGS))
+
+
+def _markdown_delimiters(tag):
+    escaped_tag = re.escape(tag)
+    return _delimiters(tag, MARKDOWN_START_TAG.format(tag=escaped_tag),
+                       MARKDOWN_END.format(tag=escaped_tag))
+
+
+def _html_delimiters(tag):
+    return _delimiters('<', '<{}>'.format(tag), '</{}>'.format(tag))
+
+
+# Delimiters of the formatting tokens, by token name
+delimiters = {
+    'md_bi1': _markdown_delimiters('***'),
+    'md_bi2': _markdown_delimiters('___'),
+    'md_b1': _markdown_delimiters('**'),
+    'md_b2': _markdown_delimiters('__'),
+    'md_i1': _markdown_delimiters('*'),
+    'md_i2': _markdown_delimiters('_'),
+    'md_pre3': _markdown_delimiters('```'),
+    'md_pre2': _markdown_delimiters('``'),
+    'md_pre1': _markdown_delimiters('`'),
+    'md_s': _markdown_delimiters('~~'),
+    'md_u': _markdown_delimiters('=='),
+    'html_b1': _html_delimiters('b'),
+    'html_b2': _html_delimiters('strong'),
+    'html_i1': _html_delimiters('i'),
+    'html_i2': _html_delimiters('em'),
+    'html_s1': _html_delimiters('s'),
+    'html_s2': _html_delimiters('strike'),
+    'html_s3': _html_delimiters('del'),
+    'html_u1': _html_delimiters('u'),
+    'html_u2': _html_delimiters('ins'),
+    'html_u3': _html_delimiters('mark'),
+    'html_pre': _html_delimiters('pre'),
+}
+
+# Precompiled regexes for matching parts of links and images
+md_link_separator_regex = re.compile(r'\]\(')
+md_link_end_regex = re.compile(r'\)')
+html_link_start_regex = re.compile(r'<a\s+href=[\'"]', FLAGS)
+html_link_url_end_regex = re.compile(r'[\'"](?=\s*>)')
+html_link_tag_end_regex = re.compile(r'\s*>')
+html_link_end_regex = re.compile(r'</a>', FLAGS)
+html_img_start_regex = re.compile(r'<img\s+src=[\'"]', FLAGS)
+html_img_url_end_regex = re.compile(r'[\'"](?=\s*/?>)')
+html_img_end_regex = re.compile(r'\s*/?>')
+# Precompiled regexes for matching the parts of auto-links. Only the host of
+# an auto-link may fail to match, so it is matched in parts (see
+# _MarkupScanner._match_auto_link).
+auto_link_candidate_regex = re.compile(
+    r'\b(?=https?://|[a-zA-Z0-9\-]{1,63}\.|\d{1,3}\.)', FLAGS
+)
+auto_link_proto_regex = re.compile(r'https?://', FLAGS)
+auto_link_label_regex = re.compile(r'[a-zA-Z0-9\-]{1,63}\.', FLAGS)
+auto_link_tld_regex = re.compile(r'[a-zA-Z\-]{2,63}(?::\d+)?\b(?!@)', FLAGS)
+auto_link_ip_regex = re.compile(r'\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b(?!@)',
+                                FLAGS)
+auto_link_path_regex = re.compile(auto_link_path, FLAGS)
+non_space_run_regex = re.compile(r'[^\s/]+')
+digit_run_regex = re.compile(r'[\d.]+')
+html_newline_regex = re.compile(html_newline, FLAGS)
+newline_regex = re.compile(newline)
+
+
+class _Match:
+    """Groups of a token found by _MarkupScanner, like a regex match."""
+
+    def __init__(self, groups):
+        self._groups = groups  # {group name: str}
+
+    def group(self, name):
+        """Return the value of a group."""
+        try:
+            return self._groups[name]
+        except KeyError:
+            raise IndexError(name) from None
+
+
+class _MarkupScanner:
+    """Finds the default tokens of ChatMessageParser in a single pass.
+
+    Tokens are found in the same order, and with the same precedence, as the
+    compound regex of :class:`reparser.Parser`. That regex looks ahead for a
+    closing tag after every opening tag, and for the end of every link, which
+    takes quadratic time for long messages with many unmatched tags. Instead,
+    the positions of closing tags are found once and looked up by bisection.
+
+    Similarly, the auto-link regex scans to the end of a run of domain labels,
+    or to the next slash, from every word boundary. Instead, auto-link hosts
+    are matched label by label, and the result for each label is reused.
+    """
+
+    def __init__(self, text):
+        self._text = text
+        self._positions = {}  # {regex: [start of match]}
+        self._last_positions = {}  # {regex: start of last match, or -1}
+        self._runs = {}  # {regex: ([start of match], [end of match])}
+        # {start of host: end of host, or -1 if it does not match}
+        self._host_ends = {}
+
+    def _find(self, regex, pos):
+        """Return the start of the first match at or after pos, or -1.
+
+        The regex must not match overlapping strings.
+        """
+        positions = self._positions.get(regex)
+        if positions is None:
+            positions = [match.start() for match in
+                         regex.finditer(self._text)]
+            self._positions[regex] = positions
+        index = bisect.bisect_left(positions, pos)
+        return positions[index] if index < len(positions) else -1
+
+    def _find_last(self, regex):
+        """Return the end of a match of the text before the last closing tag.
+
+        Returns -1 if there is no closing tag.
+        """
+        last_pos = self._last_positions.get(regex)
+        if last_pos is None:
+            match = regex.match(self._text)
+            last_pos = -1 if match is None else match.end()
+            self._last_positions[regex] = last_pos
+        return last_pos
+
+    def _precedes_slash(self, run_regex, pos):
+        """Return whether a match of run_regex extends from pos to a slash.
+
+        The regex must match maximal runs of characters other than slashes.
+        """
+        runs = self._runs.get(run_regex)
+        if runs is None:
+            matches = list(run_regex.finditer(self._text))
+            runs = ([match.start() for match in matches],
+                    [match.end() for match in matches])
+            self._runs[run_regex] = runs
+        starts, ends = runs
+        index = bisect.bisect_right(starts, pos) - 1
+        return (index >= 0 and pos < ends[index] and
+                self._text.startswith('/', ends[index]))
+
+    def _match_host(self, pos):
+        """Return the end of a host of zero or more labels and a TLD, or -1.
+
+        This matches ``(?:label\\.)*tld`` followed by an optional port, like
+        the auto-link regex: labels are matched greedily, so the host ends
+        after the last label followed by a valid TLD.
+        """
+        host_ends = self._host_ends
+        start = pos
+        labels = []  # [start of label]
+        while pos not in host_ends:
+            labels.append(pos)
+            match = auto_link_label_regex.match(self._text, pos)
+            if match is None:
+                break
+            pos = match.end()
+        end = host_ends.get(pos, -1)
+        for label in reversed(labels):
+            if end == -1:
+                match = auto_link_tld_regex.match(self._text, label)
+                end = -1 if match is None else match.end()
+            host_ends[label] = end
+        return host_ends[start]
+
+    def _match_labels(self, pos):
+        """Return the end of a host of one or more labels and a TLD, or -1."""
+        match = auto_link_label_regex.match(self._text, pos)
+        return -1 if match is None else self._match_host(match.end())
+
+    def _match_auto_link(self, pos):
+        """Return the end of the host of an auto-link at pos, or -1.
+
+        The alternatives of the auto-link regex are tried in the same order.
+        """
+        text = self._text
+        proto = auto_link_proto_regex.match(text, pos)
+        if proto is not None:
+            end = self._match_labels(proto.end())
+            if end != -1:
+                return end
+        label = auto_link_label_regex.match(text, pos)
+        if label is not None:
+            if pos == 0 or text[pos - 1] != '@':
+                end = self._match_labels(label.end())
+                if end != -1:
+                    return end
+            if self._precedes_slash(non_space_run_regex, pos):
+                end = self._match_host(label.end())
+                if end != -1:
+                    return end
+        if proto is not None:
+            match = auto_link_ip_regex.match(text, proto.end())
+            if match is not None:
+                return match.end()
+        if self._precedes_slash(digit_run_regex, pos):
+            match = auto_link_ip_regex.match(text, pos)
+            if match is not None:
+                return match.end()
+        return -1
+
+    def _search_auto_link(self, pos):
+        """Return the start and end of the first auto-link at or after pos.
+
+        Returns:
+            Tuple of start and end, or None.
+        """
+        for candidate in auto_link_candidate_regex.finditer(self._text, pos):
+            start = candidate.start()
+            end = self._match_auto_link(start)
+            if end != -1:
+                return start, auto_link_path_regex.match(self._text, end).end()
+        return None
+
+    def match_start(self, token, pos):
+        _, start_regex, _, last_end_regex = delimiters[token.name]
+        match = start_regex.match(self._text, pos)
+        # The closing tag must follow at least one character.
+        if (match is not None and
+                self._find_last(last_end_regex) > match.end()):
+            return match.end(), None
+        return None
+
+    def match_end(self, token, pos):
+        match = delimiters[token.name][2].match(self._text, pos)
+        return None if match is None else (match.end(), None)
+
+    def match_md_link(self, token, pos):
+        if pos > 0 and self._text[pos - 1] == '\\':
+            return None
+        link_end = self._find(md_link_separator_regex, pos + 2)
+        if link_end == -1:
+            return None
+        url_end = self._find(md_link_end_regex, link_end + 3)
+        if url_end == -1:
+            return None
+        return url_end + 1, _Match({
+            token.group_start: self._text[pos:url_end + 1],
+            'md_link_link': self._text[pos + 1:link_end],
+            'md_link_url': self._text[link_end + 2:url_end],
+        })
+
+    def match_html_link(self, token, pos):
+        match = html_link_start_regex.match(self._text, pos)
+        if match is None:
+            return None
+        url_end = self._find(html_link_url_end_regex, match.end() + 1)
+        if url_end == -1:
+            return None
+        link_start = html_link_tag_end_regex.match(self._text,
+                                                   url_end + 1).end()
+        link_end = self._find(html_link_end_regex, link_start + 1)
+        if link_end == -1:
+            return None
+        end = html_link_end_regex.match(self._text, link_end).end()
+        return end, _Match({
+            token.group_start: self._text[pos:end],
+            'html_link_link': self._text[link_start:link_end],
+            'html_link_url': self._text[match.end():url_end],
+        })
+
+    def match_html_img(self, token, pos):
+        match = html_img_start_regex.match(self._text, pos)
+        if match is None:
+            return None
+        url_end = self._find(html_img_url_end_regex, match.end() + 1)
+        if url_end == -1:
+            return None
+        end = html_img_end_regex.match(self._text, url_end + 1).end()
+        return end, _Match({
+            token.group_start: self._text[pos:end],
+            'html_img_url': self._text[match.end():url_end],
+        })
+
+    def _match_single(self, regex, token, pos):
+        match = regex.match(self._text, pos)
+        if match is None:
+            return None
+        return match.end(), _Match({token.group_start: match.group()})
+
+    def match_html_br(self, token, pos):
+        return self._match_single(html_newline_regex, token, pos)
+
+    def match_br(self, token, pos):
+        return self._match_single(newline_regex, token, pos)
+
+    def _search_markup(self, pos):
+        """Return the first token at or after pos which is not an auto-link.
+
+        Returns:
+            Tuple of token, match type, start, end and match, or None.
+        """
+        while True:
+            char_match = _MARKUP_CHAR_REGEX.search(self._text, pos)
+            if char_match is None:
+                return None
+            pos = char_match.start()
+            for token, match_type, match_func in _MARKUP[char_match.group()]:
+                result = match_func(self, token, pos)
+                if result is not None:
+                    end, match = result
+                    return token, match_type, pos, end, match
+            pos += 1
+
+    def __iter__(self):
+        """Yield tokens in the same form as _search_markup."""
+        markup = self._search_markup(0)
+        link = self._search_auto_link(0)
+        while markup is not None or link is not None:
+            # Auto-links never start with the same character as other tokens,
+            # so the earlier match wins.
+            if markup is None or (link is not None and link[0] < markup[2]):
+                start, end = link
+                result = (_AUTO_LINK_TOKEN, MatchType.single, start, end,
+                          _Match({_AUTO_LINK_TOKEN.group_start:
+                                  self._text[start:end]}))
+            else:
+                result = markup
+            yield result
+            pos = result[3]
+            # A previous search remains valid until pos passes its match.
+            if markup is not None and markup[2] < pos:
+                markup = self._search_markup(pos)
+            if link is not None and link[0] < pos:
+                link = self._search_auto_link(pos)
+
+
+def _build_markup_table():
+    """Return the tokens which start with each character, by character.
+
+    Each token is listed with its match type and a _MarkupScanner method to
+    match it, in the order they appear in the compound regex. Auto-links are
+    searched for separately.
+    """
+    single_tokens = {
+        'md_link': ('[', _MarkupScanner.match_md_link),
+        'html_link': ('<', _MarkupScanner.match_html_link),
+        'html_img': ('<', _MarkupScanner.match_html_img),
+        'html_br': ('<', _MarkupScanner.match_html_br),
+        'br': ('\r\n', _MarkupScanner.match_br),
+    }
+    table = collections.defaultdict(list)
+    for token in Tokens.markdown + Tokens.html + Tokens.basic:
+        if token.name in delimiters:
+            chars = delimiters[token.name][0]
+            entries = [(token, MatchType.start, _MarkupScanner.match_start),
+                       (token, MatchType.end, _MarkupScanner.match_end)]
+        elif token.name in single_tokens:
+            chars, match_func = single_tokens[token.name]
+            entries = [(token, MatchType.single, match_func)]
+        else:
+            continue
+        for char in chars:
+            table[char].extend(entries)
+    return dict(table)
+
+
+class _TokenStack:
+    """Stack of opened tokens, like the token stack of reparser.
+
+    Tokens can be removed from the middle of the stack, and the parameters of
+    the opened tokens are counted, so neither requires a copy of the stack.
+    """
+
+    def __init__(self):
+        self._tokens = []  # [Token or None if removed]
+        self._indices = collections.defaultdict(list)  # {Token: [index]}
+        self._param_counts = collections.Counter()  # {(name, value): count}
+
+    def __bool__(self):
+        return bool(self._tokens)
+
+    def top(self):
+        """Return the most recently opened token."""
+        return self._tokens[-1]
+
+    def params(self):
+        """Return the combined parameters of the opened tokens."""
+        return dict(item for item, count in self._param_counts.items()
+                    if count > 0)
+
+    def push(self, token):
+        """Open a token."""
+        self._indices[token].append(len(self._tokens))
+        self._tokens.append(token)
+        self._param_counts.update(token.params.items())
+
+    def remove(self, token):
+        """Close the most recently opened occurrence of a token.
+
+        Returns:
+            Whether the token was open.
+        """
+        indices = self._indices[token]
+        if not indices:
+            return False
+        self._tokens[indices.pop()] = None
+        self._param_counts.subtract(token.params.items())
+        while self._tokens and self._tokens[-1] is None:
+            self._tokens.pop()
+        return True
+
+
+_MARKUP = _build_markup_table()
+_MARKUP_CHAR_REGEX = re.compile('[%s]' % re.escape(''.join(_MARKUP)))
+_AUTO_LINK_TOKEN = Tokens.basic[0]
+
+
 class ChatMessageParser(Parser):
     """Chat message parser"""
     def __init__(self, tokens=None):
         # we add default tokens here.
+        self._has_default_tokens = not tokens
         if not tokens:
             tokens = Tokens.markdown + Tokens.html + Tokens.basic
         # pylint:disable=useless-super-delegation
         super().__init__(tokens)
 
+    def parse(self, text):
+        """Parse text to obtain list of Segments
+
+        The default tokens are parsed in linear time, with the same results as
+        :meth:`reparser.Parser.parse`.
+        """
+        if not self._has_default_tokens:
+            return super().parse(text)
+        return self._parse_default_tokens(text)
+
+    def _parse_default_tokens(self, text):
+        text = self.preprocess(text)
+        token_stack = _TokenStack()
+        last_pos = 0
+
+        for token, match_type, start_pos, end_pos, match in _MarkupScanner(
+                text):
+            params = token_stack.params()
+
+            # Should we skip interpreting tokens?
+            skip = token_stack.top().skip if token_stack else False
+
+            # Check for end token first
+            if match_type == MatchType.end:
+                if not skip or token_stack.top() is token:
+                    skip = not token_stack.remove(token)
+
+            if not skip:
+                # Append text preceding matched token
+                if start_pos > last_pos:
+                    yield Segment(self.postprocess(text[last_pos:start_pos]),
+                                  **params)
+
+                # Actions specific for start token or single token
+                if match_type == MatchType.start:
+                    token_stack.push(token)
+                elif match_type == MatchType.single:
+                    single_params = params.copy()
+                    single_params.update(token.params)
+                    single_text = (token.text if token.text is not None else
+                                   match.group(token.group_start))
+                    yield Segment(single_text, token=token, match=match,
+                                  **single_params)
+
+                # Move last position pointer to the end of matched token
+                last_pos = end_pos
+
+        # Append anything that's left
+        if last_pos < len(text):
+            yield Segment(self.postprocess(text[last_pos:]),
+                          **token_stack.params())
+
     def preprocess(self, text):
         """Preprocess text before parsing"""
         # Replace two consecutive spaces with space and non-breakable space
@@ -0,0 +1,338 @@
+"""Durable queue of outgoing chat messages."""
+
+import asyncio
+import base64
+import collections
+import json
+import logging
+import os
+import tempfile
+import time
+
+import google.protobuf.message
+
+from hangups import compat, event, exceptions, hangouts_pb2
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of messages sent at the same time across all conversations:
+OUTBOX_CONCURRENCY = 4
+# Number of times a message is tried before it is dropped from the outbox:
+MAX_SEND_ATTEMPTS = 10
+# Version of the format used to persist the outbox:
+OUTBOX_FILE_VERSION = 1
+
+
+OutboxStats = collections.namedtuple(
+    'OutboxStats', ['depth', 'num_conversations', 'oldest_age']
+)
+"""Statistics about the messages waiting in an :class:`Outbox`.
+
+Args:
+    depth (int): Number of messages waiting to be sent.
+    num_conversations (int): Number of conversations with messages waiting to
+        be sent.
+    oldest_age (float): Seconds since the oldest waiting message was queued,
+        or ``None`` if the outbox is empty.
+"""
+
+
+class _OutboxMessage:
+    """A message waiting in the outbox."""
+
+    __slots__ = ('request', 'encoded_request', 'queued_at', 'attempts',
+                 'future')
+
+    def __init__(self, request, queued_at, attempts=0, encoded_request=None):
+        self.request = request  # SendChatMessageRequest
+        self.encoded_request = encoded_request or base64.b64encode(
+            request.SerializeToString()
+        ).decode('ascii')
+        self.queued_at = queued_at  # Seconds since the epoch
+        self.attempts = attempts
+        # asyncio.Future for the response, or None if nothing is waiting for
+        # it (eg. the message was loaded from disk):
+        self.future = None
+
+
+class Outbox:
+    """Durable queue of ``SendChatMessageRequest`` messages.
+
+    Queued messages are sent while the outbox is resumed. Messages in the same
+    conversation are sent one at a time in the order they were queued, while
+    different conversations are sent concurrently up to a global limit. A
+    message that fails to send stays at the head of its conversation's queue
+    and is retried with exponential backoff, or when the outbox is next
+    resumed, until :data:`MAX_SEND_ATTEMPTS` is reached.
+
+    Messages are never rebuilt, so each retry reuses the
+    ``client_generated_id`` the message was queued with, and the server can
+    recognize a retry of a message it already received.
+
+    If a path is given, the outbox is loaded from it when created, and saved
+    to it after changes, so queued messages survive a restart. Changes made
+    in the same event loop iteration are saved together, and the file is
+    written in the default executor to avoid blocking the event loop.
+
+    Args:
+        send: Coroutine function to send a ``SendChatMessageRequest``, such as
+            :meth:`.Client.send_chat_message`.
+        path (str): (optional) Path of the file to persist the outbox to.
+        concurrency (int): (optional) Maximum number of messages to send at the
+            same time. Defaults to :data:`OUTBOX_CONCURRENCY`.
+        retry_backoff_base (int): (optional) Base term of the exponential
+            backoff between attempts to send a message. Defaults to 2.
+
+    Raises:
+        ValueError: If the file at ``path`` cannot be loaded.
+    """
+
+    def __init__(self, send, path=None, concurrency=OUTBOX_CONCURRENCY,
+                 retry_backoff_base=2):
+        self._send = send
+        self._path = path
+        self._concurrency = concurrency
+        self._retry_backoff_base = retry_backoff_base
+        # {conv_id: deque(_OutboxMessage)}, for conversations with queued
+        # messages:
+        self._queues = collections.OrderedDict()
+        self._workers = {}  # {conv_id: asyncio.Task}
+        # asyncio.Semaphore limiting concurrency (created when first needed):
+        self._semaphore = None
+        self._is_resumed = False
+        # True if the outbox changed since it was last saved:
+        self._is_dirty = False
+        # asyncio.Task saving the outbox, or None if it is saved:
+        self._save_task = None
+
+        self.on_message_sent = event.Event('Outbox.on_message_sent')
+        """
+        :class:`.Event` fired when a queued message is sent, including
+        messages loaded from the outbox file.
+
+        Args:
+            request: The ``SendChatMessageRequest`` that was sent.
+            response: The ``SendChatMessageResponse`` for the message.
+        """
+
+        self.on_message_dropped = event.Event('Outbox.on_message_dropped')
+        """
+        :class:`.Event` fired when a queued message is dropped after
+        :data:`MAX_SEND_ATTEMPTS` failed attempts, including messages loaded
+        from the outbox file.
+
+        Args:
+            request: The ``SendChatMessageRequest`` that was dropped.
+            error: The :class:`.NetworkError` of the last attempt.
+        """
+
+        if path is not None:
+            self._load()
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def get_stats(self):
+        """Return statistics about the waiting messages.
+
+        Returns:
+            :class:`OutboxStats` describing the outbox.
+        """
+        oldest = min((queue[0].queued_at for queue in self._queues.values()),
+                     default=None)
+        return OutboxStats(
+            depth=len(self),
+            num_conversations=len(self._queues),
+            oldest_age=None if oldest is None else time.time() - oldest,
+        )
+
+    async def put(self, request):
+        """Queue a message and wait for it to be sent.
+
+        The message stays queued if this coroutine is cancelled.
+
+        Args:
+            request: ``SendChatMessageRequest`` to send, with
+                ``event_request_header.conversation_id`` set.
+
+        Returns:
+            ``SendChatMessageResponse`` for the message.
+
+        Raises:
+            NetworkError: If the message could not be sent after
+                :data:`MAX_SEND_ATTEMPTS` attempts.
+        """
+        conv_id = request.event_request_header.conversation_id.id
+        if not conv_id:
+            raise ValueError('Request has no conversation ID')
+        message = _OutboxMessage(request, time.time())
+        message.future = compat.get_running_loop().create_future()
+        self._queues.setdefault(conv_id, collections.deque()).append(message)
+        self._save()
+        if self._is_resumed:
+            self._start_worker(conv_id)
+        return await asyncio.shield(message.future)
+
+    def resume(self):
+        """Start sending queued messages.
+
+        Call this when the client connects or reconnects.
+        """
+        self._is_resumed = True
+        for conv_id in self._queues:
+            self._start_worker(conv_id)
+
+    def pause(self):
+        """Stop sending queued messages after any sends in progress.
+
+        Call this when the client is disconnected.
+        """
+        self._is_resumed = False
+
+    def stop(self):
+        """Stop sending queued messages and cancel any sends in progress.
+
+        Cancelled messages stay queued.
+        """
+        self._is_resumed = False
+        for worker in self._workers.values():
+            worker.cancel()
+
+    async def flush(self):
+        """Wait until changes to the outbox are saved to its file."""
+        while self._save_task is not None:
+            await asyncio.shield(self._save_task)
+
+    def _start_worker(self, conv_id):
+        """Start sending the messages of a conversation if not already."""
+        if conv_id not in self._workers:
+            self._workers[conv_id] = asyncio.ensure_future(
+                self._send_queued(conv_id)
+            )
+
+    async def _send_queued(self, conv_id):
+        """Send the messages of a conversation in order."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        queue = self._queues[conv_id]
+        try:
+            while queue and self._is_resumed:
+                message = queue[0]
+                async with self._semaphore:
+                    try:
+                        response = await self._send(message.request)
+                    except exceptions.NetworkError as e:
+                        error = e
+                    else:
+                        error = None
+                if error is None:
+                    queue.popleft()
+                    self._save()
+                    _set_future(message, response)
+                    await self.on_message_sent.fire(message.request, response)
+                    continue
+                message.attempts += 1
+                if message.attempts >= MAX_SEND_ATTEMPTS:
+                    logger.warning(
+                        'Dropping message to %s after %s failed attempts: %s',
+                        conv_id, message.attempts, error
+                    )
+                    queue.popleft()
+                    self._save()
+                    _set_future(message, exception=error)
+                    await self.on_message_dropped.fire(message.request, error)
+                    continue
+                logger.info('Failed to send message to %s (attempt %s): %s',
+                            conv_id, message.attempts, error)
+                self._save()
+                await asyncio.sleep(
+                    self._retry_backoff_base ** message.attempts
+                )
+        finally:
+            del self._workers[conv_id]
+            if not queue:
+                del self._queues[conv_id]
+
+    def _load(self):
+        """Load queued messages from the outbox file, if it exists."""
+        try:
+            with open(self._path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            raise ValueError('Failed to load outbox from {}: {}'
+                             .format(self._path, e))
+        if data.get('version') != OUTBOX_FILE_VERSION:
+            raise ValueError('Unsupported outbox version in {}: {}'
+                             .format(self._path, data.get('version')))
+        for item in data['messages']:
+            request = hangouts_pb2.SendChatMessageRequest()
+            try:
+                request.ParseFromString(base64.b64decode(item['request']))
+            except (ValueError, google.protobuf.message.DecodeError) as e:
+                raise ValueError('Failed to load outbox from {}: {}'
+                                 .format(self._path, e))
+            message = _OutboxMessage(request, item['queued_at'],
+                                     item['attempts'], item['request'])
+            conv_id = request.event_request_header.conversation_id.id
+            self._queues.setdefault(conv_id, collections.deque()).append(
+                message
+            )
+        logger.info('Loaded %s queued messages from %s', len(self),
+                    self._path)
+
+    def _save(self):
+        """Schedule saving the outbox file with the queued messages."""
+        if self._path is None:
+            return
+        self._is_dirty = True
+        if self._save_task is None:
+            self._save_task = asyncio.ensure_future(self._save_changes())
+
+    async def _save_changes(self):
+        """Save the outbox file until there are no unsaved changes."""
+        loop = compat.get_running_loop()
+        try:
+            while self._is_dirty:
+                self._is_dirty = False
+                data = {
+                    'version': OUTBOX_FILE_VERSION,
+                    'messages': [
+                        {
+                            'request': message.encoded_request,
+                            'queued_at': message.queued_at,
+                            'attempts': message.attempts,
+                        }
+                        for queue in self._queues.values()
+                        for message in queue
+                    ],
+                }
+                await loop.run_in_executor(None, _write_file, self._path,
+                                           data)
+        finally:
+            self._save_task = None
+
+
+def _set_future(message, result=None, exception=None):
+    """Report the result of sending a message to anything waiting for it."""
+    if message.future is None or message.future.done():
+        return
+    if exception is not None:
+        message.future.set_exception(exception)
+    else:
+        message.future.set_result(result)
+
+
+def _write_file(path, data):
+    """Atomically replace a file with JSON data."""
+    dirname = os.path.dirname(os.path.abspath(path))
+    try:
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=dirname,
+                                         suffix='.tmp', delete=False) as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f.name, path)
+    except OSError as e:
+        logger.warning('Failed to save outbox to %s: %s', path, e)
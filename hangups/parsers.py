@@ -8,6 +8,8 @@ from hangups import user, hangouts_pb2
 
 
 logger = logging.getLogger(__name__)
+EPOCH = datetime.datetime.fromtimestamp(0, datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
 
 
 ##############################################################################
@@ -26,15 +28,18 @@ def from_timestamp(microsecond_timestamp):
 
 def to_timestamp(datetime_timestamp):
     """Convert UTC datetime to microsecond timestamp used by Hangouts."""
-    return int(datetime_timestamp.timestamp() * 1000000)
+    # Use integer arithmetic to avoid losing precision from floating point.
+    # Naive datetimes are assumed to be in local time, like
+    # datetime.timestamp does.
+    if datetime_timestamp.tzinfo is None:
+        datetime_timestamp = datetime_timestamp.astimezone()
+    return (datetime_timestamp - EPOCH) // MICROSECOND
 
 
 def from_participantid(participant_id):
     """Convert hangouts_pb2.ParticipantId to UserID."""
-    return user.UserID(
-        chat_id=participant_id.chat_id,
-        gaia_id=participant_id.gaia_id
-    )
+    return user.intern_user_id(participant_id.chat_id,
+                               participant_id.gaia_id)
 
 
 def to_participantid(user_id):
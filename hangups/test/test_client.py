@@ -0,0 +1,287 @@
+"""Tests for the chat client."""
+
+# pylint: disable=protected-access
+
+import asyncio
+import io
+import json
+
+import pytest
+
+from hangups import (client, conversation, exceptions, hangouts_pb2,
+                     http_utils, parsers, user)
+
+
+UPLOAD_URL = 'https://docs.google.com/upload/photos/resumable?upload_id='
+
+
+class FakeSession:
+    """Session that records image upload requests.
+
+    Each upload session N uploads an image with ID imageN. The first upload
+    request fails with interrupt_error after interrupt_after bytes, if set.
+    """
+
+    def __init__(self, interrupt_after=None, interrupt_error=None):
+        self.create_session_requests = []
+        self.upload_requests = []  # [(headers, bytes)]
+        self.received = b''
+        self.num_uploading = 0
+        self.max_num_uploading = 0
+        self._interrupt_after = interrupt_after
+        self._interrupt_error = interrupt_error or exceptions.NetworkError(
+            'Server disconnected'
+        )
+
+    async def fetch(self, *_args, data=None, **_kwargs):
+        self.create_session_requests.append(json.loads(data))
+        upload_url = UPLOAD_URL + str(len(self.create_session_requests))
+        return http_utils.FetchResponse(200, json.dumps({
+            'sessionStatus': {
+                'externalFieldTransfers': [{'putInfo': {'url': upload_url}}],
+            },
+        }).encode())
+
+    async def upload(self, url, *_args, headers=None, data=None, **_kwargs):
+        assert url.startswith(UPLOAD_URL)
+        self.num_uploading += 1
+        self.max_num_uploading = max(self.num_uploading,
+                                     self.max_num_uploading)
+        try:
+            return await self._upload(url, headers, data)
+        finally:
+            self.num_uploading -= 1
+
+    async def _upload(self, url, headers, data):
+        await asyncio.sleep(0)
+        if headers.get('X-Goog-Upload-Command') == 'query':
+            return http_utils.UploadResponse(200, {
+                'X-Goog-Upload-Size-Received': str(len(self.received)),
+            }, b'{}')
+        body = b''
+        async for chunk in data:
+            body += chunk
+            self.received += chunk
+            if (self._interrupt_after is not None and
+                    len(body) >= self._interrupt_after):
+                self._interrupt_after = None
+                self.upload_requests.append((headers, body))
+                raise self._interrupt_error
+        self.upload_requests.append((headers, body))
+        return http_utils.UploadResponse(200, {}, json.dumps({
+            'sessionStatus': {'additionalInfo': {
+                'uploader_service.GoogleRupioAdditionalInfo': {
+                    'completionInfo': {'customerSpecificInfo': {
+                        'photoid': 'image' + url[len(UPLOAD_URL):],
+                        'url': 'https://example.com/image1',
+                    }},
+                },
+            }},
+        }).encode())
+
+
+def make_client(session):
+    hangups_client = client.Client({}, retry_backoff_base=0)
+    hangups_client._session = session
+    return hangups_client
+
+
+def run_until_complete(coroutine, inline_executor=False):
+    """Run a coroutine in a new event loop.
+
+    If inline_executor is set, functions run in the default executor are run
+    immediately in the event loop's thread instead.
+    """
+    loop = asyncio.new_event_loop()
+    if inline_executor:
+        def run_in_executor(_executor, func, *args):
+            future = loop.create_future()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:  # pylint: disable=broad-except
+                future.set_exception(e)
+            return future
+        loop.run_in_executor = run_in_executor
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def upload_image(session, image_file, **kwargs):
+    return run_until_complete(
+        make_client(session).upload_image(image_file, **kwargs)
+    )
+
+
+def get_create_session_field(session):
+    request = session.create_session_requests[0]
+    return request['createSessionRequest']['fields'][0]['external']
+
+
+def test_upload_image_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(client, 'IMAGE_UPLOAD_CHUNK_SIZE', 4)
+    path = tmp_path / 'image.png'
+    path.write_bytes(b'0123456789')
+    session = FakeSession()
+    progress = []
+    assert upload_image(session, str(path),
+                        progress_callback=progress.append) == 'image1'
+    assert get_create_session_field(session)['filename'] == 'image.png'
+    assert get_create_session_field(session)['size'] == 10
+    assert session.received == b'0123456789'
+    assert [p.bytes_sent for p in progress] == [4, 8, 10]
+    assert all(p.total_bytes == 10 for p in progress)
+
+
+def test_upload_image_resumed(monkeypatch):
+    monkeypatch.setattr(client, 'IMAGE_UPLOAD_CHUNK_SIZE', 4)
+    image_file = io.BytesIO(b'xx0123456789')
+    image_file.name = 'image.png'
+    image_file.seek(2)
+    session = FakeSession(interrupt_after=4)
+    progress = []
+    uploaded_image = upload_image(session, image_file,
+                                  return_uploaded_image=True,
+                                  progress_callback=progress.append)
+    assert uploaded_image == client.UploadedImage(
+        'image1', 'https://example.com/image1'
+    )
+    assert get_create_session_field(session)['size'] == 10
+    assert [(headers.get('X-Goog-Upload-Offset'), body)
+            for headers, body in session.upload_requests] == [
+                (None, b'0123'), ('4', b'456789'),
+            ]
+    assert session.upload_requests[1][0]['content-length'] == '6'
+    # The interrupted chunk is not reported as sent.
+    assert [p.bytes_sent for p in progress] == [8, 10]
+
+
+def test_upload_image_resumed_after_server_error(monkeypatch):
+    monkeypatch.setattr(client, 'IMAGE_UPLOAD_CHUNK_SIZE', 4)
+    image_file = io.BytesIO(b'0123456789')
+    image_file.name = 'image.png'
+    session = FakeSession(interrupt_after=4, interrupt_error=(
+        exceptions.UnexpectedStatusError('Service Unavailable', 503)
+    ))
+    assert upload_image(session, image_file) == 'image1'
+    assert session.received == b'0123456789'
+    assert len(session.upload_requests) == 2
+
+
+def test_upload_image_client_error_not_resumed(monkeypatch):
+    monkeypatch.setattr(client, 'IMAGE_UPLOAD_CHUNK_SIZE', 4)
+    image_file = io.BytesIO(b'0123456789')
+    image_file.name = 'image.png'
+    session = FakeSession(interrupt_after=4, interrupt_error=(
+        exceptions.UnexpectedStatusError('Forbidden', 403)
+    ))
+    with pytest.raises(exceptions.UnexpectedStatusError):
+        upload_image(session, image_file)
+    assert len(session.upload_requests) == 1
+
+
+def test_upload_image_async_iterator():
+    async def get_chunks():
+        for chunk in [b'01234', b'56789']:
+            yield chunk
+
+    with pytest.raises(ValueError):
+        upload_image(FakeSession(), get_chunks())
+    session = FakeSession()
+    assert upload_image(session, get_chunks(), filename='a.png') == 'image1'
+    assert get_create_session_field(session)['size'] == 10
+    assert session.received == b'0123456789'
+
+
+def test_upload_images(tmp_path):
+    image_files = []
+    for num, content in enumerate([b'a', b'b', b'a', b'c', b'b', b'd']):
+        path = tmp_path / '{}.png'.format(num)
+        path.write_bytes(content)
+        image_files.append(str(path))
+    session = FakeSession()
+    # Read files inline so uploads interleave deterministically.
+    uploaded_images = run_until_complete(
+        make_client(session).upload_images(image_files, concurrency=2),
+        inline_executor=True,
+    )
+    assert len(session.create_session_requests) == 4
+    assert session.max_num_uploading == 2
+    image_ids = [uploaded_image.image_id for uploaded_image in uploaded_images]
+    assert image_ids[0] == image_ids[2]
+    assert image_ids[1] == image_ids[4]
+    assert len(set(image_ids)) == 4
+    assert sorted(set(session.received)) == sorted(b'abcd')
+
+
+def test_upload_images_failure(tmp_path):
+    path = tmp_path / 'image.png'
+    path.write_bytes(b'a')
+    results = run_until_complete(make_client(FakeSession()).upload_images(
+        [str(path), str(tmp_path / 'missing.png')], return_exceptions=True
+    ))
+    assert results[0].image_id == 'image1'
+    assert isinstance(results[1], FileNotFoundError)
+    with pytest.raises(FileNotFoundError):
+        run_until_complete(make_client(FakeSession()).upload_images(
+            [str(path), str(tmp_path / 'missing.png')]
+        ))
+
+
+def test_batch_update_fired_after_state_updates(monkeypatch):
+    """Users in a batch are known when its events are fired."""
+    self_id = user.UserID(chat_id='1', gaia_id='1')
+    alice_id = user.UserID(chat_id='2', gaia_id='2')
+    conv = hangouts_pb2.Conversation(
+        conversation_id=hangouts_pb2.ConversationId(id='c1'),
+    )
+    batch_update = hangouts_pb2.BatchUpdate(state_update=[
+        hangouts_pb2.StateUpdate(
+            conversation=hangouts_pb2.Conversation(
+                conversation_id=hangouts_pb2.ConversationId(id='c1'),
+                participant_data=[hangouts_pb2.ConversationParticipantData(
+                    id=parsers.to_participantid(alice_id),
+                    fallback_name='Alice Smith',
+                )],
+            ),
+            event_notification=hangouts_pb2.EventNotification(
+                event=hangouts_pb2.Event(
+                    conversation_id=hangouts_pb2.ConversationId(id='c1'),
+                    sender_id=parsers.to_participantid(alice_id),
+                    timestamp=1,
+                    event_id='e1',
+                    chat_message=hangouts_pb2.ChatMessage(),
+                ),
+            ),
+        ),
+    ])
+    monkeypatch.setattr(
+        client.pblite, 'decode',
+        lambda message, pblite, ignore_first_item: message.MergeFrom(
+            batch_update
+        )
+    )
+    hangups_client = client.Client({})
+    user_list = user.UserList(
+        hangups_client,
+        hangouts_pb2.Entity(
+            id=parsers.to_participantid(self_id),
+            properties=hangouts_pb2.EntityProperties(display_name='Self'),
+        ),
+        [], [],
+    )
+    conv_list = conversation.ConversationList(
+        hangups_client, [hangouts_pb2.ConversationState(conversation=conv)],
+        user_list, parsers.from_timestamp(0)
+    )
+    names = []
+    conv_list.on_event.add_observer(lambda conv_event: names.append(
+        conv_list.get('c1').get_user(conv_event.user_id).full_name
+    ))
+
+    run_until_complete(hangups_client._on_receive_array([{'p': json.dumps({
+        '2': {'2': json.dumps(['cbu'])},
+    })}]))
+    assert names == ['Alice Smith']
+    assert not user_list._unresolved_user_ids
@@ -0,0 +1,22 @@
+"""Tests for compatibility helpers."""
+
+import asyncio
+
+import pytest
+
+from hangups import compat
+
+
+def test_get_running_loop():
+    async def get_loop():
+        return compat.get_running_loop()
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(get_loop()) is loop
+    finally:
+        loop.close()
+
+
+def test_get_running_loop_not_running():
+    with pytest.raises(RuntimeError):
+        compat.get_running_loop()
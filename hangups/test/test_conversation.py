@@ -0,0 +1,1010 @@
+"""Tests for conversations and the conversation list."""
+
+# pylint: disable=protected-access
+
+import asyncio
+import datetime
+
+import pytest
+
+from hangups import (compat, conversation, conversation_event, event,
+                     exceptions, hangouts_pb2, parsers, user)
+from hangups.client import UploadedImage
+from hangups.test.utils import coroutine_test
+
+
+SELF_USER_ID = user.UserID(chat_id='1', gaia_id='1')
+OTHER_USER_ID = user.UserID(chat_id='2', gaia_id='2')
+
+
+class FakeClient:
+    """Client that records requests and returns canned responses."""
+
+    def __init__(self, get_conversation_responses=(),
+                 sync_all_new_events_responses=()):
+        self.on_connect = event.Event('FakeClient.on_connect')
+        self.on_reconnect = event.Event('FakeClient.on_reconnect')
+        self.on_disconnect = event.Event('FakeClient.on_disconnect')
+        self.on_state_update = event.Event('FakeClient.on_state_update')
+        self.on_batch_update = event.Event('FakeClient.on_batch_update')
+        self.get_conversation_requests = []
+        self.sync_all_new_events_requests = []
+        self.send_chat_message_requests = []
+        self.set_typing_requests = []
+        # {image_file: asyncio.Future of image ID}
+        self.image_uploads = {}
+        self._get_conversation_responses = list(get_conversation_responses)
+        self._sync_all_new_events_responses = list(
+            sync_all_new_events_responses
+        )
+
+    @staticmethod
+    def get_request_header():
+        return hangouts_pb2.RequestHeader()
+
+    @staticmethod
+    def get_client_generated_id():
+        return 0
+
+    async def upload_image(self, image_file, return_uploaded_image=False):
+        assert return_uploaded_image
+        future = asyncio.get_event_loop().create_future()
+        self.image_uploads[image_file] = future
+        return UploadedImage(image_id=await future, url=None)
+
+    async def send_chat_message(self, request):
+        self.send_chat_message_requests.append(request)
+        await asyncio.sleep(0)
+        return hangouts_pb2.SendChatMessageResponse(
+            created_event=hangouts_pb2.Event(
+                chat_message=hangouts_pb2.ChatMessage(
+                    message_content=request.message_content
+                )
+            )
+        )
+
+    async def set_typing(self, request):
+        self.set_typing_requests.append(request)
+        await asyncio.sleep(0)
+        return hangouts_pb2.SetTypingResponse()
+
+    async def get_conversation(self, request):
+        self.get_conversation_requests.append(request)
+        await asyncio.sleep(0)
+        response = self._get_conversation_responses.pop(0)
+        if isinstance(response, asyncio.Future):
+            response = await response
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def sync_all_new_events(self, request):
+        self.sync_all_new_events_requests.append(request)
+        return self._sync_all_new_events_responses.pop(0)
+
+
+class FakeUserList:
+    """UserList that knows only the self user."""
+
+    version = 0
+
+    @staticmethod
+    def get_user_version(_):
+        return 0
+
+    @staticmethod
+    def get_user(user_id):
+        return user.User(user_id, 'Name', None, None, None, [],
+                         user_id == SELF_USER_ID)
+
+
+def make_event(conv_id, event_id, timestamp, sender_id=OTHER_USER_ID):
+    """Return Event message for a chat message."""
+    return hangouts_pb2.Event(
+        conversation_id=hangouts_pb2.ConversationId(id=conv_id),
+        sender_id=parsers.to_participantid(sender_id),
+        timestamp=timestamp,
+        event_id=event_id,
+        chat_message=hangouts_pb2.ChatMessage(),
+    )
+
+
+def make_conversation_state(conv_id, events, event_cont_timestamp=None):
+    """Return ConversationState message for a conversation."""
+    conv_state = hangouts_pb2.ConversationState(
+        conversation_id=hangouts_pb2.ConversationId(id=conv_id),
+        conversation=hangouts_pb2.Conversation(
+            conversation_id=hangouts_pb2.ConversationId(id=conv_id),
+        ),
+        event=events,
+    )
+    if event_cont_timestamp is not None:
+        conv_state.event_continuation_token.event_timestamp = (
+            event_cont_timestamp
+        )
+    return conv_state
+
+
+def make_conversation_list(client, conv_states, retention_policy=None):
+    return conversation.ConversationList(
+        client, conv_states, FakeUserList(),
+        parsers.from_timestamp(0), retention_policy=retention_policy
+    )
+
+
+def test_retention_max_events_per_conversation():
+    conv_list = make_conversation_list(FakeClient(), [
+        make_conversation_state('c1', [
+            make_event('c1', str(i), i) for i in range(5)
+        ]),
+    ], conversation.EventRetentionPolicy(max_events_per_conversation=3))
+    conv = conv_list.get('c1')
+    assert [e.id_ for e in conv.events] == ['2', '3', '4']
+    assert conv._event_cont_token.event_id == '2'
+    assert conv._event_cont_token.event_timestamp == 2
+
+
+def test_retention_compact_events():
+    conv_list = make_conversation_list(FakeClient(), [
+        make_conversation_state('c1', [
+            make_event('c1', str(i), i) for i in range(3)
+        ]),
+    ], conversation.EventRetentionPolicy(compact_events=True))
+    conv = conv_list.get('c1')
+    conv.add_event(make_event('c1', '3', 3))
+    assert all(e._message is None for e in conv.events)
+    assert [e.id_ for e in conv.events] == ['0', '1', '2', '3']
+    assert conv.events[-1].text == ''
+
+
+def test_retention_max_total_events_evicts_least_recently_used():
+    conv_list = make_conversation_list(FakeClient(), [
+        make_conversation_state('c1', [
+            make_event('c1', 'c1-{}'.format(i), i) for i in range(3)
+        ]),
+        make_conversation_state('c2', [
+            make_event('c2', 'c2-{}'.format(i), i) for i in range(3)
+        ]),
+    ], conversation.EventRetentionPolicy(max_total_events=4))
+    assert [e.id_ for e in conv_list.get('c1').events] == ['c1-2']
+    assert len(conv_list.get('c2').events) == 3
+
+    # Using c1 makes c2 the least recently used conversation.
+    conv_list.get('c1').next_event('c1-2')
+    conv_list.get('c1').add_event(make_event('c1', 'c1-3', 3))
+    assert [e.id_ for e in conv_list.get('c1').events] == ['c1-2', 'c1-3']
+    assert [e.id_ for e in conv_list.get('c2').events] == ['c2-1', 'c2-2']
+
+
+def test_retention_max_age():
+    now = parsers.to_timestamp(datetime.datetime.now(datetime.timezone.utc))
+    hour = 3600 * 1000000
+    conv_list = make_conversation_list(FakeClient(), [
+        make_conversation_state('c1', [
+            make_event('c1', '1', now - 3 * hour),
+            make_event('c1', '2', now - 2 * hour),
+            make_event('c1', '3', now),
+        ]),
+    ], conversation.EventRetentionPolicy(
+        max_age=datetime.timedelta(minutes=150)
+    ))
+    assert [e.id_ for e in conv_list.get('c1').events] == ['2', '3']
+
+
+def test_retention_never_evicts_newest_event():
+    conv_list = make_conversation_list(FakeClient(), [
+        make_conversation_state('c1', [make_event('c1', '1', 1)]),
+        make_conversation_state('c2', [make_event('c2', '2', 2)]),
+    ], conversation.EventRetentionPolicy(max_total_events=1))
+    assert len(conv_list.get('c1').events) == 1
+    assert len(conv_list.get('c2').events) == 1
+
+
+@coroutine_test
+async def test_retention_refetches_evicted_events():
+    client = FakeClient([
+        hangouts_pb2.GetConversationResponse(
+            conversation_state=make_conversation_state('c1', [
+                make_event('c1', str(i), i) for i in range(2)
+            ]),
+        ),
+    ])
+    conv_list = make_conversation_list(client, [
+        make_conversation_state('c1', [
+            make_event('c1', str(i), i) for i in range(4)
+        ]),
+    ], conversation.EventRetentionPolicy(max_events_per_conversation=2))
+    conv = conv_list.get('c1')
+    assert conv.next_event('2', prev=True) is None
+
+    events = await conv.get_events('2')
+    assert [e.id_ for e in events] == ['0', '1']
+    assert len(client.get_conversation_requests) == 1
+    request = client.get_conversation_requests[0]
+    assert request.event_continuation_token.event_timestamp == 2
+    # Explicitly requested events are not immediately evicted again.
+    assert [e.id_ for e in conv.events] == ['0', '1', '2', '3']
+
+
+@coroutine_test
+async def test_sync_merges_events_in_timestamp_order():
+    client = FakeClient(sync_all_new_events_responses=[
+        hangouts_pb2.SyncAllNewEventsResponse(conversation_state=[
+            make_conversation_state('c1', [
+                make_event('c1', '4', 40),
+                make_event('c1', '2', 20),
+                make_event('c1', '0', 0),
+            ]),
+            make_conversation_state('c2', [
+                make_event('c2', '3', 30),
+            ]),
+        ]),
+    ])
+    conv_list = conversation.ConversationList(client, [
+        make_conversation_state('c1', [make_event('c1', '1', 10)]),
+        make_conversation_state('c2', []),
+    ], FakeUserList(), parsers.from_timestamp(10))
+    fired = []
+    conv_list.on_event.add_observer(lambda e: fired.append(e.id_))
+
+    await conv_list._sync()
+
+    assert fired == ['2', '3', '4']
+    assert [e.id_ for e in conv_list.get('c1').events] == ['1', '2', '4']
+    assert [e.id_ for e in conv_list.get('c1').get_events_between(
+        parsers.from_timestamp(15), parsers.from_timestamp(40)
+    )] == ['2']
+    assert conv_list._sync_timestamp == 40
+
+
+@coroutine_test
+async def test_sync_fills_gaps():
+    client = FakeClient(
+        get_conversation_responses=[
+            hangouts_pb2.GetConversationResponse(
+                conversation_state=make_conversation_state('c1', [
+                    make_event('c1', '3', 30),
+                ], event_cont_timestamp=30),
+            ),
+            hangouts_pb2.GetConversationResponse(
+                conversation_state=make_conversation_state('c1', [
+                    make_event('c1', '1', 10),
+                    make_event('c1', '2', 20),
+                ], event_cont_timestamp=10),
+            ),
+        ],
+        sync_all_new_events_responses=[
+            # Only c1 has a continuation token for events after the last sync.
+            hangouts_pb2.SyncAllNewEventsResponse(conversation_state=[
+                make_conversation_state('c1', [make_event('c1', '4', 40)],
+                                        event_cont_timestamp=40),
+                make_conversation_state('c2', [make_event('c2', '5', 25)],
+                                        event_cont_timestamp=5),
+            ]),
+        ],
+    )
+    conv_list = conversation.ConversationList(client, [
+        make_conversation_state('c1', [make_event('c1', '1', 10)]),
+        make_conversation_state('c2', []),
+    ], FakeUserList(), parsers.from_timestamp(10))
+    fired = []
+    conv_list.on_event.add_observer(lambda e: fired.append(e.id_))
+    fired_stats = []
+    conv_list.on_sync.add_observer(fired_stats.append)
+
+    await conv_list._sync()
+
+    assert fired == ['2', '5', '3', '4']
+    assert [e.id_ for e in conv_list.get('c1').events] == ['1', '2', '3', '4']
+    assert [r.event_continuation_token.event_timestamp
+            for r in client.get_conversation_requests] == [40, 30]
+    assert len(fired_stats) == 1
+    stats = fired_stats[0]
+    assert stats.num_pages == 1
+    assert stats.num_conversations == 2
+    assert stats.num_events == 4
+    assert stats.num_backfilled_events == 2
+    assert stats.num_failed_backfills == 0
+
+
+@coroutine_test
+async def test_sync_requests_pages_until_caught_up(monkeypatch):
+    first_page = hangouts_pb2.SyncAllNewEventsResponse(conversation_state=[
+        make_conversation_state('c1', [
+            make_event('c1', str(i), i * 10) for i in range(2, 5)
+        ]),
+    ])
+    last_page = hangouts_pb2.SyncAllNewEventsResponse(conversation_state=[
+        make_conversation_state('c1', [make_event('c1', '5', 50)]),
+    ])
+    # Only the first page is large enough to be considered truncated.
+    monkeypatch.setattr(conversation, 'SYNC_MAX_RESPONSE_SIZE_BYTES',
+                        first_page.ByteSize())
+    client = FakeClient(sync_all_new_events_responses=[first_page, last_page])
+    conv_list = conversation.ConversationList(client, [
+        make_conversation_state('c1', [make_event('c1', '1', 10)]),
+    ], FakeUserList(), parsers.from_timestamp(10))
+
+    await conv_list._sync()
+
+    assert [r.last_sync_timestamp
+            for r in client.sync_all_new_events_requests] == [10, 40]
+    assert [e.id_ for e in conv_list.get('c1').events] == [
+        '1', '2', '3', '4', '5'
+    ]
+    assert conv_list._sync_timestamp == 50
+
+
+@coroutine_test
+async def test_sync_pages_from_oldest_conversation(monkeypatch):
+    first_page = hangouts_pb2.SyncAllNewEventsResponse(conversation_state=[
+        make_conversation_state('c1', [make_event('c1', '2', 40)]),
+        make_conversation_state('c2', [make_event('c2', '3', 20)]),
+    ])
+    # c3 was left out of the first page, with an event older than c1's.
+    last_page = hangouts_pb2.SyncAllNewEventsResponse(conversation_state=[
+        make_conversation_state('c3', [make_event('c3', '4', 30)]),
+    ])
+    monkeypatch.setattr(conversation, 'SYNC_MAX_RESPONSE_SIZE_BYTES',
+                        first_page.ByteSize())
+    client = FakeClient(sync_all_new_events_responses=[first_page, last_page])
+    conv_list = conversation.ConversationList(client, [
+        make_conversation_state(conv_id, [make_event(conv_id, '1', 10)])
+        for conv_id in ['c1', 'c2', 'c3']
+    ], FakeUserList(), parsers.from_timestamp(10))
+    fired = []
+    conv_list.on_event.add_observer(lambda e: fired.append(e.id_))
+
+    await conv_list._sync()
+
+    assert [r.last_sync_timestamp
+            for r in client.sync_all_new_events_requests] == [10, 20]
+    assert fired == ['3', '4', '2']
+
+
+def make_sorted_conversation(conv_id, sort_timestamp, archived=False):
+    """Return Conversation message with the given sort timestamp."""
+    view = (hangouts_pb2.CONVERSATION_VIEW_ARCHIVED if archived else
+            hangouts_pb2.CONVERSATION_VIEW_INBOX)
+    return hangouts_pb2.Conversation(
+        conversation_id=hangouts_pb2.ConversationId(id=conv_id),
+        self_conversation_state=hangouts_pb2.UserConversationState(
+            sort_timestamp=sort_timestamp, view=[view],
+        ),
+    )
+
+
+def make_delta_state_update(conv_id, sort_timestamp, archived=False):
+    """Return StateUpdate message containing a conversation delta."""
+    return hangouts_pb2.StateUpdate(conversation=make_sorted_conversation(
+        conv_id, sort_timestamp, archived=archived
+    ))
+
+
+def get_recent_ids(conv_list, *args, **kwargs):
+    return [conv.id_ for conv in conv_list.iter_recent(*args, **kwargs)]
+
+
+@coroutine_test
+async def test_iter_recent_and_position_changes():
+    conv_list = make_conversation_list(FakeClient(), [
+        hangouts_pb2.ConversationState(conversation=make_sorted_conversation(
+            conv_id, sort_timestamp, archived=conv_id == 'a1'
+        )) for conv_id, sort_timestamp in [
+            ('c1', 10), ('c2', 30), ('c3', 20), ('a1', 25),
+        ]
+    ])
+    assert get_recent_ids(conv_list) == ['c2', 'c3', 'c1']
+    assert get_recent_ids(conv_list, 2) == ['c2', 'c3']
+    assert get_recent_ids(conv_list, include_archived=True) == [
+        'c2', 'a1', 'c3', 'c1'
+    ]
+    changes = []
+    conv_list.on_position_change.add_observer(changes.append)
+
+    await conv_list._on_batch_update([make_delta_state_update('c1', 40)])
+    assert get_recent_ids(conv_list) == ['c1', 'c2', 'c3']
+    assert changes == [conversation.ConversationPositionChange(
+        'c1', False, 2, 0
+    )]
+
+    # Unchanged positions are not reported.
+    del changes[:]
+    await conv_list._on_batch_update([make_delta_state_update('c1', 50)])
+    assert changes == []
+
+    await conv_list._on_batch_update([
+        make_delta_state_update('c2', 30, archived=True)
+    ])
+    assert get_recent_ids(conv_list) == ['c1', 'c3']
+    assert changes == [
+        conversation.ConversationPositionChange('c2', False, 1, None),
+        conversation.ConversationPositionChange('c2', True, None, 0),
+    ]
+
+
+@coroutine_test
+async def test_get_events_updates_position():
+    conv_state = hangouts_pb2.ConversationState(
+        conversation=make_sorted_conversation('c1', 40),
+        event=[make_event('c1', '1', 1)],
+    )
+    conv_state.event_continuation_token.event_timestamp = 1
+    client = FakeClient([
+        hangouts_pb2.GetConversationResponse(conversation_state=conv_state),
+    ])
+    conv_list = make_conversation_list(client, [
+        hangouts_pb2.ConversationState(conversation=make_sorted_conversation(
+            conv_id, sort_timestamp
+        ), event=[make_event(conv_id, conv_id, 2)])
+        for conv_id, sort_timestamp in [('c1', 10), ('c2', 20)]
+    ])
+    changes = []
+    conv_list.on_position_change.add_observer(changes.append)
+
+    await conv_list.get('c1').get_events('c1')
+    # The conversation returned with the events moves it to the top.
+    assert get_recent_ids(conv_list) == ['c1', 'c2']
+    assert changes == [conversation.ConversationPositionChange(
+        'c1', False, 1, 0
+    )]
+
+
+@coroutine_test
+async def test_get_or_fetch_conversation_single_flight():
+    client = FakeClient([
+        hangouts_pb2.GetConversationResponse(
+            conversation_state=make_conversation_state('c1', []),
+        ),
+    ])
+    conv_list = make_conversation_list(client, [])
+    convs = await asyncio.gather(*[
+        conv_list._get_or_fetch_conversation('c1') for _ in range(3)
+    ])
+    assert len(client.get_conversation_requests) == 1
+    assert convs[0] is convs[1] is convs[2] is conv_list.get('c1')
+    assert conv_list._conv_fetches == {}
+
+
+@coroutine_test
+async def test_get_or_fetch_conversation_failure_backoff():
+    client = FakeClient([
+        exceptions.NetworkError('failed'),
+        hangouts_pb2.GetConversationResponse(
+            conversation_state=make_conversation_state('c1', []),
+        ),
+    ])
+    conv_list = make_conversation_list(client, [])
+    for _ in range(2):
+        with pytest.raises(exceptions.NetworkError):
+            await conv_list._get_or_fetch_conversation('c1')
+    # The second call failed without making a request.
+    assert len(client.get_conversation_requests) == 1
+    assert conv_list._conv_fetch_failures['c1'][0] == 1
+
+    # Retry after the backoff has passed.
+    conv_list._conv_fetch_failures['c1'] = (1, 0)
+    conv = await conv_list._get_or_fetch_conversation('c1')
+    assert conv.id_ == 'c1'
+    assert len(client.get_conversation_requests) == 2
+    assert 'c1' not in conv_list._conv_fetch_failures
+
+
+def make_watermark_state_update(conv_id, user_id, read_timestamp):
+    """Return StateUpdate message containing a watermark notification."""
+    return hangouts_pb2.StateUpdate(
+        watermark_notification=hangouts_pb2.WatermarkNotification(
+            conversation_id=hangouts_pb2.ConversationId(id=conv_id),
+            sender_id=parsers.to_participantid(user_id),
+            latest_read_timestamp=read_timestamp,
+        ),
+    )
+
+
+@coroutine_test
+async def test_batch_update_coalesces_notifications():
+    conv_list = make_conversation_list(FakeClient(), [
+        hangouts_pb2.ConversationState(
+            conversation=make_sorted_conversation(conv_id, 10),
+            event=[make_event(conv_id, conv_id + '-0', 10)],
+        ) for conv_id in ['c1', 'c2']
+    ])
+    positions = []
+    conv_list.on_position_change.add_observer(positions.append)
+    fired = []
+    conv_list.on_event.add_observer(lambda e: fired.append(e.id_))
+    conv_events = []
+    conv_list.get('c1').on_event.add_observer(conv_events.append)
+    watermarks = []
+    conv_list.get('c1').on_watermark_notification.add_observer(
+        watermarks.append
+    )
+
+    await conv_list._on_batch_update([
+        make_delta_state_update('c1', 20),
+        make_watermark_state_update('c1', OTHER_USER_ID, 20),
+        hangouts_pb2.StateUpdate(
+            conversation=make_sorted_conversation('c1', 40),
+            event_notification=hangouts_pb2.EventNotification(
+                event=make_event('c1', 'c1-2', 40),
+            ),
+        ),
+        hangouts_pb2.StateUpdate(
+            event_notification=hangouts_pb2.EventNotification(
+                event=make_event('c2', 'c2-1', 30),
+            ),
+        ),
+        make_watermark_state_update('c1', OTHER_USER_ID, 40),
+        make_watermark_state_update('c1', OTHER_USER_ID, 30),
+    ])
+
+    # c1 moved to the front once, with the latest sort timestamp.
+    assert positions == [conversation.ConversationPositionChange(
+        'c1', False, 1, 0
+    )]
+    assert conv_list.get('c1').last_modified_us == 40
+    assert fired == ['c2-1', 'c1-2']
+    assert [e.id_ for e in conv_events] == ['c1-2']
+    assert [w.read_timestamp for w in watermarks] == [
+        parsers.from_timestamp(40)
+    ]
+    assert conv_list.get('c1').watermarks_us[OTHER_USER_ID] == 40
+    assert conv_list._sync_timestamp == 40
+
+
+def make_typing_state_update(conv_id, user_id, status):
+    """Return StateUpdate message containing a typing notification."""
+    return hangouts_pb2.StateUpdate(
+        typing_notification=hangouts_pb2.SetTypingNotification(
+            conversation_id=hangouts_pb2.ConversationId(id=conv_id),
+            sender_id=parsers.to_participantid(user_id),
+            type=status,
+        ),
+    )
+
+
+@coroutine_test
+async def test_batch_update_keeps_order_of_arrival():
+    fetch = asyncio.get_event_loop().create_future()
+    client = FakeClient(get_conversation_responses=[fetch])
+    conv_list = make_conversation_list(client, [
+        make_conversation_state('c1', []),
+    ])
+    fired = []
+    conv_list.on_event.add_observer(
+        lambda e: fired.append(('event', e.conversation_id))
+    )
+    conv_list.on_typing.add_observer(
+        lambda t: fired.append(('typing', t.conv_id))
+    )
+    conv_list.on_watermark_notification.add_observer(
+        lambda w: fired.append(('watermark', w.conv_id))
+    )
+
+    batch_update = asyncio.ensure_future(conv_list._on_batch_update([
+        make_typing_state_update('c1', OTHER_USER_ID,
+                                 hangouts_pb2.TYPING_TYPE_STARTED),
+        make_watermark_state_update('c1', OTHER_USER_ID, 10),
+        hangouts_pb2.StateUpdate(
+            event_notification=hangouts_pb2.EventNotification(
+                event=make_event('c2', '2', 20),
+            ),
+        ),
+        hangouts_pb2.StateUpdate(
+            event_notification=hangouts_pb2.EventNotification(
+                event=make_event('c1', '1', 20),
+            ),
+        ),
+        make_typing_state_update('c2', OTHER_USER_ID,
+                                 hangouts_pb2.TYPING_TYPE_STARTED),
+        make_typing_state_update('c1', OTHER_USER_ID,
+                                 hangouts_pb2.TYPING_TYPE_STOPPED),
+    ]))
+    for _ in range(10):
+        await asyncio.sleep(0)
+    # Known conversations and typing notifications don't wait for the fetch.
+    assert not batch_update.done()
+    assert fired == [('watermark', 'c1'), ('event', 'c1'), ('typing', 'c1'),
+                     ('typing', 'c2')]
+
+    fetch.set_result(hangouts_pb2.GetConversationResponse(
+        conversation_state=make_conversation_state('c2', []),
+    ))
+    await batch_update
+    assert fired[4:] == [('event', 'c2')]
+
+
+def make_conversation(events, latest_read_timestamp=0, retention=None):
+    """Return Conversation with the given read timestamp."""
+    return conversation.Conversation(
+        FakeClient(), FakeUserList(), hangouts_pb2.Conversation(
+            conversation_id=hangouts_pb2.ConversationId(id='c1'),
+            self_conversation_state=hangouts_pb2.UserConversationState(
+                self_read_state=hangouts_pb2.UserReadState(
+                    latest_read_timestamp=latest_read_timestamp,
+                ),
+            ),
+        ), events, retention=retention
+    )
+
+
+def test_unread_counts():
+    conv = make_conversation([
+        make_event('c1', '1', 10),
+        make_event('c1', '2', 20),
+        make_event('c1', '3', 30, sender_id=SELF_USER_ID),
+    ], latest_read_timestamp=10)
+    assert [e.id_ for e in conv.unread_events] == ['2', '3']
+    assert conv.unread_count == 2
+    assert conv.unread_message_count == 1
+
+    conv.add_event(make_event('c1', '4', 40))
+    conv.add_event(make_event('c1', '0', 0))
+    assert conv.unread_count == 3
+    assert conv.unread_message_count == 2
+
+    conv._on_watermark_notification(parsers.WatermarkNotification(
+        conv_id='c1', user_id=SELF_USER_ID,
+        read_timestamp=parsers.from_timestamp(30),
+    ))
+    assert [e.id_ for e in conv.unread_events] == ['4']
+    assert conv.unread_message_count == 1
+
+    conv.update_conversation(hangouts_pb2.Conversation(
+        conversation_id=hangouts_pb2.ConversationId(id='c1'),
+        self_conversation_state=hangouts_pb2.UserConversationState(
+            self_read_state=hangouts_pb2.UserReadState(
+                latest_read_timestamp=15,
+            ),
+        ),
+    ))
+    assert [e.id_ for e in conv.unread_events] == ['2', '3', '4']
+    assert conv.unread_message_count == 2
+
+
+def test_unread_counts_after_eviction():
+    conv = make_conversation([
+        make_event('c1', str(i), i * 10) for i in range(5)
+    ], latest_read_timestamp=10)
+    conv.evict_events(2)
+    assert [e.id_ for e in conv.events] == ['2', '3', '4']
+    assert conv.unread_count == 3
+    conv.evict_events(1)
+    assert conv.unread_count == 2
+    assert conv.unread_message_count == 2
+
+
+def make_read_state(user_id, read_timestamp):
+    return hangouts_pb2.UserReadState(
+        participant_id=parsers.to_participantid(user_id),
+        latest_read_timestamp=read_timestamp,
+    )
+
+
+def test_update_conversation_merges_delta():
+    conv = make_conversation([], latest_read_timestamp=10)
+    conv.update_conversation(hangouts_pb2.Conversation(
+        conversation_id=hangouts_pb2.ConversationId(id='c1'),
+        name='Name',
+        self_conversation_state=hangouts_pb2.UserConversationState(
+            sort_timestamp=20,
+            delivery_medium_option=[hangouts_pb2.DeliveryMediumOption(
+                current_default=True,
+            )],
+        ),
+    ))
+    conv.update_conversation(hangouts_pb2.Conversation(
+        conversation_id=hangouts_pb2.ConversationId(id='c1'),
+        self_conversation_state=hangouts_pb2.UserConversationState(
+            sort_timestamp=30,
+        ),
+    ))
+    # Fields missing from the delta are unchanged.
+    assert conv.name == 'Name'
+    assert conv.last_modified_us == 30
+    assert conv.latest_read_timestamp_us == 10
+    assert len(conv._conversation.self_conversation_state
+               .delivery_medium_option) == 1
+
+
+def test_update_conversation_many_participants(monkeypatch):
+    user_ids = [user.UserID(chat_id=str(i), gaia_id=str(i))
+                for i in range(150)]
+    read_states = [make_read_state(user_id, 10) for user_id in user_ids]
+    conv = make_conversation([])
+    conv.update_conversation(hangouts_pb2.Conversation(read_state=read_states))
+    assert conv.watermarks_us == {user_id: 10 for user_id in user_ids}
+
+    conversions = []
+    from_participantid = parsers.from_participantid
+    monkeypatch.setattr(parsers, 'from_participantid', lambda participant_id: (
+        conversions.append(participant_id) or
+        from_participantid(participant_id)
+    ))
+    # Unchanged read states are skipped.
+    conv.update_conversation(hangouts_pb2.Conversation(read_state=read_states))
+    assert conversions == []
+
+    # Only changed watermarks are updated.
+    read_states[5] = make_read_state(user_ids[5], 20)
+    conv.update_conversation(hangouts_pb2.Conversation(read_state=read_states))
+    assert len(conversions) == 1
+    assert conv.watermarks_us[user_ids[5]] == 20
+    assert conv.watermarks_us[user_ids[6]] == 10
+
+
+def test_seen_by():
+    third_user_id = user.UserID(chat_id='3', gaia_id='3')
+    conv = make_conversation([
+        make_event('c1', str(i), i * 10) for i in range(1, 4)
+    ])
+    for user_id, read_timestamp in [(OTHER_USER_ID, 25), (SELF_USER_ID, 30),
+                                    (third_user_id, 5)]:
+        conv._on_watermark_notification(parsers.WatermarkNotification(
+            conv_id='c1', user_id=user_id,
+            read_timestamp=parsers.from_timestamp(read_timestamp),
+        ))
+
+    def get_seen_by(*args):
+        return {event_id: {u.id_ for u in users}
+                for event_id, users in conv.get_seen_by(*args).items()}
+
+    # The current user and watermarks before the loaded events are omitted.
+    assert get_seen_by() == {'2': {OTHER_USER_ID}}
+    assert get_seen_by('2', '2') == {'2': {OTHER_USER_ID}}
+    assert get_seen_by('3') == {}
+
+    # Watermarks move to added events that were read.
+    conv.add_event(make_event('c1', '0', 0))
+    conv.add_event(make_event('c1', '2.5', 22))
+    assert get_seen_by() == {'0': {third_user_id}, '2.5': {OTHER_USER_ID}}
+
+    conv.update_conversation(hangouts_pb2.Conversation(read_state=[
+        make_read_state(third_user_id, 40),
+    ]))
+    assert get_seen_by('2.5', '3') == {
+        '2.5': {OTHER_USER_ID}, '3': {third_user_id}
+    }
+
+    conv.evict_events(4)
+    assert get_seen_by() == {'3': {third_user_id}}
+    assert conv._watermark_events == {third_user_id: '3'}
+
+
+def make_participant_data(user_id, fallback_name):
+    return hangouts_pb2.ConversationParticipantData(
+        id=parsers.to_participantid(user_id), fallback_name=fallback_name,
+    )
+
+
+def test_default_name_cached():
+    third_user_id = user.UserID(chat_id='3', gaia_id='3')
+    user_list = user.UserList(FakeClient(), hangouts_pb2.Entity(
+        id=parsers.to_participantid(SELF_USER_ID),
+    ), [], [])
+    conv = conversation.Conversation(
+        FakeClient(), user_list, hangouts_pb2.Conversation(
+            conversation_id=hangouts_pb2.ConversationId(id='c1'),
+            participant_data=[
+                make_participant_data(SELF_USER_ID, 'Self'),
+                make_participant_data(OTHER_USER_ID, 'unknown'),
+            ],
+        )
+    )
+    assert conv.get_default_name() == 'Unknown'
+    assert conv.users[1] is conv.users[1]
+
+    # Upgrading a participant's name updates the name.
+    user_list._add_user_from_conv_part(
+        make_participant_data(OTHER_USER_ID, 'Other User')
+    )
+    assert conv.get_default_name() == 'Other User'
+
+    # Changing the participants updates the name.
+    conv.update_conversation(hangouts_pb2.Conversation(participant_data=[
+        make_participant_data(SELF_USER_ID, 'Self'),
+        make_participant_data(OTHER_USER_ID, 'Other User'),
+        make_participant_data(third_user_id, 'Third User'),
+    ]))
+    assert conv.get_default_name() == 'Other, Unknown'
+    user_list._add_user_from_conv_part(
+        make_participant_data(third_user_id, 'Third User')
+    )
+    assert conv.get_default_name() == 'Other, Third'
+
+    # Adding other users keeps the cached participants.
+    users = conv._get_users()
+    user_list._add_user_from_conv_part(
+        make_participant_data(user.UserID(chat_id='4', gaia_id='4'), 'Fourth')
+    )
+    assert conv._get_users() is users
+    assert conv.get_default_name() == 'Other, Third'
+
+
+@coroutine_test
+async def test_send_message_uploads_images_outside_lock():
+    client = FakeClient()
+    conv = make_conversation_list(client, [
+        make_conversation_state('c1', [make_event('c1', '1', 1)]),
+    ]).get('c1')
+
+    def send(text, image_file=None):
+        segments = conversation_event.ChatMessageSegment.from_str(text)
+        return asyncio.ensure_future(conv.send_message(segments, image_file))
+
+    def get_sent():
+        return [(request.message_content.segment[0].text,
+                 request.existing_media.photo.photo_id)
+                for request in client.send_chat_message_requests]
+
+    image_sends = [send('first image', 'file1'), send('second image', 'file2')]
+    assert (await asyncio.wait_for(send('text'), 1)).text == 'text'
+    assert get_sent() == [('text', '')]
+
+    # Messages with images are sent in order, after their upload.
+    client.image_uploads['file2'].set_result('image2')
+    await asyncio.sleep(0)
+    assert get_sent() == [('text', '')]
+    client.image_uploads['file1'].set_result('image1')
+    await asyncio.gather(*image_sends)
+    assert get_sent() == [('text', ''), ('first image', 'image1'),
+                          ('second image', 'image2')]
+    assert conv._image_message_sent is None
+
+
+@coroutine_test
+async def test_send_message_failed_upload():
+    client = FakeClient()
+    conv = make_conversation_list(client, [
+        make_conversation_state('c1', [make_event('c1', '1', 1)]),
+    ]).get('c1')
+    segments = conversation_event.ChatMessageSegment.from_str('image')
+    failed_send = asyncio.ensure_future(conv.send_message(segments, 'file1'))
+    send = asyncio.ensure_future(conv.send_message(segments, 'file2'))
+    await asyncio.sleep(0)
+    client.image_uploads['file1'].set_exception(exceptions.NetworkError())
+    client.image_uploads['file2'].set_result('image2')
+    with pytest.raises(exceptions.NetworkError):
+        await failed_send
+    await send
+    assert len(client.send_chat_message_requests) == 1
+
+
+@coroutine_test
+async def test_broadcast():
+    client = FakeClient(get_conversation_responses=[
+        exceptions.NetworkError(),
+    ])
+    conv_list = make_conversation_list(client, [
+        make_conversation_state('c1', [make_event('c1', '1', 1)]),
+        make_conversation_state('c2', [make_event('c2', '1', 1)]),
+    ])
+    segments = conversation_event.ChatMessageSegment.from_str('hello')
+    start_time = asyncio.get_event_loop().time()
+    results = await conv_list.broadcast(segments, ['c2', 'c1', 'c2', 'c3'],
+                                        concurrency=2, rate=100)
+    # Sending starts at most every 10 ms.
+    assert asyncio.get_event_loop().time() - start_time >= 0.02
+    assert [result.conv_id for result in results] == ['c2', 'c1', 'c3']
+    assert [result.event.text for result in results[:2]] == ['hello'] * 2
+    assert isinstance(results[2].error, exceptions.NetworkError)
+    assert results[2].event is None
+    assert all(isinstance(result.latency, datetime.timedelta)
+               for result in results)
+    assert [request.event_request_header.conversation_id.id
+            for request in client.send_chat_message_requests] == ['c2', 'c1']
+
+
+class FakeClock:
+    """Clock whose time only passes when advance is called."""
+
+    def __init__(self):
+        self.time = 0.0
+        self._sleepers = []  # [(wake time, asyncio.Future)]
+
+    def monotonic(self):
+        return self.time
+
+    async def sleep(self, delay):
+        future = compat.get_running_loop().create_future()
+        self._sleepers.append((self.time + delay, future))
+        await future
+
+    async def advance(self, secs):
+        """Advance the time and let woken sleepers run."""
+        await self._run_ready_tasks()
+        self.time += secs
+        for wake_time, future in self._sleepers:
+            if wake_time <= self.time and not future.done():
+                future.set_result(None)
+        self._sleepers = [(wake_time, future)
+                          for wake_time, future in self._sleepers
+                          if not future.done()]
+        await self._run_ready_tasks()
+
+    @staticmethod
+    async def _run_ready_tasks():
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+
+def set_fake_clock(conv):
+    clock = FakeClock()
+    conv._typing_status = conversation._TypingStatus(
+        conv._send_typing, clock.monotonic, clock.sleep
+    )
+    return clock
+
+
+def get_sent_typing_types(client):
+    return [request.type for request in client.set_typing_requests]
+
+
+@coroutine_test
+async def test_set_typing():
+    conv = make_conversation([])
+    clock = set_fake_clock(conv)
+
+    def get_sent_types():
+        return get_sent_typing_types(conv._client)
+
+    for _ in range(10):
+        await conv.set_typing(pause_after=1, stop_after=2)
+    assert get_sent_types() == [hangouts_pb2.TYPING_TYPE_STARTED]
+    await clock.advance(1)
+    assert get_sent_types() == [hangouts_pb2.TYPING_TYPE_STARTED,
+                                hangouts_pb2.TYPING_TYPE_PAUSED]
+    await clock.advance(1)
+    assert get_sent_types() == [hangouts_pb2.TYPING_TYPE_STARTED,
+                                hangouts_pb2.TYPING_TYPE_PAUSED,
+                                hangouts_pb2.TYPING_TYPE_STOPPED]
+    await conv.set_typing(hangouts_pb2.TYPING_TYPE_STOPPED)
+    assert len(get_sent_types()) == 3
+
+    await conv.set_typing(pause_after=None, stop_after=None)
+    await conv.set_typing(pause_after=None, stop_after=None)
+    assert len(get_sent_types()) == 4
+    # Typing is sent again once the previous status could have expired.
+    await clock.advance(conversation.TYPING_REFRESH_SECS)
+    await conv.set_typing()
+    assert len(get_sent_types()) == 5
+    # Sending a message stops typing.
+    await conv.send_message(
+        conversation_event.ChatMessageSegment.from_str('hello')
+    )
+    await conv.set_typing(hangouts_pb2.TYPING_TYPE_STOPPED)
+    assert len(get_sent_types()) == 5
+    await conv.set_typing()
+    await conv.set_typing(hangouts_pb2.TYPING_TYPE_STOPPED)
+    assert get_sent_types()[5:] == [hangouts_pb2.TYPING_TYPE_STARTED,
+                                    hangouts_pb2.TYPING_TYPE_STOPPED]
+
+
+@coroutine_test
+async def test_set_typing_cancelled_on_disconnect():
+    client = FakeClient()
+    conv_list = make_conversation_list(client, [
+        make_conversation_state('c1', []),
+    ])
+    conv = conv_list.get('c1')
+    clock = set_fake_clock(conv)
+    await conv.set_typing(pause_after=1, stop_after=2)
+    await client.on_disconnect.fire()
+    await clock.advance(2)
+    assert get_sent_typing_types(client) == [hangouts_pb2.TYPING_TYPE_STARTED]
+    assert conv._typing_status._timer is None
+
+
+@coroutine_test
+async def test_set_typing_cancelled_when_conversation_replaced():
+    client = FakeClient()
+    conv_list = make_conversation_list(client, [
+        make_conversation_state('c1', []),
+    ])
+    conv = conv_list.get('c1')
+    clock = set_fake_clock(conv)
+    await conv.set_typing(pause_after=1, stop_after=2)
+    conv_list._add_conversation(make_conversation_state('c1', []).conversation)
+    assert conv_list.get('c1') is not conv
+    await clock.advance(2)
+    assert get_sent_typing_types(client) == [hangouts_pb2.TYPING_TYPE_STARTED]
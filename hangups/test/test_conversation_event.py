@@ -0,0 +1,167 @@
+"""Tests for conversation events."""
+
+# pylint: disable=protected-access
+
+from hangups import conversation_event, hangouts_pb2
+
+
+def make_chat_message_event(event_id='e1'):
+    return conversation_event.ChatMessageEvent(hangouts_pb2.Event(
+        conversation_id=hangouts_pb2.ConversationId(id='c1'),
+        sender_id=hangouts_pb2.ParticipantId(chat_id='1', gaia_id='1'),
+        event_id=event_id,
+        timestamp=1000,
+        chat_message=hangouts_pb2.ChatMessage(
+            message_content=hangouts_pb2.MessageContent(segment=[
+                hangouts_pb2.Segment(type=hangouts_pb2.SEGMENT_TYPE_TEXT,
+                                     text='hello'),
+                hangouts_pb2.Segment(
+                    type=hangouts_pb2.SEGMENT_TYPE_LINE_BREAK, text='\n'
+                ),
+                hangouts_pb2.Segment(type=hangouts_pb2.SEGMENT_TYPE_TEXT,
+                                     text='world'),
+            ]),
+        ),
+    ))
+
+
+def test_chat_message_event_parsed_once(monkeypatch):
+    conv_event = make_chat_message_event()
+    deserialized = []
+    deserialize = conversation_event.ChatMessageSegment.deserialize
+    monkeypatch.setattr(conversation_event.ChatMessageSegment, 'deserialize',
+                        lambda segment: (deserialized.append(segment) or
+                                         deserialize(segment)))
+    assert conv_event.text == 'hello\nworld'
+    assert conv_event.text == 'hello\nworld'
+    assert len(deserialized) == 3
+
+    # Changing the returned list does not change the event.
+    segments = conv_event.segments
+    segments.pop()
+    assert len(conv_event.segments) == 3
+    assert len(deserialized) == 3
+
+
+def test_chat_message_event_segments_not_shared():
+    conv_event = make_chat_message_event()
+    for _ in range(2):
+        # Changing a returned segment does not change the event.
+        conv_event.segments[0].text = 'MUTATED'
+        assert conv_event.segments[0].text == 'hello'
+        assert conv_event.text == 'hello\nworld'
+
+
+def test_conversation_events_have_no_instance_dict():
+    assert not hasattr(make_chat_message_event(), '__dict__')
+    assert not hasattr(conversation_event.RenameEvent(hangouts_pb2.Event()),
+                       '__dict__')
+
+
+def test_compact_event(monkeypatch):
+    monkeypatch.setattr(conversation_event, '_decoded_events',
+                        conversation_event._WeakKeyLRUCache(1))
+    conv_event = make_chat_message_event()
+    conv_event.compact()
+    assert conv_event._message is None
+    assert conv_event.id_ == 'e1'
+    assert conv_event.timestamp_us == 1000
+    assert conv_event.user_id.chat_id == '1'
+    assert conv_event.conversation_id == 'c1'
+    assert conv_event.text == 'hello\nworld'
+    assert len(conv_event.segments) == 3
+
+
+def test_compact_event_decoded_lazily(monkeypatch):
+    monkeypatch.setattr(conversation_event, '_decoded_events',
+                        conversation_event._WeakKeyLRUCache(1))
+    decoded = []
+    from_string = hangouts_pb2.Event.FromString
+    monkeypatch.setattr(hangouts_pb2.Event, 'FromString',
+                        lambda data: decoded.append(data) or from_string(data))
+    event1 = make_chat_message_event('e1')
+    event2 = make_chat_message_event('e2')
+    event1.compact()
+    event2.compact()
+    # Only the most recently compacted event is still decoded.
+    assert event2.text == 'hello\nworld'
+    assert not decoded
+    assert event1.text == 'hello\nworld'
+    assert event1.text == 'hello\nworld'
+    assert len(decoded) == 1
+    assert event2.id_ == 'e2'
+    assert len(decoded) == 1
+    assert event2.text == 'hello\nworld'
+    assert len(decoded) == 2
+
+
+def test_decoded_events_do_not_keep_events_alive(monkeypatch):
+    monkeypatch.setattr(conversation_event, '_decoded_events',
+                        conversation_event._WeakKeyLRUCache(2))
+    event1 = make_chat_message_event('e1')
+    event2 = make_chat_message_event('e2')
+    event1.compact()
+    event2.compact()
+    assert len(conversation_event._decoded_events._values) == 2
+    del event1
+    assert len(conversation_event._decoded_events._values) == 1
+    assert event2.text == 'hello\nworld'
+    assert conversation_event._decoded_events.misses == 0
+
+
+def test_segment_key():
+    segment = conversation_event.ChatMessageSegment(
+        'link', is_bold=True, link_target='http://example.com'
+    )
+    copy = conversation_event.ChatMessageSegment(*segment.key)
+    assert copy.key == segment.key
+    assert copy.type_ == hangouts_pb2.SEGMENT_TYPE_LINK
+    copy.is_italic = True
+    assert copy.key != segment.key
+
+
+def test_segments_from_str_cached():
+    conversation_event.ChatMessageSegment.clear_cache()
+    text = '**bold** www.example.com'
+    segments = conversation_event.ChatMessageSegment.from_str(text)
+    segments[0].text = 'changed'
+    segments = conversation_event.ChatMessageSegment.from_str(text)
+    assert [(s.text, s.is_bold, s.link_target) for s in segments] == [
+        ('bold', True, None),
+        (' ', False, None),
+        ('www.example.com', False, 'http://www.example.com'),
+    ]
+    assert conversation_event.ChatMessageSegment.cache_info() == (
+        conversation_event.SegmentCacheInfo(1, 1, 0, 0)
+    )
+
+
+def test_serialize_segments_cached():
+    segment_cls = conversation_event.ChatMessageSegment
+    segment_cls.clear_cache()
+    segments = segment_cls.from_str('hello *world*')
+    serialized = segment_cls.serialize_segments(segments)
+    assert hangouts_pb2.MessageContent.FromString(serialized) == (
+        hangouts_pb2.MessageContent(
+            segment=[segment.serialize() for segment in segments]
+        )
+    )
+    assert segment_cls.serialize_segments(
+        segment_cls.from_str('hello *world*')
+    ) == serialized
+    segments[1].is_bold = True
+    assert segment_cls.serialize_segments(segments) != serialized
+    assert segment_cls.cache_info() == (
+        conversation_event.SegmentCacheInfo(1, 1, 1, 2)
+    )
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = conversation_event._LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a', int) == 1
+    cache.put('c', 3)
+    assert cache.get('b', lambda: 4) == 4
+    assert cache.get('a', int) == 0
+    assert (cache.hits, cache.misses) == (1, 2)
@@ -0,0 +1,93 @@
+"""Tests for the conversation event container."""
+
+import collections
+
+import pytest
+
+from hangups import event_store
+
+
+FakeEvent = collections.namedtuple('FakeEvent', ['id_', 'timestamp_us'])
+
+
+def make_store(*event_ids):
+    """Return EventStore with events timestamped in the given order."""
+    store = event_store.EventStore()
+    for timestamp, event_id in enumerate(event_ids):
+        store.add(FakeEvent(event_id, timestamp))
+    return store
+
+
+def get_ids(events):
+    return [e.id_ for e in events]
+
+
+def test_add():
+    store = make_store('a', 'b')
+    assert store.add(FakeEvent('c', 2))
+    assert not store.add(FakeEvent('a', 0))
+    assert get_ids(store) == ['a', 'b', 'c']
+    assert store.index('c') == 2
+
+
+def test_add_out_of_order():
+    store = make_store('a', 'c')
+    assert store.add(FakeEvent('b', 0))
+    assert store.add(FakeEvent('d', -1))
+    # Events with the same timestamp are ordered by ID.
+    assert get_ids(store) == ['d', 'a', 'b', 'c']
+    assert [store.index(id_) for id_ in 'dabc'] == [0, 1, 2, 3]
+
+
+def test_merge():
+    store = make_store('a', 'b', 'c')
+    added = store.merge([FakeEvent('e', 5), FakeEvent('x', -1),
+                         FakeEvent('b', 1), FakeEvent('d', 1.5),
+                         FakeEvent('x', -1)])
+    assert get_ids(added) == ['x', 'd', 'e']
+    assert get_ids(store) == ['x', 'a', 'b', 'd', 'c', 'e']
+    assert [store.index(id_) for id_ in 'xabdce'] == list(range(6))
+    assert store.merge([FakeEvent('a', 0)]) == []
+
+
+def test_between():
+    store = make_store('a', 'b', 'c', 'd')
+    assert get_ids(store.between(1, 3)) == ['b', 'c']
+    assert get_ids(store.between(1.5)) == ['c', 'd']
+    assert get_ids(store.between(end=1)) == ['a']
+    assert store.between(10) == []
+
+
+def test_evict_oldest():
+    store = make_store('a', 'b', 'c')
+    evicted = store.evict_oldest(2)
+    assert get_ids(evicted) == ['a', 'b']
+    assert 'a' not in store
+    assert store.index('c') == 0
+    store.add(FakeEvent('d', 3))
+    assert store.index('d') == 1
+
+
+def test_neighbour():
+    store = make_store('a', 'b', 'c')
+    assert store.neighbour('b').id_ == 'c'
+    assert store.neighbour('b', prev=True).id_ == 'a'
+    assert store.neighbour('c') is None
+    assert store.neighbour('a', prev=True) is None
+    with pytest.raises(KeyError):
+        store.neighbour('x')
+
+
+def test_view():
+    store = make_store('a', 'b')
+    view = store.view()
+    store.add(FakeEvent('c', 2))
+    assert len(view) == 3
+    assert view[-1].id_ == 'c'
+    assert get_ids(view[:2]) == ['a', 'b']
+    assert view.index(store.get('b')) == 1
+    assert FakeEvent('b', 5) not in view
+    with pytest.raises(ValueError):
+        view.index(FakeEvent('x', 0))
+    with pytest.raises(ValueError):
+        view.index(store.get('a'), 1)
@@ -1,5 +1,11 @@
 """Tests for ReParser-based message parser"""
 
+# pylint: disable=protected-access
+
+import re
+
+import reparser
+
 from hangups import message_parser, hangouts_pb2
 
 
@@ -200,3 +206,76 @@ def test_parse_html():
         ('<i>default', {}),
     ]
     assert expected == parse_text(text)
+
+
+def test_parse_same_as_reparser():
+    parser = message_parser.ChatMessageParser()
+    for text in [
+            '**bold *both** italic* ***',
+            'a_b_ __c__ ___d___ ``e`` ```f``` `g` ~~h~~ ==i==',
+            r'\*not italic\* *\*escaped* [a](b)[c]](d)) \[e](f)',
+            '<B>bold <pre><i>pre</i></pre></b> <STRIKE>s</strike> <u>',
+            '<a href="x.com">link</a> <a  href=\'y\' >a</A><img src="z"/>',
+            '`*pre*` *unclosed `pre* a*',
+            'line\r\nbreak<br>twice<BR />x.com/path*',
+    ]:
+        expected = [(s.text, s.params) for s in
+                    reparser.Parser.parse(parser, text)]
+        assert expected == parse_text(text)
+
+
+def test_parse_unmatched_markup():
+    for text in ['*' * 1000, '*a ' * 1000, '<b>' * 1000, '[a' * 1000,
+                 '<a href="x' * 1000]:
+        assert [(text.replace('  ', ' \xa0'), {})] == parse_text(text)
+
+
+class CountingRegex:
+    """Wraps a compiled regex to count calls to match."""
+
+    def __init__(self, regex):
+        self.regex = regex
+        self.num_matches = 0
+
+    def match(self, *args):
+        self.num_matches += 1
+        return self.regex.match(*args)
+
+
+def test_parse_auto_link_like_text_in_linear_time(monkeypatch):
+    label_regex = CountingRegex(message_parser.auto_link_label_regex)
+    tld_regex = CountingRegex(message_parser.auto_link_tld_regex)
+    monkeypatch.setattr(message_parser, 'auto_link_label_regex', label_regex)
+    monkeypatch.setattr(message_parser, 'auto_link_tld_regex', tld_regex)
+    for text in ['a.' * 5000, '.a' * 5000, 'a.b/' * 5000, '1.' * 5000,
+                 'a.' * 5000 + '/', ('a' * 62 + '1.') * 100]:
+        label_regex.num_matches = tld_regex.num_matches = 0
+        assert [(text, {})] == parse_text(text)
+        # Each label is matched a bounded number of times, rather than once
+        # for every preceding label.
+        assert label_regex.num_matches + tld_regex.num_matches <= 2 * len(text)
+
+
+def test_search_auto_link_same_as_regex():
+    regex = re.compile(message_parser.auto_link, message_parser.FLAGS)
+    for text in [
+            'a.b.c.d', 'a.b/c', 'x@a.b/c', 'x@a.b.c', 'http://a.b.c:80/d(e)',
+            'HTTPS://1.2.3.4:5/', '1.2.3.4.5/', '1234.1.2.3.4/', 'a.co-',
+            'a-b.cd@e', '-a.bc/', 'a.' * 70 + 'bc', ('x' * 64) + '.ab.cd',
+            'a.b1.cd e.f', '\u0663.1.2.3/', 'a.bc:12x a.bc:12 a.bc:',
+    ]:
+        scanner = message_parser._MarkupScanner(text)
+        pos = 0
+        while pos <= len(text):
+            match = regex.search(text, pos)
+            assert scanner._search_auto_link(pos) == (
+                None if match is None else match.span()
+            )
+            pos += 1
+
+
+def test_parse_custom_tokens():
+    parser = message_parser.ChatMessageParser(message_parser.Tokens.basic)
+    assert [(s.text, s.params) for s in parser.parse('*a* b.com/')] == [
+        ('*a* ', {}), ('b.com/', {'link_target': 'http://b.com/'}),
+    ]
@@ -0,0 +1,166 @@
+"""Tests for the durable queue of outgoing chat messages."""
+
+# pylint: disable=protected-access
+
+import asyncio
+import json
+
+import pytest
+
+from hangups import exceptions, hangouts_pb2, outbox
+from hangups.test.utils import coroutine_test
+
+
+async def wait_until(predicate, timeout=1):
+    """Wait until predicate() is true, failing after timeout seconds."""
+    async def poll():
+        while not predicate():
+            await asyncio.sleep(0)
+    await asyncio.wait_for(poll(), timeout)
+
+
+class FakeSender:
+    """Sends requests, failing the first num_failures attempts."""
+
+    def __init__(self, num_failures=0):
+        self.sent = []  # [(conv_id, client_generated_id)]
+        self.attempts = []  # [(conv_id, client_generated_id)]
+        self.num_sending = 0
+        self.max_num_sending = 0
+        self._num_failures = num_failures
+
+    async def send(self, request):
+        header = request.event_request_header
+        key = (header.conversation_id.id, header.client_generated_id)
+        self.attempts.append(key)
+        self.num_sending += 1
+        self.max_num_sending = max(self.num_sending, self.max_num_sending)
+        try:
+            await asyncio.sleep(0)
+            if self._num_failures:
+                self._num_failures -= 1
+                raise exceptions.NetworkError('Server disconnected')
+        finally:
+            self.num_sending -= 1
+        self.sent.append(key)
+        return hangouts_pb2.SendChatMessageResponse()
+
+
+def make_request(conv_id, client_generated_id):
+    return hangouts_pb2.SendChatMessageRequest(
+        event_request_header=hangouts_pb2.EventRequestHeader(
+            conversation_id=hangouts_pb2.ConversationId(id=conv_id),
+            client_generated_id=client_generated_id,
+        ),
+    )
+
+
+@coroutine_test
+async def test_put():
+    sender = FakeSender()
+    queue = outbox.Outbox(sender.send, concurrency=2)
+    requests = [make_request(conv_id, num)
+                for num in range(3) for conv_id in ['a', 'b', 'c']]
+    puts = [asyncio.ensure_future(queue.put(request)) for request in requests]
+    await asyncio.sleep(0)
+    assert queue.get_stats().depth == 9
+    assert queue.get_stats().num_conversations == 3
+    assert sender.sent == []
+    queue.resume()
+    await asyncio.gather(*puts)
+    assert sender.max_num_sending == 2
+    for conv_id in ['a', 'b', 'c']:
+        assert [num for id_, num in sender.sent if id_ == conv_id] == [0, 1, 2]
+    assert queue.get_stats() == outbox.OutboxStats(0, 0, None)
+
+
+@coroutine_test
+async def test_put_retry():
+    sender = FakeSender(num_failures=2)
+    queue = outbox.Outbox(sender.send, retry_backoff_base=0)
+    queue.resume()
+    await asyncio.gather(queue.put(make_request('a', 1)),
+                         queue.put(make_request('a', 2)))
+    assert sender.attempts == [('a', 1), ('a', 1), ('a', 1), ('a', 2)]
+    assert sender.sent == [('a', 1), ('a', 2)]
+
+
+@coroutine_test
+async def test_put_give_up(monkeypatch):
+    monkeypatch.setattr(outbox, 'MAX_SEND_ATTEMPTS', 2)
+    sender = FakeSender(num_failures=2)
+    queue = outbox.Outbox(sender.send, retry_backoff_base=0)
+    dropped = []
+    queue.on_message_dropped.add_observer(
+        lambda request, error: dropped.append(error)
+    )
+    queue.resume()
+    with pytest.raises(exceptions.NetworkError):
+        await queue.put(make_request('a', 1))
+    await queue.put(make_request('a', 2))
+    assert sender.sent == [('a', 2)]
+    assert len(queue) == 0
+    assert len(dropped) == 1
+    assert isinstance(dropped[0], exceptions.NetworkError)
+
+
+@coroutine_test
+async def test_persist(tmp_path):
+    path = str(tmp_path / 'outbox.json')
+    sender = FakeSender(num_failures=1)
+    queue = outbox.Outbox(sender.send, path, retry_backoff_base=60)
+    queue.resume()
+    put = asyncio.ensure_future(queue.put(make_request('a', 1)))
+    await wait_until(lambda: sender.attempts)
+    await asyncio.sleep(0)
+    queue.stop()
+    put.cancel()
+    await queue.flush()
+    assert sender.attempts == [('a', 1)]
+    assert sender.sent == []
+
+    # The message is sent after a restart, and its outcome reported even
+    # though nothing is waiting for it.
+    sender = FakeSender()
+    queue = outbox.Outbox(sender.send, path)
+    assert queue.get_stats().depth == 1
+    assert queue.get_stats().oldest_age >= 0
+    sent = []
+    queue.on_message_sent.add_observer(
+        lambda request, response: sent.append(request)
+    )
+    queue.resume()
+    await wait_until(lambda: sent)
+    await queue.flush()
+    assert sender.sent == [('a', 1)]
+    assert sent == [make_request('a', 1)]
+    assert len(outbox.Outbox(sender.send, path)) == 0
+
+
+@coroutine_test
+async def test_save_coalesced(tmp_path, monkeypatch):
+    path = str(tmp_path / 'outbox.json')
+    writes = []
+    write_file = outbox._write_file
+    monkeypatch.setattr(outbox, '_write_file', lambda path, data: (
+        writes.append(len(data['messages'])) or write_file(path, data)
+    ))
+    queue = outbox.Outbox(FakeSender().send, path)
+    puts = [asyncio.ensure_future(queue.put(make_request('a', num)))
+            for num in range(3)]
+    await asyncio.sleep(0)
+    await queue.flush()
+    # Messages queued in the same loop iteration are saved together.
+    assert writes == [3]
+    with open(path, encoding='utf-8') as f:
+        assert len(json.load(f)['messages']) == 3
+    queue.stop()
+    for put in puts:
+        put.cancel()
+
+
+def test_load_invalid(tmp_path):
+    path = tmp_path / 'outbox.json'
+    path.write_text('{')
+    with pytest.raises(ValueError):
+        outbox.Outbox(None, str(path))
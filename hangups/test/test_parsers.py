@@ -0,0 +1,30 @@
+"""Tests for the parsing helper functions."""
+
+import datetime
+
+import pytest
+
+from hangups import parsers
+
+
+@pytest.mark.parametrize('timestamp', [
+    0, 1, -1, 999999, -999999, -1500000, 1500000,
+    # Converting these through a float timestamp in seconds is off by one:
+    537062895929946, -555580575661009,
+])
+def test_timestamp_round_trip(timestamp):
+    assert parsers.to_timestamp(parsers.from_timestamp(timestamp)) == timestamp
+
+
+def test_to_timestamp_pre_epoch():
+    datetime_timestamp = datetime.datetime(
+        1969, 12, 31, 23, 59, 58, 500000, tzinfo=datetime.timezone.utc
+    )
+    assert parsers.to_timestamp(datetime_timestamp) == -1500000
+
+
+def test_to_timestamp_naive():
+    datetime_timestamp = datetime.datetime(2017, 1, 27, 20, 10, 36, 123457)
+    assert parsers.to_timestamp(datetime_timestamp) == (
+        int(datetime_timestamp.timestamp()) * 1000000 + 123457
+    )
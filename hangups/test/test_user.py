@@ -1,8 +1,14 @@
 """Tests for the user module"""
 
+# pylint: disable=protected-access
 
+import asyncio
+
+import hangups.event
+import hangups.exceptions
 import hangups.user
 import hangups.hangouts_pb2
+import hangups.parsers
 
 
 USER_ID = hangups.user.UserID(1, 1)
@@ -102,3 +108,248 @@ def test_real_type_from_conv_part_data():
     assert user.full_name == 'Joe Doe'
     assert user.first_name == 'Joe'
     assert user.name_type == hangups.user.NameType.REAL
+
+
+def test_intern_user_id():
+    user_id = hangups.user.intern_user_id('1', '1')
+    assert user_id == hangups.user.UserID(chat_id='1', gaia_id='1')
+    assert hangups.user.intern_user_id('1', '1') is user_id
+    participant_id = hangups.hangouts_pb2.ParticipantId(chat_id='1',
+                                                        gaia_id='1')
+    assert hangups.parsers.from_participantid(participant_id) is user_id
+
+
+def test_intern_user_id_generations(monkeypatch):
+    monkeypatch.setattr(hangups.user, 'INTERN_GENERATION_SIZE', 2)
+    monkeypatch.setattr(hangups.user, '_user_ids', {})
+    monkeypatch.setattr(hangups.user, '_old_user_ids', {})
+    used_id = hangups.user.intern_user_id('1', '1')
+    hangups.user.intern_user_id('2', '2')
+    # The used ID is still shared after a new generation starts.
+    assert hangups.user.intern_user_id('1', '1') is used_id
+    hangups.user.intern_user_id('3', '3')
+    hangups.user.intern_user_id('4', '4')
+    assert hangups.user.intern_user_id('1', '1') is used_id
+    # IDs not used for a whole generation are forgotten.
+    assert ('2', '2') not in hangups.user._user_ids
+    assert ('2', '2') not in hangups.user._old_user_ids
+    assert (len(hangups.user._user_ids) +
+            len(hangups.user._old_user_ids)) <= 4
+
+
+def test_user_has_no_instance_dict():
+    user = hangups.user.User(USER_ID, 'Full Name', None, None, None, [],
+                             False)
+    assert not hasattr(user, '__dict__')
+
+
+class FakeClient:
+    """Client that returns entities for known gaia IDs."""
+
+    def __init__(self, entities):
+        self.on_state_update = hangups.event.Event(
+            'FakeClient.on_state_update'
+        )
+        self.on_connect = hangups.event.Event('FakeClient.on_connect')
+        self.on_reconnect = hangups.event.Event('FakeClient.on_reconnect')
+        self.get_entity_by_id_requests = []
+        self.num_failures = 0  # Number of requests left to fail
+        self._entities = entities
+
+    @staticmethod
+    def get_request_header():
+        return hangups.hangouts_pb2.RequestHeader()
+
+    async def get_entity_by_id(self, request):
+        self.get_entity_by_id_requests.append(request)
+        if self.num_failures > 0:
+            self.num_failures -= 1
+            raise hangups.exceptions.NetworkError('failed')
+        if not self._entities:
+            raise hangups.exceptions.NetworkError('failed')
+        return hangups.hangouts_pb2.GetEntityByIdResponse(entity_result=[
+            hangups.hangouts_pb2.EntityResult(entity=[
+                self._entities[spec.gaia_id]
+                for spec in request.batch_lookup_spec
+                if spec.gaia_id in self._entities
+            ])
+        ])
+
+
+def make_entity(id_, display_name):
+    return hangups.hangouts_pb2.Entity(
+        id=hangups.hangouts_pb2.ParticipantId(chat_id=id_, gaia_id=id_),
+        properties=hangups.hangouts_pb2.EntityProperties(
+            display_name=display_name,
+        ),
+    )
+
+
+def test_resolve_unknown_users(monkeypatch):
+    monkeypatch.setattr(hangups.user, 'RESOLVE_DEBOUNCE_SECS', 0)
+    client = FakeClient({'2': make_entity('2', 'Found User')})
+    user_list = hangups.user.UserList(client, make_entity('1', 'Self'), [],
+                                      [])
+    updated = []
+    user_list.on_users_updated.add_observer(updated.append)
+    found_id = hangups.user.intern_user_id('2', '2')
+    missing_id = hangups.user.intern_user_id('3', '3')
+
+    async def get_users():
+        for user_id in [found_id, missing_id, found_id]:
+            assert user_list.get_user(user_id).full_name == 'Unknown'
+        await user_list._resolve_future
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(get_users())
+    finally:
+        loop.close()
+
+    # Both users were requested together, once.
+    assert len(client.get_entity_by_id_requests) == 1
+    request = client.get_entity_by_id_requests[0]
+    assert sorted(spec.gaia_id for spec in request.batch_lookup_spec) == [
+        '2', '3'
+    ]
+    # Updated users are reported once for each request.
+    assert [[user.id_ for user in users] for users in updated] == [[found_id]]
+    assert user_list.get_user(found_id).full_name == 'Found User'
+    # Users that could not be found are not requested again until the TTL
+    # expires.
+    assert user_list.get_user(missing_id).full_name == 'Unknown'
+    assert user_list._unresolved_user_ids == set()
+    assert missing_id in user_list._failed_user_ids
+
+
+def test_resolve_users_retried_after_network_error(monkeypatch):
+    monkeypatch.setattr(hangups.user, 'RESOLVE_DEBOUNCE_SECS', 0)
+    monkeypatch.setattr(hangups.user, 'RESOLVE_MAX_BACKOFF_SECS', 0)
+    client = FakeClient({'2': make_entity('2', 'Found User')})
+    client.num_failures = 2
+    user_list = hangups.user.UserList(client, make_entity('1', 'Self'), [],
+                                      [])
+    found_id = hangups.user.intern_user_id('2', '2')
+    missing_id = hangups.user.intern_user_id('3', '3')
+
+    async def get_users():
+        for user_id in [found_id, missing_id]:
+            assert user_list.get_user(user_id).full_name == 'Unknown'
+        await user_list._resolve_future
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(get_users())
+    finally:
+        loop.close()
+
+    # Failed requests are retried with the same users.
+    assert len(client.get_entity_by_id_requests) == 3
+    for request in client.get_entity_by_id_requests:
+        assert sorted(
+            spec.gaia_id for spec in request.batch_lookup_spec
+        ) == ['2', '3']
+    assert user_list.get_user(found_id).full_name == 'Found User'
+    # Only the user missing from the successful response is not requested
+    # again until the TTL expires.
+    assert list(user_list._failed_user_ids) == [missing_id]
+
+
+def test_resolve_users_queued_before_loop(monkeypatch):
+    monkeypatch.setattr(hangups.user, 'RESOLVE_DEBOUNCE_SECS', 0)
+    client = FakeClient({'2': make_entity('2', 'Found User')})
+    user_list = hangups.user.UserList(client, make_entity('1', 'Self'), [],
+                                      [])
+    user_id = hangups.user.intern_user_id('2', '2')
+    # No event loop is running yet, so the user is only queued.
+    assert user_list.get_user(user_id).full_name == 'Unknown'
+    assert user_list._resolve_future is None
+
+    async def connect():
+        await client.on_connect.fire()
+        await user_list._resolve_future
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(connect())
+    finally:
+        loop.close()
+    assert len(client.get_entity_by_id_requests) == 1
+    assert user_list.get_user(user_id).full_name == 'Found User'
+
+
+def test_resolve_users_queued_before_loop_on_get_user(monkeypatch):
+    monkeypatch.setattr(hangups.user, 'RESOLVE_DEBOUNCE_SECS', 0)
+    client = FakeClient({'2': make_entity('2', 'Found User')})
+    user_list = hangups.user.UserList(client, make_entity('1', 'Self'), [],
+                                      [])
+    user_id = hangups.user.intern_user_id('2', '2')
+    user_list.get_user(user_id)
+
+    async def get_user_again():
+        # Asking for the queued user again starts the request.
+        assert user_list.get_user(user_id).full_name == 'Unknown'
+        await user_list._resolve_future
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(get_user_again())
+    finally:
+        loop.close()
+    assert user_list.get_user(user_id).full_name == 'Found User'
+
+
+def make_user_list(*users):
+    user_list = hangups.user.UserList(FakeClient({}), make_entity('0', 'Self'),
+                                      [], [])
+    for id_, full_name, emails in users:
+        entity = make_entity(id_, full_name)
+        entity.properties.email.extend(emails)
+        user = hangups.user.User.from_entity(entity, user_list._self_user.id_)
+        user_list._user_dict[user.id_] = user
+        user_list._search_index.update(user)
+    return user_list
+
+
+def test_search():
+    user_list = make_user_list(
+        ('1', 'John Smith', ['jsmith@example.com']),
+        ('2', 'Johnny Appleseed', []),
+        ('3', 'Zoë Jones', ['zoe.jones@example.com']),
+    )
+
+    def search(query, **kwargs):
+        return [user.full_name for user in user_list.search(query, **kwargs)]
+
+    # Exact matches rank above prefix matches.
+    assert search('john') == ['John Smith', 'Johnny Appleseed']
+    assert search('JOHN S') == ['John Smith']
+    assert search('zoe') == ['Zoë Jones']
+    assert search('zoe.jones@') == ['Zoë Jones']
+    assert search('jsmith') == ['John Smith']
+    assert search('jon', fuzzy=False) == ['Zoë Jones']
+    assert search('jahn', fuzzy=False) == []
+    assert search('jahn') == ['John Smith']
+    assert search('john', limit=1) == ['John Smith']
+    assert search('') == []
+
+
+def test_search_after_name_upgrade():
+    user_list = make_user_list()
+    user_list._add_user_from_conv_part(
+        hangups.hangouts_pb2.ConversationParticipantData(
+            id=hangups.hangouts_pb2.ParticipantId(chat_id='1', gaia_id='1'),
+            fallback_name='+12125551212',
+        )
+    )
+    assert [u.full_name for u in user_list.search('+1212')] == [
+        '+12125551212'
+    ]
+    user_list._add_user_from_conv_part(
+        hangups.hangouts_pb2.ConversationParticipantData(
+            id=hangups.hangouts_pb2.ParticipantId(chat_id='1', gaia_id='1'),
+            fallback_name='Jane Doe',
+        )
+    )
+    assert user_list.search('+1212') == []
+    assert [u.full_name for u in user_list.search('jane')] == ['Jane Doe']
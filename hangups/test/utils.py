@@ -0,0 +1,17 @@
+"""Helpers shared by the tests."""
+
+import asyncio
+import functools
+
+
+def coroutine_test(coro):
+    """Decorator to create a coroutine that starts and stops its own loop."""
+    @functools.wraps(coro)
+    def wrapper(*args, **kwargs):
+        future = coro(*args, **kwargs)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(future)
+        finally:
+            loop.close()
+    return wrapper
@@ -9,7 +9,6 @@ import os
 import sys
 import urwid
 import readlike
-from bisect import bisect
 
 import hangups
 from hangups.ui.emoticon import replace_emoticons
@@ -227,6 +226,7 @@ class ChatUI:
 
         # show the conversation menu
         conv_picker = ConversationPickerWidget(self._conv_list,
+                                               self._user_list,
                                                self.on_select_conversation,
                                                self._keys)
         self._tabbed_window = TabbedWindowWidget(self._keys)
@@ -391,12 +391,11 @@ class ConversationButton(WidgetBase):
 
     def _on_event(self, _):
         """Update the button's label when an event occurs."""
-        self._button.set_label(self._get_label())
+        self.update_label()
 
-    @property
-    def last_modified(self):
-        """Last modified date of conversation, used for sorting."""
-        return self._conversation.last_modified
+    def update_label(self):
+        """Update the button's label."""
+        self._button.set_label(self._get_label())
 
 
 class ConversationListWalker(urwid.SimpleFocusListWalker):
@@ -407,21 +406,33 @@ class ConversationListWalker(urwid.SimpleFocusListWalker):
 
     # pylint: disable=abstract-method
 
-    def __init__(self, conversation_list, on_select):
+    def __init__(self, conversation_list, user_list, on_select):
         self._conversation_list = conversation_list
-        self._conversation_list.on_event.add_observer(self._on_event)
+        self._conversation_list.on_position_change.add_observer(
+            self._on_position_change
+        )
+        user_list.on_users_updated.add_observer(self._on_users_updated)
         self._on_press = lambda button, conv_id: on_select(conv_id)
-        convs = sorted(conversation_list.get_all(), reverse=True,
-                       key=lambda c: c.last_modified)
         buttons = [ConversationButton(conv, on_press=self._on_press)
-                   for conv in convs]
+                   for conv in conversation_list.iter_recent()]
         super().__init__(buttons)
 
-    def _on_event(self, _):
-        """Re-order the conversations when an event occurs."""
-        # TODO: handle adding new conversations
-        self.sort(key=lambda conv_button: conv_button.last_modified,
-                  reverse=True)
+    def _on_position_change(self, position_change):
+        """Move, add or remove a single button when a conversation moves."""
+        if position_change.is_archived:
+            return
+        if position_change.old_position is None:
+            conv = self._conversation_list.get(position_change.conv_id)
+            button = ConversationButton(conv, on_press=self._on_press)
+        else:
+            button = self.pop(position_change.old_position)
+        if position_change.new_position is not None:
+            self.insert(position_change.new_position, button)
+
+    def _on_users_updated(self, _):
+        """Update the labels when users' names become known."""
+        for button in self:
+            button.update_label()
 
 
 class ListBox(WidgetBase):
@@ -449,8 +460,9 @@ class ListBox(WidgetBase):
 class ConversationPickerWidget(WidgetBase):
     """ListBox widget for picking a conversation from a list."""
 
-    def __init__(self, conversation_list, on_select, keybindings):
-        list_walker = ConversationListWalker(conversation_list, on_select)
+    def __init__(self, conversation_list, user_list, on_select, keybindings):
+        list_walker = ConversationListWalker(conversation_list, user_list,
+                                             on_select)
         list_box = ListBox(keybindings, list_walker)
         widget = urwid.Padding(list_box, left=2, right=2)
         super().__init__(widget)
@@ -697,7 +709,6 @@ class ConversationEventListWalker(urwid.ListWalker):
     """
 
     POSITION_LOADING = 'loading'
-    WATERMARK_FAST_SEARCH_ITEMS = 10
 
     def __init__(self, coroutine_queue, conversation, datetimefmt):
         self._coroutine_queue = coroutine_queue  # CoroutineQueue
@@ -706,7 +717,6 @@ class ConversationEventListWalker(urwid.ListWalker):
         self._is_loading = False  # Whether we're currently loading more events
         self._first_loaded = False  # Whether the first event is loaded
         self._datetimefmt = datetimefmt
-        self._watermarked_events = {}  # Users watermarked at a given event
 
         # Focus position is the first event ID, or POSITION_LOADING.
         self._focus_position = (conversation.events[-1].id_
@@ -750,8 +760,6 @@ class ConversationEventListWalker(urwid.ListWalker):
             # Otherwise, still need to invalidate in case the loading
             # indicator is showing but not focused.
             self._modified()
-        # Loading events can also update the watermarks.
-        self._refresh_watermarked_events()
         self._is_loading = False
 
     def __getitem__(self, position):
@@ -780,46 +788,15 @@ class ConversationEventListWalker(urwid.ListWalker):
             return MessageWidget.from_conversation_event(
                 self._conversation, self._conversation.get_event(position),
                 prev_event, self._datetimefmt,
-                watermark_users=self._watermarked_events.get(position, None)
+                watermark_users=self._conversation.get_seen_by(
+                    position, position
+                ).get(position, None)
             )
         except KeyError:
             raise IndexError('Invalid position: {}'.format(position))
 
-    @staticmethod
-    def _find_watermark_event(timestamps, timestamp):
-        # Look back through the most recent events first.
-        back_idx = ConversationEventListWalker.WATERMARK_FAST_SEARCH_ITEMS
-        for i, t in list(enumerate(reversed(timestamps[-back_idx:]))):
-            if t <= timestamp:
-                return len(timestamps) - i - 1
-
-        # Bisect the rest.
-        return bisect(timestamps[:-back_idx], timestamp) - 1
-
-    def _refresh_watermarked_events(self):
-        self._watermarked_events.clear()
-        timestamps = [x.timestamp for x in self._conversation.events]
-        for user_id in self._conversation.watermarks:
-            user = self._conversation.get_user(user_id)
-            # Ignore the current user.
-            if user.is_self:
-                continue
-            # Skip searching if the watermark's event was not loaded yet.
-            timestamp = self._conversation.watermarks[user_id]
-            if timestamp < timestamps[0]:
-                continue
-            event_idx = ConversationEventListWalker._find_watermark_event(
-                timestamps, timestamp
-            )
-            if event_idx >= 0:
-                event_pos = self._conversation.events[event_idx].id_
-                if event_pos not in self._watermarked_events:
-                    self._watermarked_events[event_pos] = set()
-                self._watermarked_events[event_pos].add(user)
-
     def _on_watermark_notification(self, _):
-        """Update watermarks for this conversation."""
-        self._refresh_watermarked_events()
+        """Redraw watermarks for this conversation."""
         self._modified()
 
     def _get_position(self, position, prev=False):
@@ -1,7 +1,5 @@
 """Shared UI utility function."""
 
-import hangups
-
 
 def get_conv_name(conv, truncate=False, show_unread=False):
     """Return a readable name for a conversation.
@@ -16,9 +14,7 @@ def get_conv_name(conv, truncate=False, show_unread=False):
     If show_unread is True, if there are unread chat messages, show the number
     of unread chat messages in parentheses after the conversation name.
     """
-    num_unread = len([conv_event for conv_event in conv.unread_events if
-                      isinstance(conv_event, hangups.ChatMessageEvent) and
-                      not conv.get_user(conv_event.user_id).is_self])
+    num_unread = conv.unread_message_count
     if show_unread and num_unread > 0:
         postfix = ' ({})'.format(num_unread)
     else:
@@ -26,20 +22,7 @@ def get_conv_name(conv, truncate=False, show_unread=False):
     if conv.name is not None:
         return conv.name + postfix
     else:
-        participants = sorted(
-            (user for user in conv.users if not user.is_self),
-            key=lambda user: user.id_
-        )
-        names = [user.first_name for user in participants]
-        if not participants:
-            return "Empty Conversation" + postfix
-        if len(participants) == 1:
-            return participants[0].full_name + postfix
-        elif truncate and len(participants) > 2:
-            return (', '.join(names[:2] + ['+{}'.format(len(names) - 2)]) +
-                    postfix)
-        else:
-            return ', '.join(names) + postfix
+        return conv.get_default_name(truncate=truncate) + postfix
 
 
 def add_color_to_scheme(scheme, name, foreground, background, palette_colors):
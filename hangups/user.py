@@ -1,16 +1,78 @@
 """User objects."""
 
-from collections import namedtuple
+import asyncio
+import bisect
+from collections import defaultdict, namedtuple
 import enum
 import logging
+import re
+import sys
+import time
+import unicodedata
+
+from hangups import compat, event, exceptions, hangouts_pb2
 
 
 logger = logging.getLogger(__name__)
 DEFAULT_NAME = 'Unknown'
+# Time to wait for more unknown users before requesting them together:
+RESOLVE_DEBOUNCE_SECS = 0.2
+# Maximum number of unknown users to request at once:
+RESOLVE_BATCH_SIZE = 100
+# Time to wait before requesting a user again after they could not be found:
+RESOLVE_FAILURE_TTL_SECS = 600
+# Base term of the exponential backoff before requesting unknown users again
+# after a request failed:
+RESOLVE_RETRY_BACKOFF_BASE = 2
+# Maximum time to back off before requesting unknown users again:
+RESOLVE_MAX_BACKOFF_SECS = 300
+# Minimum similarity between a search word and a user's word to count as a
+# fuzzy match, from 0 to 1:
+SEARCH_FUZZY_THRESHOLD = 0.4
+
+# Number of user IDs interned in each generation of the intern table. User
+# IDs not requested for a whole generation are forgotten:
+INTERN_GENERATION_SIZE = 10000
 
 UserID = namedtuple('UserID', ['chat_id', 'gaia_id'])
 """A user ID, consisting of two parts which are always identical."""
 
+# Current and previous generations of interned user IDs:
+_user_ids = {}  # {(chat_id, gaia_id): UserID}
+_old_user_ids = {}  # {(chat_id, gaia_id): UserID}
+
+
+def intern_user_id(chat_id, gaia_id):
+    """Get the shared :class:`UserID` with the given parts.
+
+    Users are referred to by many messages, so sharing one instance of each
+    user ID avoids keeping many identical copies. User IDs are interned in
+    generations of :data:`INTERN_GENERATION_SIZE`, so the intern table stays
+    bounded while the user IDs in use keep being shared.
+
+    Args:
+        chat_id (str): The chat ID part of the user ID.
+        gaia_id (str): The gaia ID part of the user ID.
+
+    Returns:
+        :class:`UserID` instance.
+    """
+    key = (chat_id, gaia_id)
+    try:
+        return _user_ids[key]
+    except KeyError:
+        user_id = _old_user_ids.get(key, None)
+        if user_id is None:
+            user_id = UserID(chat_id=sys.intern(chat_id),
+                             gaia_id=sys.intern(gaia_id))
+        if len(_user_ids) >= INTERN_GENERATION_SIZE:
+            # Start a new generation, forgetting the previous one.
+            _old_user_ids.clear()
+            _old_user_ids.update(_user_ids)
+            _user_ids.clear()
+        _user_ids[key] = user_id
+        return user_id
+
 
 NameType = enum.IntEnum('NameType', dict(DEFAULT=0, NUMERIC=1, REAL=2))
 """Indicates which type of name a user has.
@@ -28,6 +90,9 @@ class User:
     instances of this class.
     """
 
+    __slots__ = ('name_type', 'full_name', 'first_name', 'id_', 'photo_url',
+                 'canonical_email', 'emails', 'is_self')
+
     def __init__(self, user_id, full_name, first_name, photo_url,
                  canonical_email, emails, is_self):
         # Handle full_name or first_name being None by creating an approximate
@@ -94,8 +159,7 @@ class User:
         Returns:
             :class:`~hangups.user.User` object.
         """
-        user_id = UserID(chat_id=entity.id.chat_id,
-                         gaia_id=entity.id.gaia_id)
+        user_id = intern_user_id(entity.id.chat_id, entity.id.gaia_id)
         return User(user_id, entity.properties.display_name,
                     entity.properties.first_name,
                     entity.properties.photo_url,
@@ -115,8 +179,8 @@ class User:
         Returns:
             :class:`~hangups.user.User` object.
         """
-        user_id = UserID(chat_id=conv_part_data.id.chat_id,
-                         gaia_id=conv_part_data.id.gaia_id)
+        user_id = intern_user_id(conv_part_data.id.chat_id,
+                                 conv_part_data.id.gaia_id)
         if conv_part_data.fallback_name == 'unknown':
             full_name = None
         else:
@@ -125,6 +189,107 @@ class User:
                     (self_user_id == user_id) or (self_user_id is None))
 
 
+def _normalize(text):
+    """Return text case-folded and without accents for searching."""
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+
+
+def _get_bigrams(word):
+    """Return the set of bigrams of a word, including its boundaries."""
+    word = ' {} '.format(word)
+    return {word[i:i + 2] for i in range(len(word) - 1)}
+
+
+class _UserSearchIndex:
+    """Index of users by the words of their names and email addresses.
+
+    Words are kept in a sorted list to find prefix matches by bisection, and
+    their bigrams are indexed to find fuzzy matches.
+    """
+
+    def __init__(self):
+        self._entries = []  # [(word, UserID)], sorted
+        self._user_words = {}  # {UserID: {word}}
+        self._word_users = defaultdict(set)  # {word: {UserID}}
+        self._bigram_words = defaultdict(set)  # {bigram: {word}}
+        self._num_bigrams = {}  # {word: number of bigrams}
+
+    @staticmethod
+    def _get_words(user_):
+        """Return the set of normalized words to index a user by."""
+        words = set()
+        if user_.name_type != NameType.DEFAULT:
+            words.update(_normalize(user_.full_name).split())
+            words.update(_normalize(user_.first_name).split())
+        for email in [user_.canonical_email] + list(user_.emails):
+            if email:
+                email = _normalize(email)
+                words.add(email)
+                words.update(word for word
+                             in re.split(r'[^\w]+', email.split('@')[0])
+                             if word)
+        return words
+
+    def update(self, user_):
+        """Add a user or update the words a user is indexed by."""
+        words = self._get_words(user_)
+        old_words = self._user_words.get(user_.id_, set())
+        for word in old_words - words:
+            del self._entries[bisect.bisect_left(self._entries,
+                                                 (word, user_.id_))]
+            users = self._word_users[word]
+            users.remove(user_.id_)
+            if not users:
+                del self._word_users[word]
+                del self._num_bigrams[word]
+                for bigram in _get_bigrams(word):
+                    self._bigram_words[bigram].discard(word)
+        for word in words - old_words:
+            bisect.insort(self._entries, (word, user_.id_))
+            if word not in self._word_users:
+                bigrams = _get_bigrams(word)
+                self._num_bigrams[word] = len(bigrams)
+                for bigram in bigrams:
+                    self._bigram_words[bigram].add(word)
+            self._word_users[word].add(user_.id_)
+        self._user_words[user_.id_] = words
+
+    def match(self, query_word, fuzzy):
+        """Return scores of the users matching a normalized query word.
+
+        Exact matches score 3, prefix matches score 2, and fuzzy matches score
+        their similarity.
+
+        Returns:
+            dict of UserID to score.
+        """
+        scores = {}
+        index = bisect.bisect_left(self._entries, (query_word,))
+        while index < len(self._entries):
+            word, user_id = self._entries[index]
+            if not word.startswith(query_word):
+                break
+            score = 3 if word == query_word else 2
+            scores[user_id] = max(scores.get(user_id, 0), score)
+            index += 1
+        if fuzzy:
+            query_bigrams = _get_bigrams(query_word)
+            shared = defaultdict(int)  # {word: number of shared bigrams}
+            for bigram in query_bigrams:
+                for word in self._bigram_words.get(bigram, ()):
+                    shared[word] += 1
+            for word, count in shared.items():
+                # Dice coefficient of the bigram sets:
+                similarity = (2 * count /
+                              (len(query_bigrams) + self._num_bigrams[word]))
+                if similarity >= SEARCH_FUZZY_THRESHOLD:
+                    for user_id in self._word_users[word]:
+                        scores[user_id] = max(scores.get(user_id, 0),
+                                              similarity)
+        return scores
+
+
 class UserList:
     """Maintains a list of all the users.
 
@@ -142,13 +307,25 @@ class UserList:
 
     def __init__(self, client, self_entity, entities, conv_parts):
         self._client = client
+        # Number of times a user was added or had their name upgraded:
+        self._version = 0
+        # {UserID: _version when the user was last added or upgraded}
+        self._user_versions = {}
+        # Unknown users waiting to be requested:
+        self._unresolved_user_ids = set()  # {UserID}
+        self._resolve_future = None  # asyncio.Future or None
+        # Unknown users that could not be found:
+        self._failed_user_ids = {}  # {UserID: monotonic time to retry after}
+        self._search_index = _UserSearchIndex()
         self._self_user = User.from_entity(self_entity, None)
         # {UserID: User}
         self._user_dict = {self._self_user.id_: self._self_user}
+        self._search_index.update(self._self_user)
         # Add each entity as a new User.
         for entity in entities:
             user_ = User.from_entity(entity, self._self_user.id_)
             self._user_dict[user_.id_] = user_
+            self._search_index.update(user_)
         # Add each conversation participant as a new User if we didn't already
         # add them from an entity. These don't include a real first_name, so
         # only use them as a fallback.
@@ -158,10 +335,51 @@ class UserList:
                     len(self._user_dict))
 
         self._client.on_state_update.add_observer(self._on_state_update)
+        # Users queued before an event loop was running are requested once
+        # the client connects.
+        self._client.on_connect.add_observer(self._start_resolving)
+        self._client.on_reconnect.add_observer(self._start_resolving)
+
+        self.on_users_updated = event.Event('UserList.on_users_updated')
+        """
+        :class:`.Event` fired when users that were unknown have been requested
+        from the server, once for each request.
+
+        Args:
+            users: List of :class:`~hangups.user.User` that were added or
+                updated.
+        """
+
+    @property
+    def version(self):
+        """Number of times users were added or had their names upgraded.
+
+        Used to detect when names derived from users need to be updated
+        (:class:`int`).
+        """
+        return self._version
+
+    def get_user_version(self, user_id):
+        """Get the :attr:`version` when a user was last added or upgraded.
+
+        Names derived from a set of users only need to be updated if one of
+        the users changed since the names were derived.
+
+        Args:
+            user_id (~hangups.user.UserID): The ID of the user.
+
+        Returns:
+            :class:`int` version, or 0 if the user is unknown.
+        """
+        return self._user_versions.get(user_id, 0)
 
     def get_user(self, user_id):
         """Get a user by its ID.
 
+        If the user is unknown, a placeholder user is returned, and the user is
+        requested from the server in the background. :attr:`on_users_updated`
+        is fired once the user has been added.
+
         Args:
             user_id (~hangups.user.UserID): The ID of the user.
 
@@ -174,10 +392,43 @@ class UserList:
         try:
             return self._user_dict[user_id]
         except KeyError:
-            logger.warning('UserList returning unknown User for UserID %s',
-                           user_id)
+            if self._queue_unresolved_user(user_id):
+                logger.warning('UserList returning unknown User for UserID %s',
+                               user_id)
             return User(user_id, None, None, None, None, [], False)
 
+    def search(self, query, limit=10, fuzzy=True):
+        """Search for users by name or email address.
+
+        Each word of the query must match a word of a user's name or email
+        address, ignoring case and accents. Exact matches rank above prefix
+        matches, which rank above fuzzy matches.
+
+        Args:
+            query (str): Text to search for, such as a partial name.
+            limit (int): (optional) Maximum number of users to return.
+                Defaults to 10.
+            fuzzy (bool): (optional) Whether to include users whose words are
+                similar to the query words. Defaults to ``True``.
+
+        Returns:
+            List of :class:`~hangups.user.User` instances, best matches first.
+        """
+        scores = None  # {UserID: score}
+        for query_word in _normalize(query).split():
+            word_scores = self._search_index.match(query_word, fuzzy)
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {user_id: score + word_scores[user_id]
+                          for user_id, score in scores.items()
+                          if user_id in word_scores}
+        if not scores:
+            return []
+        users = [self._user_dict[user_id] for user_id in scores]
+        users.sort(key=lambda user_: (-scores[user_.id_], user_.full_name))
+        return users[:limit]
+
     def get_all(self):
         """Get all known users.
 
@@ -195,11 +446,130 @@ class UserList:
             logger.warning('Adding fallback User with %s name "%s"',
                            user_.name_type.name.lower(), user_.full_name)
             self._user_dict[user_.id_] = user_
+            self._search_index.update(user_)
+            self._mark_updated(user_)
             return user_
         else:
+            name_type = existing.name_type
             existing.upgrade_name(user_)
+            if existing.name_type != name_type:
+                self._search_index.update(existing)
+                self._mark_updated(existing)
             return existing
 
+    def _mark_updated(self, user_):
+        """Record that a user was added or upgraded."""
+        self._version += 1
+        self._user_versions[user_.id_] = self._version
+
+    def _queue_unresolved_user(self, user_id):
+        """Queue an unknown user to be requested.
+
+        Returns:
+            ``True`` if the user was queued, or ``False`` if the user is
+            already queued or could not be found recently.
+        """
+        if (user_id in self._unresolved_user_ids or
+                self._failed_user_ids.get(user_id, 0) > time.monotonic()):
+            is_queued = False
+        else:
+            self._failed_user_ids.pop(user_id, None)
+            self._unresolved_user_ids.add(user_id)
+            is_queued = True
+        # Users may have been queued before an event loop was running.
+        self._start_resolving()
+        return is_queued
+
+    def _start_resolving(self):
+        """Start requesting queued users if an event loop is running."""
+        if self._resolve_future is not None or not self._unresolved_user_ids:
+            return
+        try:
+            compat.get_running_loop()
+        except RuntimeError:
+            return
+        self._resolve_future = asyncio.ensure_future(self._resolve_users())
+
+    async def _resolve_users(self):
+        """Request queued unknown users in batches."""
+        failures = 0  # Number of consecutive failed requests
+        try:
+            while self._unresolved_user_ids:
+                # After a failed request, back off exponentially longer after
+                # each consecutive failure.
+                if failures > 0:
+                    backoff_seconds = min(
+                        RESOLVE_RETRY_BACKOFF_BASE ** failures,
+                        RESOLVE_MAX_BACKOFF_SECS
+                    )
+                    logger.info('Backing off for %s seconds', backoff_seconds)
+                    await asyncio.sleep(backoff_seconds)
+                # Wait for more users to be queued before each request.
+                await asyncio.sleep(RESOLVE_DEBOUNCE_SECS)
+                user_ids = []
+                while self._unresolved_user_ids and (
+                        len(user_ids) < RESOLVE_BATCH_SIZE):
+                    user_ids.append(self._unresolved_user_ids.pop())
+                if await self._resolve_user_batch(user_ids):
+                    failures = 0
+                else:
+                    failures += 1
+        finally:
+            self._resolve_future = None
+
+    async def _resolve_user_batch(self, user_ids):
+        """Request a batch of unknown users and add the users found.
+
+        Users that the server did not return are not requested again until
+        :data:`RESOLVE_FAILURE_TTL_SECS` have passed. If the request fails,
+        all the users are queued again instead.
+
+        Returns:
+            ``True`` if the request succeeded, otherwise ``False``.
+        """
+        logger.info('Requesting %s unknown user(s)', len(user_ids))
+        try:
+            response = await self._client.get_entity_by_id(
+                hangouts_pb2.GetEntityByIdRequest(
+                    request_header=self._client.get_request_header(),
+                    batch_lookup_spec=[
+                        hangouts_pb2.EntityLookupSpec(
+                            gaia_id=user_id.gaia_id,
+                            create_offnetwork_gaia=True,
+                        )
+                        for user_id in user_ids
+                    ],
+                )
+            )
+        except exceptions.NetworkError as e:
+            logger.warning('Failed to request unknown users: %s', e)
+            self._unresolved_user_ids.update(user_ids)
+            return False
+        entities = [entity for entity_result in response.entity_result
+                    for entity in entity_result.entity]
+        resolved_user_ids = set()
+        updated_users = []
+        for entity in entities:
+            user_ = User.from_entity(entity, self._self_user.id_)
+            existing = self._user_dict.get(user_.id_)
+            if existing is None:
+                self._user_dict[user_.id_] = user_
+            else:
+                existing.upgrade_name(user_)
+                user_ = existing
+            self._search_index.update(user_)
+            self._mark_updated(user_)
+            resolved_user_ids.add(user_.id_)
+            updated_users.append(user_)
+        retry_time = time.monotonic() + RESOLVE_FAILURE_TTL_SECS
+        for user_id in user_ids:
+            if user_id not in resolved_user_ids:
+                logger.info('Unknown user %s could not be found', user_id)
+                self._failed_user_ids[user_id] = retry_time
+        if updated_users:
+            await self.on_users_updated.fire(updated_users)
+        return True
+
     def _on_state_update(self, state_update):
         """Receive a StateUpdate"""
         if state_update.HasField('conversation'):